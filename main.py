@@ -5,17 +5,8 @@ import logging
 from datetime import datetime
 
 # Import functions from completepipeline.py
-from scripts.pipeline import (
-    extract_stations,
-    extract_current_trains,
-    extract_train_movements,
-    transform_stations,
-    transform_current_trains,
-    transform_train_movements,
-    load_stations,
-    load_current_trains,
-    load_train_movements
-)
+from scripts.pipeline import run_all_etl
+from scripts.analytics import delay_summary
 
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -30,31 +21,27 @@ def main():
     logger.info("Starting Irish Rail data ETL process")
     start_time = datetime.now()
     
+    # Extract, transform and load all datasets concurrently
+    stage_results = run_all_etl()
+
     # Dictionary to store results
     results = {}
     
-    # Process stations data
-    logger.info("Processing stations data")
-    raw_stations = extract_stations()
-    if not raw_stations.empty:
-        clean_stations = transform_stations(raw_stations)
+    # Stations data
+    clean_stations = stage_results.get('transform_stations')
+    if clean_stations is not None and not clean_stations.empty:
         results['stations'] = clean_stations
         logger.info(f"Extracted and transformed {len(clean_stations)} stations")
         # Print sample of stations data
         logger.info("Sample of stations data:")
         print(clean_stations.head(3))
         print("\n")
-        
-        # Load stations data into database
-        load_stations(clean_stations)
     else:
         logger.warning("No stations data extracted")
     
-    # Process current trains data
-    logger.info("Processing current trains data")
-    raw_current_trains = extract_current_trains()
-    if not raw_current_trains.empty:
-        clean_current_trains = transform_current_trains(raw_current_trains)
+    # Current trains data
+    clean_current_trains = stage_results.get('transform_current_trains')
+    if clean_current_trains is not None and not clean_current_trains.empty:
         results['current_trains'] = clean_current_trains
         logger.info(f"Extracted and transformed {len(clean_current_trains)} current trains")
         # Print sample of current trains data
@@ -64,26 +51,23 @@ def main():
         
         # Print information about the new columns
         if 'delay_minutes' in clean_current_trains.columns:
-            delayed_trains = clean_current_trains[clean_current_trains['delay_minutes'] > 0]
-            logger.info(f"Number of delayed trains: {len(delayed_trains)}")
-            if not delayed_trains.empty:
-                logger.info(f"Average delay: {delayed_trains['delay_minutes'].mean():.1f} minutes")
+            stats = delay_summary(clean_current_trains['delay_minutes'])
+            logger.info(f"Number of delayed trains: {stats['delayed']}")
+            if stats['delayed']:
+                logger.info(f"Average delay: {stats['avg_delay_when_delayed']:.1f} minutes")
+            logger.info(f"On time: {stats['on_time_pct']:.1f}%, median delay {stats['p50']:.0f} min, "
+                        f"p95 {stats['p95']:.0f} min")
         
         if 'train_category' in clean_current_trains.columns:
             logger.info("Train categories:")
             print(clean_current_trains['train_category'].value_counts())
             print("\n")
-        
-        # Load current trains data into database
-        load_current_trains(clean_current_trains)
     else:
         logger.warning("No current trains data extracted")
     
-    # Process train movements data
-    logger.info("Processing train movements data")
-    raw_train_movements = extract_train_movements()
-    if not raw_train_movements.empty:
-        clean_train_movements = transform_train_movements(raw_train_movements)
+    # Train movements data
+    clean_train_movements = stage_results.get('transform_train_movements')
+    if clean_train_movements is not None and not clean_train_movements.empty:
         results['train_movements'] = clean_train_movements
         logger.info(f"Extracted and transformed {len(clean_train_movements)} train movements")
         # Print sample of train movements data
@@ -96,9 +80,6 @@ def main():
             logger.info("Route classifications:")
             print(clean_train_movements['route_classification'].value_counts())
             print("\n")
-        
-        # Load train movements data into database
-        load_train_movements(clean_train_movements)
     else:
         logger.warning("No train movements data extracted")
     
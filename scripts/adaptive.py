@@ -0,0 +1,253 @@
+# scripts/adaptive.py
+# Adaptive polling of current trains: poll often when the network is busy, back off when it is quiet
+#
+# After every poll the next interval is chosen from how many trains are running
+# and how many of them changed state since the last poll. It moves on a log
+# scale between MIN_INTERVAL at peak and MAX_INTERVAL overnight, and never
+# spends more than POLL_BUDGET_PER_HOUR API requests in any rolling hour.
+# Every decision is stored in polling_runs with the freshness it achieved.
+# Run from the 5-minute workflow the policy can only skip ticks; intervals
+# down to MIN_INTERVAL need the long-running loop (schedule trains-adaptive-loop).
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from .fetch_api import API_BREAKER
+from .insert import engine
+from .pipeline import run_current_trains_etl
+from .runs import claimed_run
+
+logger = logging.getLogger(__name__)
+
+# Bounds on the time between polls, in seconds
+MIN_INTERVAL = int(os.getenv('POLL_MIN_INTERVAL', 120))
+MAX_INTERVAL = int(os.getenv('POLL_MAX_INTERVAL', 1800))
+
+# The fixed schedule this replaces: current trains every 5 minutes
+FIXED_INTERVAL = 300
+
+# Most current-trains requests allowed in any rolling hour; by default no more than the fixed schedule made
+POLL_BUDGET_PER_HOUR = int(os.getenv('POLL_BUDGET_PER_HOUR', 3600 // FIXED_INTERVAL))
+
+# Activity that counts as full peak
+PEAK_TRAINS = 80
+PEAK_CHANGE_RATE = 16  # train state changes per minute across the network
+
+SCHEMA_SQL = '''
+    CREATE TABLE IF NOT EXISTS polling_runs (
+        run_at            timestamp NOT NULL,
+        dataset           text      NOT NULL,
+        trains            integer,
+        state_changes     integer,
+        change_rate       real,
+        activity          real,
+        interval_seconds  integer   NOT NULL,
+        freshness_seconds real,
+        requests_last_hour integer,
+        next_run_at       timestamp NOT NULL
+    )
+'''
+
+# Ledger job of a poll, shared with the cron-driven ticks so both never poll in the same slot
+ADAPTIVE_JOB = "Current Trains (adaptive)"
+
+# Trip points are only written for trains whose state changed
+STATE_CHANGES_SQL = 'SELECT count(*) FROM trip_points WHERE observed_at >= :since'
+
+_SCHEMA_READY = False
+
+
+def ensure_polling_schema():
+    """Create the polling log table if it does not exist."""
+    global _SCHEMA_READY
+    if _SCHEMA_READY:
+        return
+    with engine.begin() as conn:
+        conn.execute(text(SCHEMA_SQL))
+    _SCHEMA_READY = True
+
+
+### Policy ###
+
+def activity_level(trains, change_rate):
+    """Network activity between 0 (idle) and 1 (peak)"""
+    return min(1.0, max(trains / PEAK_TRAINS, change_rate / PEAK_CHANGE_RATE, 0.0))
+
+
+def choose_interval(trains, change_rate, recent_runs, now, budget=POLL_BUDGET_PER_HOUR,
+                    min_interval=MIN_INTERVAL, max_interval=MAX_INTERVAL):
+    """
+    Seconds until the next poll.
+
+    Args:
+        trains (int): Trains running in the snapshot just loaded.
+        change_rate (float): Train state changes per minute since the last poll.
+        recent_runs (list): Times of the polls in the last hour, including this one.
+        now (datetime): Time of this poll.
+
+    Returns:
+        int: Interval in seconds.
+    """
+    activity = activity_level(trains, change_rate)
+    # log scale, so quiet periods back off quickly and busy ones tighten gradually
+    interval = max_interval * (min_interval / max_interval) ** activity
+
+    # hold off until the oldest poll in the window leaves the rolling hour
+    recent = sorted(run for run in recent_runs if run > now - timedelta(hours=1))
+    if len(recent) >= budget:
+        oldest = recent[len(recent) - budget]
+        interval = max(interval, (oldest + timedelta(hours=1) - now).total_seconds())
+
+    return int(round(min(max(interval, min_interval), max_interval)))
+
+
+### State ###
+
+def last_run(conn, dataset='current_trains'):
+    row = conn.execute(text('''
+        SELECT run_at, next_run_at FROM polling_runs
+        WHERE dataset = :dataset ORDER BY run_at DESC LIMIT 1
+    '''), {'dataset': dataset}).fetchone()
+    return (row[0], row[1]) if row else (None, None)
+
+
+def recent_runs(conn, now, dataset='current_trains'):
+    rows = conn.execute(text('''
+        SELECT run_at FROM polling_runs
+        WHERE dataset = :dataset AND run_at > :since
+    '''), {'dataset': dataset, 'since': now - timedelta(hours=1)}).fetchall()
+    return [row[0] for row in rows]
+
+
+def state_changes_since(conn, since):
+    # no trip points recorded yet; checked first, as a failed query would abort the transaction
+    if conn.execute(text("SELECT to_regclass('trip_points')")).scalar() is None:
+        return 0
+    try:
+        with conn.begin_nested():
+            return conn.execute(text(STATE_CHANGES_SQL), {'since': since}).scalar() or 0
+    except SQLAlchemyError as e:
+        logger.warning(f"Could not count trip state changes: {e}")
+        return 0
+
+
+### Run ###
+
+# Poll current trains if the policy says it is time
+def run_adaptive_current_trains(force=False):
+    """
+    Run the current trains ETL when the previously chosen interval has passed,
+    then choose and record the next interval.
+
+    Returns:
+        dict | None: The recorded decision, or None when it was not time to poll.
+    """
+    ensure_polling_schema()
+    now = datetime.now()
+    with engine.connect() as conn:
+        previous_at, next_at = last_run(conn)
+    if not force and next_at is not None and now < next_at:
+        logger.info(f"Current trains not due until {next_at:%H:%M:%S} - skipping")
+        return None
+
+    df = run_current_trains_etl()
+    trains = 0 if df is None else len(df)
+    if trains == 0 and API_BREAKER.state != 'closed':
+        # an empty snapshot from an unreachable API says nothing about activity,
+        # so leave the schedule alone and try again on the next tick
+        logger.warning("API circuit open - not recording this poll")
+        return None
+
+    with engine.begin() as conn:
+        elapsed = (now - previous_at).total_seconds() if previous_at else None
+        # points written by this poll are the changes since the previous snapshot
+        changes = state_changes_since(conn, now) if previous_at else 0
+        change_rate = changes / (elapsed / 60) if elapsed else 0.0
+        runs = recent_runs(conn, now) + [now]
+        interval = choose_interval(trains, change_rate, runs, now)
+
+        decision = {
+            'run_at': now,
+            'dataset': 'current_trains',
+            'trains': trains,
+            'state_changes': changes,
+            'change_rate': change_rate,
+            'activity': activity_level(trains, change_rate),
+            'interval_seconds': interval,
+            # how old the previous snapshot was when it was replaced
+            'freshness_seconds': elapsed,
+            'requests_last_hour': len(runs),
+            'next_run_at': now + timedelta(seconds=interval),
+        }
+        conn.execute(text('''
+            INSERT INTO polling_runs (run_at, dataset, trains, state_changes, change_rate, activity,
+                                      interval_seconds, freshness_seconds, requests_last_hour, next_run_at)
+            VALUES (:run_at, :dataset, :trains, :state_changes, :change_rate, :activity,
+                    :interval_seconds, :freshness_seconds, :requests_last_hour, :next_run_at)
+        '''), decision)
+
+    logger.info(f"{trains} trains, {change_rate:.1f} state changes/min -> next poll in {interval}s "
+                f"({len(runs)}/{POLL_BUDGET_PER_HOUR} requests this hour)")
+    return decision
+
+
+# Long-running poller for a host that is not cron driven
+def run_adaptive_loop():
+    """
+    Poll current trains forever, sleeping the chosen interval between polls.
+    Each poll takes the current_trains lock and a ledger slot like a cron run,
+    and is skipped while another process holds them.
+    """
+    while True:
+        decision = None
+        try:
+            with claimed_run(ADAPTIVE_JOB, ['current_trains'], 1) as run:
+                if run is not None:
+                    API_BREAKER.reset()
+                    decision = run_adaptive_current_trains(force=True)
+                    run.finish('degraded' if API_BREAKER.degraded else 'succeeded')
+        except Exception as e:
+            logger.error(f"Adaptive poll failed: {e}")
+        time.sleep(decision['interval_seconds'] if decision else MIN_INTERVAL)
+
+
+### Simulation ###
+
+# Rough weekday profile of running trains per hour of day
+WEEKDAY_TRAINS = [2, 0, 0, 0, 0, 5, 30, 75, 85, 60, 40, 38, 38, 40, 42, 50, 70, 85, 80, 55,
+                  40, 30, 20, 8]
+
+
+def simulate(profile=WEEKDAY_TRAINS, fixed_interval=FIXED_INTERVAL, busy_hours=(7, 8, 16, 17, 18)):
+    """
+    Compare the fixed 5-minute schedule with the adaptive policy over one day,
+    assuming every running train changes state about every five minutes.
+    Returns a DataFrame of requests per day and mean data age at peak.
+    """
+    results = []
+    for label in ['fixed', 'adaptive']:
+        t = datetime(2025, 1, 6)
+        end = t + timedelta(days=1)
+        runs, ages = [], []
+        while t < end:
+            trains = profile[t.hour]
+            runs.append(t)
+            if label == 'fixed':
+                interval = fixed_interval
+            else:
+                interval = choose_interval(trains, trains * 0.2, runs, t)
+            if t.hour in busy_hours:
+                ages.append(interval / 2)
+            t += timedelta(seconds=interval)
+        results.append({'policy': label, 'requests_per_day': len(runs),
+                        'peak_mean_age_seconds': sum(ages) / len(ages) if ages else None})
+    return pd.DataFrame(results)
+
+
+if __name__ == '__main__':
+    print(simulate().to_string(index=False))
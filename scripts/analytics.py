@@ -0,0 +1,195 @@
+# scripts/analytics.py
+# Punctuality buckets and delay statistics shared by the ETL, main.py and the dashboard
+import time
+
+import numpy as np
+import pandas as pd
+
+# Upper bound (inclusive, minutes) of every bucket but the last
+DELAY_BUCKET_EDGES = (5, 15, 30)
+DELAY_BUCKET_LABELS = ('On Time', 'Minor Delay', 'Major Delay', 'Severe Delay')
+DELAY_BUCKET_COLOURS = {
+    'On Time': '#28a745',
+    'Minor Delay': '#ffc107',
+    'Major Delay': '#fd7e14',
+    'Severe Delay': '#dc3545'
+}
+# folium marker colour per bucket
+DELAY_BUCKET_MAP_COLOURS = ('green', 'orange', 'red', 'red')
+
+ON_TIME_MAX = DELAY_BUCKET_EDGES[0]
+SEVERE_MIN = DELAY_BUCKET_EDGES[-1]
+
+
+def _as_delays(delays):
+    """Delays as a float array with missing values treated as on time"""
+    values = pd.to_numeric(pd.Series(delays), errors='coerce').to_numpy(dtype=float)
+    return np.nan_to_num(values, nan=0.0)
+
+
+### Buckets ###
+
+def bucket_delays(delays):
+    """
+    Bucket index per delay: 0 on time, 1 minor, 2 major, 3 severe.
+    """
+    return np.digitize(_as_delays(delays), DELAY_BUCKET_EDGES, right=True)
+
+
+def bucket_labels(delays):
+    """
+    Punctuality label per delay, e.g. 12 -> 'Minor Delay'.
+    """
+    return np.asarray(DELAY_BUCKET_LABELS, dtype=object)[bucket_delays(delays)]
+
+
+def bucket_map_colours(delays):
+    """
+    Map marker colour per delay.
+    """
+    return np.asarray(DELAY_BUCKET_MAP_COLOURS, dtype=object)[bucket_delays(delays)]
+
+
+def bucket_distribution(delays):
+    """
+    Count of delays in each bucket as a DataFrame with delay_category and count.
+    """
+    counts = np.bincount(bucket_delays(delays), minlength=len(DELAY_BUCKET_LABELS))
+    return pd.DataFrame({'delay_category': DELAY_BUCKET_LABELS, 'count': counts})
+
+
+def delay_case_sql(column='"delay_minutes"'):
+    """
+    SQL CASE expression mapping a delay column to the same bucket labels.
+    """
+    whens = [f"WHEN COALESCE({column}, 0) <= {edge} THEN '{label}'"
+             for edge, label in zip(DELAY_BUCKET_EDGES, DELAY_BUCKET_LABELS)]
+    return f"CASE {' '.join(whens)} ELSE '{DELAY_BUCKET_LABELS[-1]}' END"
+
+
+def bucket_count_sql(column='delay_minutes'):
+    """
+    SQL aggregates counting rows per bucket, in bucket order.
+    """
+    bounds = (None,) + DELAY_BUCKET_EDGES + (None,)
+    counts = []
+    for lower, upper in zip(bounds[:-1], bounds[1:]):
+        if lower is None:
+            counts.append(f"COUNT(*) FILTER (WHERE COALESCE({column}, 0) <= {upper})")
+        elif upper is None:
+            counts.append(f"COUNT(*) FILTER (WHERE {column} > {lower})")
+        else:
+            counts.append(f"COUNT(*) FILTER (WHERE {column} > {lower} AND {column} <= {upper})")
+    return counts
+
+
+### Statistics ###
+
+def delay_summary(delays, quantiles=(0.5, 0.9, 0.95)):
+    """
+    Summary statistics for a set of delays in minutes.
+
+    Returns:
+        dict: count, mean, max, quantiles (p50/p90/p95), on-time %, delayed
+        count and average delay, severely delayed count.
+    """
+    values = _as_delays(delays)
+    if values.size == 0:
+        return {'count': 0}
+
+    delayed = values[values > 0]
+    summary = {
+        'count': int(values.size),
+        'mean': float(values.mean()),
+        'max': float(values.max()),
+        'on_time_pct': float((values <= ON_TIME_MAX).mean() * 100),
+        'delayed': int(delayed.size),
+        'avg_delay_when_delayed': float(delayed.mean()) if delayed.size else 0.0,
+        'severely_delayed': int((values > SEVERE_MIN).sum()),
+    }
+    for q, value in zip(quantiles, np.quantile(values, quantiles)):
+        summary[f'p{int(round(q * 100))}'] = float(value)
+    return summary
+
+
+def summary_from_rollup(rollup):
+    """
+    The same headline statistics from delay_hourly/delay_daily rows, where each
+    row holds observations, delay_sum, delay_max and the bucket counts.
+    """
+    if rollup.empty:
+        return {'count': 0}
+
+    observations = int(rollup['observations'].sum())
+    counts = rollup[['on_time', 'minor', 'major', 'severe']].sum().to_numpy()
+    return {
+        'count': observations,
+        'mean': float(rollup['delay_sum'].sum() / observations) if observations else 0.0,
+        'max': float(rollup['delay_max'].max()),
+        'on_time_pct': float(counts[0] / observations * 100) if observations else 0.0,
+        'severely_delayed': int(counts[3]),
+        'distribution': dict(zip(DELAY_BUCKET_LABELS, counts.astype(int).tolist())),
+    }
+
+
+def rolling_mean(values, window):
+    """
+    Mean of the last `window` values at every position (shorter at the start).
+    """
+    values = _as_delays(values)
+    sums = np.cumsum(np.insert(values, 0, 0.0))
+    ends = np.arange(1, values.size + 1)
+    starts = np.maximum(ends - window, 0)
+    return (sums[ends] - sums[starts]) / (ends - starts)
+
+
+def rolling_average(times, values, window='1h'):
+    """
+    Time-window rolling mean: for every observation, the mean of all values in
+    the preceding window (inclusive). Times must be sorted.
+    """
+    times = np.asarray(times, dtype='datetime64[ns]')
+    values = _as_delays(values)
+    sums = np.cumsum(np.insert(values, 0, 0.0))
+    starts = np.searchsorted(times, times - pd.Timedelta(window).to_timedelta64(), side='left')
+    ends = np.arange(1, values.size + 1)
+    return (sums[ends] - sums[starts]) / (ends - starts)
+
+
+### Benchmark ###
+
+def benchmark(n=1_000_000, seed=0):
+    """
+    Compare digitize bucketing with the old per-row Series.apply on n delays.
+    """
+    rng = np.random.default_rng(seed)
+    delays = pd.Series(rng.exponential(6, n).round())
+
+    def punctuality(delay):
+        if delay <= 5: return 'On Time'
+        elif delay <= 15: return 'Minor Delay'
+        elif delay <= 30: return 'Major Delay'
+        else: return 'Severe Delay'
+
+    start = time.perf_counter()
+    old = delays.apply(punctuality)
+    apply_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    new = bucket_labels(delays)
+    digitize_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    summary = delay_summary(delays)
+    summary_seconds = time.perf_counter() - start
+
+    assert (old.to_numpy() == new).all()
+    print(f"{n:,} delays")
+    print(f"  Series.apply buckets: {apply_seconds * 1000:8.1f} ms")
+    print(f"  np.digitize buckets:  {digitize_seconds * 1000:8.1f} ms ({apply_seconds / digitize_seconds:.0f}x)")
+    print(f"  delay_summary:        {summary_seconds * 1000:8.1f} ms")
+    return {'apply': apply_seconds, 'digitize': digitize_seconds, 'summary': summary_seconds}
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,182 @@
+# scripts/backfill.py
+# Historical backfill of train movements with resumable checkpoints
+#
+# Usage:
+#   python -m scripts.backfill --start 2025-09-01 --end 2025-09-07 --source snapshots
+#   python -m scripts.backfill --start 2025-09-01 --end 2025-09-07 --source history --workers 8 --rate 4
+import argparse
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+import pandas as pd
+from sqlalchemy import text
+
+from .fetch_api import RateLimiter
+from .pipeline import fetch_train_movements, transform_and_validate
+from .parallel_transform import transform_train_movements_auto
+from .insert import engine, load_tables
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHECKPOINT = 'backfill_checkpoint.jsonl'
+
+# Where the train codes to backfill come from
+TRAIN_CODE_QUERIES = {
+    # last current_trains snapshot kept for each past day
+    'snapshots': 'SELECT DISTINCT "TrainCode", "TrainDate" FROM current_trains '
+                 'WHERE "TrainDate" BETWEEN :start AND :end ORDER BY "TrainDate", "TrainCode"',
+    # trains we already hold (possibly partial) movements for
+    'history'  : 'SELECT DISTINCT "TrainCode", "TrainDate" FROM train_movements '
+                 'WHERE "TrainDate" BETWEEN :start AND :end ORDER BY "TrainDate", "TrainCode"',
+}
+
+
+### Train codes ###
+
+def get_backfill_trains(source, start, end):
+    """
+    Get the (TrainCode, TrainDate) pairs to backfill for a date range.
+    """
+    if source not in TRAIN_CODE_QUERIES:
+        raise ValueError(f"Unknown train code source: {source}")
+
+    with engine.connect() as conn:
+        df = pd.read_sql(text(TRAIN_CODE_QUERIES[source]), conn, params={'start': start, 'end': end})
+
+    df['TrainCode'] = df['TrainCode'].astype(str).str.strip()
+    df['TrainDate'] = pd.to_datetime(df['TrainDate']).dt.date
+    logger.info(f"Found {len(df)} trains to backfill from {source} between {start} and {end}")
+    return df
+
+
+### Checkpoints ###
+
+def checkpoint_key(train_code, train_date):
+    """Key used to record a finished train in the checkpoint file"""
+    return f"{train_code}|{train_date.isoformat()}"
+
+
+def load_checkpoint(path):
+    """
+    Read the set of trains already backfilled from the checkpoint file.
+    """
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                done.add(json.loads(line)['key'])
+    logger.info(f"Resuming from checkpoint {path}: {len(done)} trains already done")
+    return done
+
+
+def append_checkpoint(path, keys):
+    """
+    Record finished trains. Only called once their movements are in the database.
+    """
+    with open(path, 'a') as f:
+        for key in keys:
+            f.write(json.dumps({'key': key, 'at': datetime.now().isoformat()}) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+
+
+### Backfill ###
+
+def _flush(frames, keys, checkpoint_path):
+    """Transform and bulk load a batch, then checkpoint it."""
+    rows = 0
+    if frames:
+        df = transform_and_validate(transform_train_movements_auto, pd.concat(frames, ignore_index=True),
+                                    'train_movements')
+        rows = load_tables({'train_movements': df}).get('train_movements', {}).get('rows', 0)
+    append_checkpoint(checkpoint_path, keys)
+    frames.clear()
+    keys.clear()
+    return rows
+
+
+def run_backfill(start, end, source='snapshots', workers=4, rate=2.0, batch_size=50,
+                 checkpoint_path=DEFAULT_CHECKPOINT):
+    """
+    Fetch getTrainMovementsXML for every train in the date range and upsert the results.
+
+    Requests run on a thread pool but are spaced by a shared rate limiter.
+    Every batch_size trains are transformed, bulk upserted and written to the
+    checkpoint file, so an interrupted run picks up where it stopped.
+
+    Returns:
+        dict: Counts of trains fetched, failed, skipped and rows loaded.
+    """
+    trains = get_backfill_trains(source, start, end)
+    done = load_checkpoint(checkpoint_path)
+
+    todo = [(row.TrainCode, row.TrainDate) for row in trains.itertuples()
+            if checkpoint_key(row.TrainCode, row.TrainDate) not in done]
+    stats = {'trains': len(todo), 'skipped': len(trains) - len(todo), 'failed': 0, 'rows': 0}
+    logger.info(f"Backfilling {len(todo)} trains ({stats['skipped']} already done) "
+                f"with {workers} workers at {rate} req/s")
+
+    limiter = RateLimiter(rate)
+    begin = time.perf_counter()
+
+    def fetch(train_code, train_date):
+        limiter.acquire()
+        return fetch_train_movements(train_code, train_date)
+
+    frames, keys = [], []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(fetch, code, date): (code, date) for code, date in todo}
+        for completed, future in enumerate(as_completed(futures), start=1):
+            train_code, train_date = futures.pop(future)
+            try:
+                df = future.result()
+                if not df.empty:
+                    frames.append(df)
+                keys.append(checkpoint_key(train_code, train_date))
+            except Exception as e:
+                # not checkpointed, so it is retried on the next run
+                stats['failed'] += 1
+                logger.warning(f"Failed to get movements for {train_code} on {train_date}: {e}")
+
+            if len(keys) >= batch_size:
+                stats['rows'] += _flush(frames, keys, checkpoint_path)
+                logger.info(f"Backfill progress: {completed}/{len(todo)} trains, {stats['rows']} rows")
+
+    stats['rows'] += _flush(frames, keys, checkpoint_path)
+
+    duration = time.perf_counter() - begin
+    logger.info(f"Backfill finished in {duration:.1f}s: {stats}")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill Irish Rail train movements for past dates")
+    parser.add_argument('--start', required=True, help="First date to backfill (YYYY-MM-DD)")
+    parser.add_argument('--end', required=True, help="Last date to backfill (YYYY-MM-DD)")
+    parser.add_argument('--source', choices=sorted(TRAIN_CODE_QUERIES), default='snapshots',
+                        help="Where to read the train codes from")
+    parser.add_argument('--workers', type=int, default=4, help="Concurrent API requests")
+    parser.add_argument('--rate', type=float, default=2.0, help="Maximum API requests per second")
+    parser.add_argument('--batch-size', type=int, default=50, help="Trains per load and checkpoint")
+    parser.add_argument('--checkpoint', default=DEFAULT_CHECKPOINT, help="Checkpoint file path")
+    args = parser.parse_args()
+
+    start = datetime.strptime(args.start, '%Y-%m-%d').date()
+    end = datetime.strptime(args.end, '%Y-%m-%d').date()
+    if end < start:
+        parser.error("--end must not be before --start")
+
+    run_backfill(start, end, source=args.source, workers=args.workers, rate=args.rate,
+                 batch_size=args.batch_size, checkpoint_path=args.checkpoint)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 # Clean data from the Irish Rail API
 from datetime import datetime
+import numpy as np
 import pandas as pd
 
 
@@ -18,12 +19,12 @@ def object_to_date(df, columns):
 
 
 # convert object type to time
-def object_to_time(df, columns):
+def object_to_time(df, columns, time_format='%H:%M:%S'):
     """
     Convert object columns to Python time objects.
     """
     for col in columns:
-        df[col] = pd.to_datetime(df[col], format='%H:%M:%S', errors='coerce').dt.time
+        df[col] = pd.to_datetime(df[col], format=time_format, errors='coerce').dt.time
         df[col] = df[col].where(df[col].notna(), None)
     return df
 
@@ -122,6 +123,39 @@ def remove_duplicates(df, subset_columns):
     return df.drop_duplicates(subset=subset_columns)
 
 
+# keep one row per composite key, the freshest one
+def dedupe_keys(df, key_columns, fresh_column=None):
+    """
+    Keep one row per composite key, hashing the key columns into a single
+    64-bit value instead of comparing them column by column. When several rows
+    share a key the one with the latest fresh_column wins (ties and missing
+    timestamps fall back to the later row). Row order is otherwise kept.
+
+    Returns:
+        tuple: (deduplicated DataFrame, number of rows dropped)
+    """
+    if len(df) < 2:
+        return df, 0
+
+    keys = pd.util.hash_pandas_object(df[key_columns], index=False).to_numpy()
+    if fresh_column is not None and fresh_column in df.columns:
+        # NaT becomes the smallest int64, so rows without a timestamp lose
+        fresh = pd.to_datetime(df[fresh_column], errors='coerce').to_numpy(dtype='datetime64[ns]').view(np.int64)
+        order = np.lexsort((np.arange(len(df)), fresh, keys))
+    else:
+        order = np.argsort(keys, kind='stable')
+
+    # the last row of each run of equal hashes is the freshest copy
+    sorted_keys = keys[order]
+    last = np.append(sorted_keys[1:] != sorted_keys[:-1], True)
+    keep = np.sort(order[last])
+
+    dropped = len(df) - len(keep)
+    if not dropped:
+        return df, 0
+    return df.iloc[keep], dropped
+
+
 # replace NaT/NaN with None
 def clean_nat(df):
     """
@@ -20,20 +20,28 @@ DB_CONFIG = {
     'DBNAME': DBNAME
 }
 
-# connectivity test 
-try:
-    conn = psycopg2.connect(
-        user=USER,
-        password=PASSWORD,
-        host=HOST,
-        port=PORT,
-        dbname=DBNAME
-    )
-    cursor = conn.cursor()
-    cursor.execute("SELECT NOW();")
-    result = cursor.fetchone()
-    print("Connected. Current Time:", result)
-    cursor.close()
-    conn.close()
-except Exception as e:
-    print("Error connecting to the database:", e)
+# connectivity test, run on demand (python -m scripts.conn) rather than on import,
+# so processes that never touch the database, e.g. transform workers, do not connect
+def check_connection():
+    try:
+        conn = psycopg2.connect(
+            user=USER,
+            password=PASSWORD,
+            host=HOST,
+            port=PORT,
+            dbname=DBNAME
+        )
+        cursor = conn.cursor()
+        cursor.execute("SELECT NOW();")
+        result = cursor.fetchone()
+        print("Connected. Current Time:", result)
+        cursor.close()
+        conn.close()
+        return True
+    except Exception as e:
+        print("Error connecting to the database:", e)
+        return False
+
+
+if __name__ == '__main__':
+    check_connection()
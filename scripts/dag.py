@@ -0,0 +1,111 @@
+# scripts/dag.py
+# Run pipeline stages as a dependency graph so independent branches overlap
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+logger = logging.getLogger(__name__)
+
+
+# Check the stage graph before running it
+def validate_dag(stages):
+    """
+    Make sure every dependency exists and the graph has no cycles.
+
+    Args:
+        stages (dict): Stage name -> (function, [dependency names]).
+    """
+    for name, (_, deps) in stages.items():
+        for dep in deps:
+            if dep not in stages:
+                raise ValueError(f"Stage '{name}' depends on unknown stage '{dep}'")
+
+    visiting, done = set(), set()
+
+    def visit(name):
+        if name in done:
+            return
+        if name in visiting:
+            raise ValueError(f"Cycle detected at stage '{name}'")
+        visiting.add(name)
+        for dep in stages[name][1]:
+            visit(dep)
+        visiting.discard(name)
+        done.add(name)
+
+    for name in stages:
+        visit(name)
+
+
+# Run the stage graph on a thread pool
+def run_dag(stages, max_workers=None):
+    """
+    Run stages as soon as their dependencies have finished.
+
+    Each stage function is called with the results of its dependencies,
+    in the order they are listed. A stage whose dependency failed is skipped.
+
+    Args:
+        stages (dict): Stage name -> (function, [dependency names]).
+        max_workers (int): Thread pool size, defaults to the number of stages.
+
+    Returns:
+        tuple: (results dict, timings dict in seconds, errors dict)
+    """
+    validate_dag(stages)
+
+    results, timings, errors = {}, {}, {}
+    pending = dict(stages)
+    running = {}
+    start = time.perf_counter()
+
+    def timed(name, func, args):
+        node_start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            timings[name] = time.perf_counter() - node_start
+
+    with ThreadPoolExecutor(max_workers=max_workers or len(stages) or 1) as pool:
+        while pending or running:
+            # Skip stages whose dependencies failed or were skipped
+            for name, (_, deps) in list(pending.items()):
+                if any(dep in errors for dep in deps):
+                    errors[name] = RuntimeError("skipped: upstream stage failed")
+                    logger.warning(f"Skipping stage '{name}' because an upstream stage failed")
+                    del pending[name]
+
+            # Submit every stage whose dependencies are all done
+            for name, (func, deps) in list(pending.items()):
+                if all(dep in results for dep in deps):
+                    args = [results[dep] for dep in deps]
+                    running[pool.submit(timed, name, func, args)] = name
+                    del pending[name]
+
+            if not running:
+                break
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                try:
+                    results[name] = future.result()
+                    logger.info(f"Stage '{name}' finished in {timings[name]:.2f}s")
+                except Exception as e:
+                    errors[name] = e
+                    logger.error(f"Stage '{name}' failed after {timings.get(name, 0):.2f}s: {e}")
+
+    wall_time = time.perf_counter() - start
+    log_timings(timings, wall_time)
+    return results, timings, errors
+
+
+# Print a timing summary for a DAG run
+def log_timings(timings, wall_time):
+    """
+    Log per-stage timings next to the total wall time of the run.
+    """
+    logger.info("Stage timings:")
+    for name, seconds in sorted(timings.items(), key=lambda item: item[1], reverse=True):
+        logger.info(f"  {name:<28} {seconds:7.2f}s")
+    logger.info(f"DAG wall time {wall_time:.2f}s (sum of stages {sum(timings.values()):.2f}s)")
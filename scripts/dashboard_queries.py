@@ -0,0 +1,105 @@
+# scripts/dashboard_queries.py
+# SQL behind the Streamlit dashboard, kept apart from the UI so it can be load tested and tuned
+#
+# Each function takes a SQLAlchemy engine and returns a DataFrame. streamlit.py
+# wraps them in st.cache_data; scripts/loadtest.py runs them directly. Every
+# statement starts with a /* dashboard:name */ comment, so it can be picked out
+# in pg_stat_statements and pg_stat_activity.
+import pandas as pd
+from sqlalchemy import text
+
+from .analytics import DELAY_BUCKET_LABELS, ON_TIME_MAX, SEVERE_MIN, delay_case_sql
+
+KPIS_SQL = f"""
+    /* dashboard:kpis */
+    SELECT
+        ROUND(AVG(CASE WHEN "delay_minutes" <= {ON_TIME_MAX} THEN 1 ELSE 0 END) * 100, 1) AS on_time_pct,
+        ROUND(AVG("delay_minutes"::numeric), 1) AS avg_delay,
+        COUNT(*) AS total_trains,
+        SUM(CASE WHEN "TrainStatus" = 'Cancelled' THEN 1 ELSE 0 END) AS cancelled,
+        MAX("enhanced_at") AS last_update,
+        COUNT(*) FILTER (WHERE "delay_minutes" > {SEVERE_MIN}) AS severely_delayed,
+        ROUND(AVG(CASE WHEN "delay_minutes" > 0 THEN "delay_minutes" END), 1) AS avg_delay_when_delayed
+    FROM "current_trains"
+    WHERE "TrainDate" = CURRENT_DATE;
+"""
+
+LIVE_TRAINS_SQL = """
+    /* dashboard:live_trains */
+    SELECT
+        ct."TrainCode", ct."Direction", ct."TrainStatus",
+        ct."TrainLatitude", ct."TrainLongitude", ct."delay_minutes",
+        ct."current_location", ct."train_type", ct."PublicMessage",
+        tm."TrainOrigin", tm."TrainDestination"
+    FROM "current_trains" ct
+    LEFT JOIN (
+        SELECT DISTINCT ON ("TrainCode", "TrainDate") "TrainCode", "TrainDate", "TrainOrigin", "TrainDestination"
+        FROM "train_movements"
+        ORDER BY "TrainCode", "TrainDate", "LocationOrder"
+    ) tm ON ct."TrainCode" = tm."TrainCode" AND ct."TrainDate" = tm."TrainDate"
+    WHERE ct."TrainDate" = CURRENT_DATE
+    AND ct."TrainLatitude" IS NOT NULL AND ct."TrainLongitude" IS NOT NULL
+    ORDER BY ct."enhanced_at" DESC;
+"""
+
+STATIONS_SQL = """
+    /* dashboard:stations */
+    SELECT "StationDesc","StationCode","StationType","StationLatitude","StationLongitude"
+    FROM "stations"
+    WHERE "StationLatitude" IS NOT NULL AND "StationLongitude" IS NOT NULL
+    ORDER BY "StationType", "StationDesc";
+"""
+
+_BUCKET_ORDER = ' '.join(f"WHEN '{label}' THEN {i}" for i, label in enumerate(DELAY_BUCKET_LABELS, start=1))
+
+DELAY_DISTRIBUTION_SQL = f"""
+    /* dashboard:delay_distribution */
+    SELECT delay_category, COUNT(*) as count FROM (
+        SELECT {delay_case_sql('"delay_minutes"')} as delay_category
+        FROM "current_trains"
+        WHERE "TrainDate" = CURRENT_DATE
+    ) categorized
+    GROUP BY delay_category
+    ORDER BY CASE delay_category {_BUCKET_ORDER} END;
+"""
+
+
+def _read(engine, sql):
+    with engine.connect() as conn:
+        return pd.read_sql(text(sql), conn)
+
+
+def get_kpis(engine):
+    """Today's punctuality KPIs from current trains"""
+    return _read(engine, KPIS_SQL)
+
+
+def get_live_trains(engine):
+    """Today's positioned trains with their origin and destination"""
+    return _read(engine, LIVE_TRAINS_SQL)
+
+
+def get_stations(engine):
+    """Stations with coordinates, for the map"""
+    return _read(engine, STATIONS_SQL)
+
+
+def get_delay_distribution(engine):
+    """Today's trains per delay bucket, in bucket order"""
+    return _read(engine, DELAY_DISTRIBUTION_SQL)
+
+
+# Every query a dashboard page load runs, by name
+DASHBOARD_QUERIES = {
+    'kpis': get_kpis,
+    'live_trains': get_live_trains,
+    'stations': get_stations,
+    'delay_distribution': get_delay_distribution,
+}
+
+DASHBOARD_SQL = {
+    'kpis': KPIS_SQL,
+    'live_trains': LIVE_TRAINS_SQL,
+    'stations': STATIONS_SQL,
+    'delay_distribution': DELAY_DISTRIBUTION_SQL,
+}
@@ -0,0 +1,94 @@
+# scripts/delay_queries.py
+# Query helpers over the delay time-series tables, returning NumPy arrays
+import pandas as pd
+from sqlalchemy import text
+
+from .insert import engine
+
+ROLLUP_TABLES = {
+    'hour': 'delay_hourly',
+    'day': 'delay_daily'
+}
+
+
+def _read(query, params):
+    with engine.connect() as conn:
+        return pd.read_sql(text(query), conn, params=params)
+
+
+# Delay trajectory of one train
+def train_delay_trajectory(train_code, train_date):
+    """
+    Delay of a train over the day, e.g. train_delay_trajectory('A105', date.today()).
+
+    Returns:
+        tuple: (observed_at datetime64 array, delay_minutes float array, station array)
+    """
+    df = _read('''
+        SELECT observed_at, delay_minutes, station
+        FROM delay_observations
+        WHERE "TrainCode" = :train_code AND "TrainDate" = :train_date
+        ORDER BY observed_at
+    ''', {'train_code': train_code, 'train_date': train_date})
+
+    return (df['observed_at'].to_numpy(dtype='datetime64[ns]'),
+            df['delay_minutes'].to_numpy(dtype=float),
+            df['station'].to_numpy(dtype=object))
+
+
+# Delay series at one station from the rollups
+def station_delay_series(station, start, end, resolution='hour'):
+    """
+    Mean delay at a station per hour or day between start and end (inclusive),
+    e.g. station_delay_series('Dundalk', monday, sunday, 'day').
+
+    Returns:
+        tuple: (bucket datetime64 array, mean delay float array, observation count int array)
+    """
+    table = ROLLUP_TABLES[resolution]
+    df = _read(f'''
+        SELECT bucket, delay_sum::float / NULLIF(observations, 0) AS mean_delay, observations
+        FROM {table}
+        WHERE station = :station AND bucket BETWEEN :start AND :end
+        ORDER BY bucket
+    ''', {'station': station, 'start': start, 'end': end})
+
+    return (pd.to_datetime(df['bucket']).to_numpy(dtype='datetime64[ns]'),
+            df['mean_delay'].to_numpy(dtype=float),
+            df['observations'].to_numpy(dtype=int))
+
+
+# Network wide delay series from the rollups
+def network_delay_series(start, end, resolution='hour'):
+    """
+    Mean delay across all stations per hour or day between start and end (inclusive).
+
+    Returns:
+        tuple: (bucket datetime64 array, mean delay float array, observation count int array)
+    """
+    table = ROLLUP_TABLES[resolution]
+    df = _read(f'''
+        SELECT bucket, SUM(delay_sum)::float / NULLIF(SUM(observations), 0) AS mean_delay,
+               SUM(observations) AS observations
+        FROM {table}
+        WHERE bucket BETWEEN :start AND :end
+        GROUP BY bucket
+        ORDER BY bucket
+    ''', {'start': start, 'end': end})
+
+    return (pd.to_datetime(df['bucket']).to_numpy(dtype='datetime64[ns]'),
+            df['mean_delay'].to_numpy(dtype=float),
+            df['observations'].to_numpy(dtype=int))
+
+
+# Raw rollup rows for one station
+def station_rollup(station, start, end, resolution='hour'):
+    """
+    Rollup rows (observations, delay sum/max and bucket counts) for a station as a DataFrame.
+    """
+    table = ROLLUP_TABLES[resolution]
+    return _read(f'''
+        SELECT * FROM {table}
+        WHERE station = :station AND bucket BETWEEN :start AND :end
+        ORDER BY bucket
+    ''', {'station': station, 'start': start, 'end': end})
@@ -0,0 +1,192 @@
+# scripts/export.py
+# Partitioned Parquet export of loaded data, so downstream readers stay off the database
+#
+# Layout under EXPORT_DIR (hive partitioning, one directory per day):
+#
+#   current_trains/date=2025-06-01/snapshot=083000.parquet   every loaded snapshot
+#   train_movements/date=2025-05-31/movements.parquet        each finished day
+#   manifest.json                                            every file with rows and key ranges
+#
+# Files are sorted by their keys and carry column statistics, so readers that
+# filter on TrainCode or a date only touch the row groups and partitions they
+# need. Each run only writes what is new: the snapshot it just loaded, any
+# finished day not yet in the manifest, and any exported day with rows fetched
+# after it was written.
+import json
+import logging
+import os
+import threading
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+from sqlalchemy import text
+
+from .insert import engine
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional, export is skipped without it
+    pa = pq = None
+
+logger = logging.getLogger(__name__)
+
+# Export is off unless a directory is configured
+EXPORT_DIR = os.getenv('EXPORT_DIR')
+
+# How far back finished movement days are looked for when they are missing from the manifest
+EXPORT_LOOKBACK_DAYS = int(os.getenv('EXPORT_LOOKBACK_DAYS', 7))
+
+# Days a TrainDate is left alone after it ends; overnight trains keep being
+# upserted under yesterday's date after midnight
+EXPORT_SETTLE_DAYS = 1
+
+# Sort order of each dataset, also recorded as the files' sorting columns
+SORT_KEYS = {
+    'current_trains': ['TrainCode'],
+    'train_movements': ['TrainCode', 'LocationOrder'],
+}
+
+ROW_GROUP_SIZE = 50000
+
+MANIFEST = 'manifest.json'
+
+_MANIFEST_LOCK = threading.Lock()
+
+
+def export_enabled():
+    return bool(EXPORT_DIR) and pq is not None
+
+
+### Manifest ###
+
+def read_manifest(directory=None):
+    """The manifest as {'datasets': {dataset: {day: [file entries]}}}"""
+    path = os.path.join(directory or EXPORT_DIR, MANIFEST)
+    if not os.path.exists(path):
+        return {'datasets': {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _add_to_manifest(directory, dataset, day, entry):
+    """Record a written file, replacing any earlier entry for the same path or for an empty day"""
+    with _MANIFEST_LOCK:
+        manifest = read_manifest(directory)
+        files = manifest['datasets'].setdefault(dataset, {}).setdefault(day, [])
+        files[:] = [f for f in files if f['path'] not in (entry['path'], None)] + [entry]
+        manifest['updated_at'] = datetime.now().isoformat(timespec='seconds')
+        os.makedirs(directory, exist_ok=True)
+        tmp = os.path.join(directory, MANIFEST + '.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+        os.replace(tmp, os.path.join(directory, MANIFEST))
+
+
+### Writing ###
+
+def write_partition(df, dataset, day, filename, directory=None, extra=None):
+    """
+    Write one sorted Parquet file into the dataset's date partition and add it
+    to the manifest, with any extra fields. Returns the manifest entry.
+    """
+    directory = directory or EXPORT_DIR
+    keys = [key for key in SORT_KEYS[dataset] if key in df.columns]
+    df = df.sort_values(keys, kind='stable').reset_index(drop=True)
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    relative = os.path.join(dataset, f'date={day}', filename)
+    path = os.path.join(directory, relative)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    # write beside the target and rename, so readers never see half a file
+    tmp = path + '.tmp'
+    pq.write_table(table, tmp, compression='zstd', row_group_size=ROW_GROUP_SIZE, write_statistics=True,
+                   sorting_columns=[pq.SortingColumn(table.schema.get_field_index(key)) for key in keys])
+    os.replace(tmp, path)
+
+    entry = {'path': relative, 'rows': len(df), 'bytes': os.path.getsize(path),
+             'sorted_by': keys,
+             'written_at': datetime.now().isoformat(timespec='seconds')}
+    if keys and len(df):
+        entry['min_key'] = str(df[keys[0]].iloc[0])
+        entry['max_key'] = str(df[keys[0]].iloc[-1])
+    entry.update(extra or {})
+    _add_to_manifest(directory, dataset, day, entry)
+    return entry
+
+
+# Export the snapshot that was just loaded
+def export_current_trains(df, directory=None):
+    """Write a loaded current trains snapshot as its own file in today's partition."""
+    if df.empty or not export_enabled():
+        return None
+    collected = pd.Timestamp(df['collected_at'].max()) if 'collected_at' in df.columns else pd.Timestamp.now()
+    entry = write_partition(df, 'current_trains', collected.date().isoformat(),
+                            f'snapshot={collected:%H%M%S}.parquet', directory)
+    logger.info(f"Exported {entry['rows']} current trains to {entry['path']}")
+    return entry
+
+
+# Export finished movement days that are not exported yet
+def export_movement_days(today=None, directory=None):
+    """
+    Write each finished day of train movements (ended at least
+    EXPORT_SETTLE_DAYS ago, within EXPORT_LOOKBACK_DAYS) that the manifest
+    does not have yet, or that has rows fetched after its file was written.
+    """
+    if not export_enabled():
+        return []
+    directory = directory or EXPORT_DIR
+    today = today or date.today()
+    done = read_manifest(directory)['datasets'].get('train_movements', {})
+
+    days = [today - timedelta(days=n) for n in range(EXPORT_LOOKBACK_DAYS, EXPORT_SETTLE_DAYS, -1)]
+    if not days:
+        return []
+    with engine.connect() as conn:
+        rows = conn.execute(text('''
+            SELECT "TrainDate", MAX(fetched_at) FROM train_movements
+            WHERE "TrainDate" BETWEEN :first AND :last GROUP BY "TrainDate"
+        '''), {'first': days[0], 'last': days[-1]}).fetchall()
+    latest = {pd.Timestamp(train_date).date(): fetched for train_date, fetched in rows}
+
+    entries = []
+    for day in days:
+        files = done.get(day.isoformat())
+        fetched = latest.get(day)
+        exported_to = files[-1].get('fetched_to') if files else None
+        if files and (fetched is None or (exported_to and pd.Timestamp(exported_to) >= pd.Timestamp(fetched))):
+            continue
+        if fetched is None:
+            df = pd.DataFrame()
+        else:
+            with engine.connect() as conn:
+                df = pd.read_sql(text('SELECT * FROM train_movements WHERE "TrainDate" = :day'), conn,
+                                 params={'day': day})
+        if df.empty:
+            # recorded without a file, so it is not queried again and readers
+            # never meet a partition whose columns have no types
+            entry = {'path': None, 'rows': 0, 'written_at': datetime.now().isoformat(timespec='seconds')}
+            _add_to_manifest(directory, 'train_movements', day.isoformat(), entry)
+            entries.append(entry)
+            continue
+        entry = write_partition(df, 'train_movements', day.isoformat(), 'movements.parquet', directory,
+                                extra={'fetched_to': pd.Timestamp(fetched).isoformat()})
+        logger.info(f"{'Re-exported' if files else 'Exported'} {entry['rows']} train movements for {day}")
+        entries.append(entry)
+    return entries
+
+
+### Reading ###
+
+def read_export(dataset, columns=None, filters=None, directory=None):
+    """
+    Read an exported dataset with only the given columns. pyarrow filters
+    (e.g. [('date', '>=', '2025-06-01'), ('TrainCode', '=', 'E109')]) prune
+    date partitions and row groups before any data is read.
+    """
+    if pq is None:
+        raise ImportError("Reading the Parquet export needs the pyarrow package (pip install pyarrow)")
+    path = os.path.join(directory or EXPORT_DIR, dataset)
+    return pq.read_table(path, columns=columns, filters=filters, partitioning='hive').to_pandas()
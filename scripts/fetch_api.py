@@ -1,11 +1,145 @@
 # fetch_api.py
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+import numpy as np
 import requests
 import xml.etree.ElementTree as ET
 
+logger = logging.getLogger(__name__)
+
+# (connect, read) timeout in seconds for every API request
+REQUEST_TIMEOUT = (float(os.getenv('API_CONNECT_TIMEOUT', 5)), float(os.getenv('API_READ_TIMEOUT', 20)))
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the API while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Thread-safe circuit breaker for the API.
+
+    Closed: requests go through. It opens after `failure_threshold` failures in
+    a row, or when the `latency_percentile` of the last `window` request times
+    goes over `latency_threshold` seconds.
+    Open: requests fail at once with CircuitOpenError for `reset_timeout` seconds.
+    Half-open: one probe request is let through; success closes the circuit,
+    failure opens it again.
+    """
+
+    def __init__(self, failure_threshold=5, latency_threshold=8.0, latency_percentile=90,
+                 window=20, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.latency_threshold = latency_threshold
+        self.latency_percentile = latency_percentile
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=window)
+        self.reset()
+
+    def reset(self):
+        """Close the circuit and forget history, e.g. at the start of a run."""
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+            self.trips = 0
+            self.rejected = 0
+            self.last_reason = None
+            self._opened_at = None
+            self._probing = False
+            self._latencies.clear()
+
+    @property
+    def degraded(self):
+        """True if the circuit opened at any point since the last reset."""
+        return self.trips > 0
+
+    def before_request(self):
+        """Raise CircuitOpenError unless a request may go to the API now."""
+        with self._lock:
+            if self.state == 'open':
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    self.rejected += 1
+                    raise CircuitOpenError(f"API circuit open: {self.last_reason}")
+                self.state = 'half_open'
+            if self.state == 'half_open':
+                if self._probing:
+                    self.rejected += 1
+                    raise CircuitOpenError(f"API circuit half-open, probe in flight: {self.last_reason}")
+                self._probing = True
 
-def fetch_from_api(url):
+    def record_success(self, seconds):
+        with self._lock:
+            self._probing = False
+            self.failures = 0
+            self._latencies.append(seconds)
+            if self.state == 'half_open':
+                self.state = 'closed'
+                self._latencies.clear()
+                logger.info("API circuit closed after a successful probe")
+                return
+            if len(self._latencies) >= self._latencies.maxlen // 2:
+                slow = np.percentile(self._latencies, self.latency_percentile)
+                if slow > self.latency_threshold:
+                    self._open(f"p{self.latency_percentile} latency {slow:.1f}s over {self.latency_threshold:.1f}s")
+
+    def record_failure(self, error):
+        with self._lock:
+            self._probing = False
+            self.failures += 1
+            if self.state == 'half_open':
+                self._open(f"probe failed: {error}")
+            elif self.failures >= self.failure_threshold:
+                self._open(f"{self.failures} failures in a row, last: {error}")
+
+    def _open(self, reason):
+        self.state = 'open'
+        self.trips += 1
+        self.last_reason = reason
+        self._opened_at = time.monotonic()
+        logger.warning(f"API circuit opened ({reason}), failing fast for {self.reset_timeout:.0f}s")
+
+
+# Shared by every fetch in the process
+API_BREAKER = CircuitBreaker()
+
+
+def fetch_from_api(url, timeout=REQUEST_TIMEOUT, breaker=API_BREAKER):
     """Fetch raw XML root from API URL."""
-    response = requests.get(url)
-    if response.status_code != 200:
-        raise Exception(f"Failed to fetch API data: {response.status_code}")
-    return ET.fromstring(response.text)
\ No newline at end of file
+    breaker.before_request()
+    start = time.perf_counter()
+    try:
+        response = requests.get(url, timeout=timeout)
+        if response.status_code != 200:
+            raise Exception(f"Failed to fetch API data: {response.status_code}")
+        root = ET.fromstring(response.text)
+    except Exception as e:
+        breaker.record_failure(e)
+        raise
+    breaker.record_success(time.perf_counter() - start)
+    return root
+
+
+class RateLimiter:
+    """
+    Thread-safe limiter that spaces out API calls to at most `rate` per second.
+    Share one instance between worker threads.
+    """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate and rate > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = time.monotonic()
+
+    def acquire(self):
+        """Block until the caller is allowed to make the next request."""
+        with self._lock:
+            now = time.monotonic()
+            wait_for = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if wait_for > 0:
+            time.sleep(wait_for)
@@ -0,0 +1,184 @@
+# scripts/geo.py
+# Vectorised geometry on train positions: distances, speeds and progress between stops
+#
+# Everything works on whole frames with NumPy, so a snapshot of every active
+# train costs a handful of array operations rather than a Python loop per row.
+import logging
+import time
+
+import numpy as np
+import pandas as pd
+
+from .station_registry import REGISTRY_DTYPE, StationRegistry, get_station_registry
+
+logger = logging.getLogger(__name__)
+
+# Mean Earth radius (IUGG)
+EARTH_RADIUS_KM = 6371.0088
+
+# Faster than any train in Ireland; a bigger jump between two positions is a GPS glitch
+MAX_SPEED_KMH = 200.0
+
+# Closer than this to both stops, the segment is too short to say where the train is
+MIN_SEGMENT_KM = 0.05
+
+TRIP_KEY = ['TrainCode', 'TrainDate']
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km between arrays of points given in degrees."""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(a, dtype=float)) for a in (lat1, lon1, lat2, lon2))
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+### Speed ###
+
+def speeds_kmh(distance_km, elapsed_seconds):
+    """km/h from distances and elapsed times; NaN without a later time or above MAX_SPEED_KMH."""
+    distance_km, elapsed_seconds = np.asarray(distance_km, dtype=float), np.asarray(elapsed_seconds, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        speed = np.where(elapsed_seconds > 0, distance_km / elapsed_seconds * 3600, np.nan)
+    speed[speed > MAX_SPEED_KMH] = np.nan
+    return speed
+
+
+def track_speeds(points, time_column='observed_at'):
+    """
+    Distance, time and speed from each observation to the previous one of the
+    same train.
+
+    Args:
+        points (DataFrame): TrainCode, TrainDate, TrainLatitude, TrainLongitude
+            and time_column, in any order.
+
+    Returns:
+        DataFrame: distance_km, elapsed_seconds and speed_kmh on the points'
+        index. NaN for a train's first point, for points without a position or
+        a later time, and for speeds over MAX_SPEED_KMH.
+    """
+    n = len(points)
+    if n == 0:
+        return pd.DataFrame(index=points.index, columns=['distance_km', 'elapsed_seconds', 'speed_kmh'], dtype=float)
+
+    times = pd.to_datetime(points[time_column], errors='coerce').to_numpy(dtype='datetime64[ns]')
+    lat = pd.to_numeric(points['TrainLatitude'], errors='coerce').to_numpy(dtype=float)
+    lon = pd.to_numeric(points['TrainLongitude'], errors='coerce').to_numpy(dtype=float)
+    trip, _ = pd.MultiIndex.from_frame(points[TRIP_KEY].astype(str)).factorize()
+
+    # by train, then time; each point's predecessor is the one before it in this order
+    order = np.lexsort((times, trip))
+    same_trip = np.zeros(n, dtype=bool)
+    same_trip[1:] = trip[order][1:] == trip[order][:-1]
+    prev = np.roll(order, 1)
+
+    distance = np.full(n, np.nan)
+    elapsed = np.full(n, np.nan)
+    distance[order] = np.where(same_trip, haversine_km(lat[prev], lon[prev], lat[order], lon[order]), np.nan)
+    elapsed[order] = np.where(same_trip, (times[order] - times[prev]) / np.timedelta64(1, 's'), np.nan)
+
+    return pd.DataFrame({'distance_km': distance, 'elapsed_seconds': elapsed,
+                         'speed_kmh': speeds_kmh(distance, elapsed)},
+                        index=points.index)
+
+
+### Progress ###
+
+def segment_progress(lat, lon, from_lat, from_lon, to_lat, to_lon):
+    """
+    How far along the straight line from one stop to the next each position
+    is, between 0 (at the previous stop) and 1 (at the next), and the km left.
+
+    Positions are projected onto the segment in a local flat approximation,
+    which is accurate to well under 1% over the length of a rail segment.
+    """
+    lat, lon, from_lat, from_lon, to_lat, to_lon = (
+        np.asarray(a, dtype=float) for a in (lat, lon, from_lat, from_lon, to_lat, to_lon))
+    # degrees of longitude shrink with latitude
+    scale = np.cos(np.radians((from_lat + to_lat) / 2))
+    seg_x, seg_y = (to_lon - from_lon) * scale, to_lat - from_lat
+    pos_x, pos_y = (lon - from_lon) * scale, lat - from_lat
+
+    length_sq = seg_x ** 2 + seg_y ** 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fraction = np.clip((pos_x * seg_x + pos_y * seg_y) / length_sq, 0.0, 1.0)
+
+    too_short = haversine_km(from_lat, from_lon, to_lat, to_lon) < MIN_SEGMENT_KM
+    fraction = np.where(too_short, np.nan, fraction)
+    remaining = haversine_km(lat, lon, to_lat, to_lon)
+    return fraction, np.where(np.isnan(fraction), np.nan, remaining)
+
+
+def progress_between_stops(df, registry, from_column='current_location', to_column='next_stop'):
+    """
+    Progress of each train from the stop it last departed towards its next
+    stop, as fraction_to_next_stop (0-1) and km_to_next_stop, with stop names
+    resolved through a StationRegistry. NaN where either stop is unknown or
+    has no coordinates.
+    """
+    from_lat, from_lon = registry.coordinates(df[from_column])
+    to_lat, to_lon = registry.coordinates(df[to_column])
+    fraction, remaining = segment_progress(
+        pd.to_numeric(df['TrainLatitude'], errors='coerce'), pd.to_numeric(df['TrainLongitude'], errors='coerce'),
+        from_lat, from_lon, to_lat, to_lon)
+    return pd.DataFrame({'fraction_to_next_stop': fraction, 'km_to_next_stop': remaining}, index=df.index)
+
+
+_NO_STATIONS = None
+
+
+# Station coordinates, from the station registry
+def get_station_coordinates():
+    """The station registry, or an empty one when there is none, so progress is NaN."""
+    global _NO_STATIONS
+    registry = get_station_registry()
+    if registry is not None:
+        return registry
+    if _NO_STATIONS is None:
+        logger.warning("No station coordinates, progress between stops is skipped")
+        _NO_STATIONS = StationRegistry(np.empty(0, dtype=REGISTRY_DTYPE))
+    return _NO_STATIONS
+
+
+### Benchmark ###
+
+def benchmark(trains=200, snapshots=288):
+    """
+    Time speeds and progress for a day of 5-minute snapshots of every active
+    train, as one frame and per snapshot.
+    """
+    rng = np.random.default_rng(0)
+    n = trains * snapshots
+    start_times = pd.Timestamp('2025-06-02 05:00')
+    points = pd.DataFrame({
+        'TrainCode': np.repeat([f'E{i:03d}' for i in range(trains)], snapshots),
+        'TrainDate': '2025-06-02',
+        'observed_at': start_times + pd.to_timedelta(np.tile(np.arange(snapshots) * 300, trains), unit='s'),
+        'TrainLatitude': 53.3 + rng.normal(0, 0.002, n).cumsum() % 1.0,
+        'TrainLongitude': -6.3 + rng.normal(0, 0.003, n).cumsum() % 2.0,
+    })
+    stations = pd.DataFrame({'StationDesc': ['Bray', 'Howth'], 'StationLatitude': [53.2, 53.38],
+                             'StationLongitude': [-6.1, -6.07]})
+    points['current_location'], points['next_stop'] = 'Bray', 'Howth'
+    registry = StationRegistry.from_stations(stations.assign(StationCode=['BRAY', 'HOWTH']))
+
+    start = time.perf_counter()
+    track_speeds(points)
+    progress_between_stops(points, registry)
+    day_seconds = time.perf_counter() - start
+
+    snapshot = points.iloc[:trains]
+    start = time.perf_counter()
+    for _ in range(20):
+        segment_progress(snapshot['TrainLatitude'], snapshot['TrainLongitude'], 53.2, -6.1, 53.38, -6.07)
+        speeds_kmh(haversine_km(snapshot['TrainLatitude'], snapshot['TrainLongitude'], 53.3, -6.3), 300)
+    snapshot_seconds = (time.perf_counter() - start) / 20
+
+    print(f"{n} points ({trains} trains x {snapshots} snapshots): {day_seconds * 1000:.1f}ms, "
+          f"{n / day_seconds:,.0f} points/s; one snapshot of {trains} trains: {snapshot_seconds * 1000:.2f}ms")
+
+
+if __name__ == '__main__':
+    import sys
+    benchmark(*(int(arg) for arg in sys.argv[1:3]))
@@ -1,9 +1,13 @@
 # scripts/helper_functions.py 
 # Helper functions for data processing and enhancement
+import numpy as np
 import pandas as pd
-import re
 from datetime import datetime
 
+from .memo import UniqueMemo
+from .messages import parse_messages
+from .station_registry import match_keywords
+
 def extract_delay_from_message(message):
     """
     Extract delay minutes from PublicMessage
@@ -12,15 +16,8 @@ def extract_delay_from_message(message):
     if pd.isna(message) or message == "":
         return 0
     
-    # Look for pattern like "(5 mins late)" or "(-3 mins late)"
-    delay_pattern = r'\(([+-]?\d+) mins late\)'
-    match = re.search(delay_pattern, str(message))
-    
-    if match:
-        return int(match.group(1))
-    
-    # If no delay found, assume on time
-    return 0
+    # No delay in the message means on time
+    return int(parse_messages([message])['delay_minutes'].iloc[0])
 
 def extract_current_location(message):
     """
@@ -30,21 +27,8 @@ def extract_current_location(message):
     if pd.isna(message) or message == "":
         return None
     
-    message_str = str(message)
-    
-    # Look for "Departed X next stop Y"
-    departed_pattern = r'Departed ([^n]+) next stop'
-    departed_match = re.search(departed_pattern, message_str)
-    if departed_match:
-        return departed_match.group(1).strip()
-    
-    # Look for "Arrived X next stop Y" or "Arrived X"
-    arrived_pattern = r'Arrived ([^n]+?)(?:\s+next stop|$)'
-    arrived_match = re.search(arrived_pattern, message_str)
-    if arrived_match:
-        return arrived_match.group(1).strip()
-    
-    return None
+    # Departed X / Arrived X / TERMINATED X
+    return parse_messages([message])['current_location'].iloc[0]
 
 def get_train_category(train_code):
     """
@@ -56,33 +40,35 @@ def get_train_category(train_code):
     
     return str(train_code)[0] if len(str(train_code)) > 0 else "N/A"
 
+# Dublin area services
+DUBLIN_KEYWORDS = ['DUBLIN', 'CONNOLLY', 'HEUSTON', 'PEARSE']
+MAJOR_CITY_KEYWORDS = ['CORK', 'GALWAY', 'LIMERICK', 'WATERFORD', 'BELFAST', 'SLIGO']
+
+def classify_routes(routes):
+    """
+    Classify (origin, destination) pairs, with station names resolved through
+    the station registry
+    """
+    origins = pd.Series([origin for origin, _ in routes], dtype=object)
+    destinations = pd.Series([destination for _, destination in routes], dtype=object)
+
+    has_dublin = match_keywords(origins, DUBLIN_KEYWORDS) | match_keywords(destinations, DUBLIN_KEYWORDS)
+    # Check if it's intercity (Dublin to major city)
+    has_major_city = match_keywords(origins, MAJOR_CITY_KEYWORDS) | match_keywords(destinations, MAJOR_CITY_KEYWORDS)
+
+    # Non-Dublin routes are Regional
+    types = np.select([has_dublin & has_major_city, has_dublin], ["Intercity", "Dublin_Commuter"], default="Regional")
+    missing = (origins.isna() | destinations.isna()).to_numpy(dtype=bool)
+    return list(np.where(missing, "Unknown", types))
+
 def classify_route(origin, destination):
     """
     Classify route type based on origin and destination
     """
-    if pd.isna(origin) or pd.isna(destination):
-        return "Unknown"
-    
-    origin_str = str(origin).upper()
-    destination_str = str(destination).upper()
-    
-    # Dublin area services
-    dublin_keywords = ['DUBLIN', 'CONNOLLY', 'HEUSTON', 'PEARSE']
-    has_dublin_origin = any(keyword in origin_str for keyword in dublin_keywords)
-    has_dublin_dest = any(keyword in destination_str for keyword in dublin_keywords)
-    
-    if has_dublin_origin or has_dublin_dest:
-        # Check if it's intercity (Dublin to major city)
-        major_cities = ['CORK', 'GALWAY', 'LIMERICK', 'WATERFORD', 'BELFAST', 'SLIGO']
-        has_major_city = any(city in origin_str or city in destination_str for city in major_cities)
-        
-        if has_major_city:
-            return "Intercity"
-        else:
-            return "Dublin_Commuter"
-    
-    # Non-Dublin routes
-    return "Regional"
+    return classify_routes([(origin, destination)])[0]
+
+_CATEGORY_MEMO = UniqueMemo('train_category', get_train_category)
+_ROUTE_MEMO = UniqueMemo('route_classification', classify_routes, batch=True)
 
 def add_extra_fields(df):
     """
@@ -95,19 +81,20 @@ def add_extra_fields(df):
     updated_df= df.copy()
     
     # Add delay information if it exists
+    # One pass over the message gives the delay, location and service type hint
     if 'PublicMessage' in updated_df.columns:
-       updated_df['delay_minutes'] =updated_df['PublicMessage'].apply(extract_delay_from_message)
-       updated_df['current_location'] =updated_df['PublicMessage'].apply(extract_current_location)
+       parsed = parse_messages(updated_df['PublicMessage'])
+       updated_df['delay_minutes'] = parsed['delay_minutes']
+       updated_df['current_location'] = parsed['current_location']
+       updated_df['message_type'] = parsed['service_hint']
     
     # Add train category if TrainCode exists
     if 'TrainCode' in updated_df.columns:
-       updated_df['train_category'] =updated_df['TrainCode'].apply(get_train_category)
+       updated_df['train_category'] = _CATEGORY_MEMO.apply(updated_df['TrainCode'])
     
     # Add route classification if origin/destination exists
     if 'TrainOrigin' in updated_df.columns and 'TrainDestination' in updated_df.columns:
-       updated_df['route_classification'] =updated_df.apply(
-            lambda row: classify_route(row['TrainOrigin'], row['TrainDestination']), axis=1
-        )
+       updated_df['route_classification'] = _ROUTE_MEMO.apply(updated_df['TrainOrigin'], updated_df['TrainDestination'])
     
     # Add collection timestamp
     updated_df['enhanced_at'] = pd.Timestamp.now()
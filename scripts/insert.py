@@ -16,103 +16,168 @@
 #        print(f"Error inserting data into {table_name}: {e}")
 
 # Insert data into the database
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.engine import URL
 from datetime import datetime
 from scripts.conn import DB_CONFIG
 import pandas as pd
+import io
+import time
 
-engine = create_engine(f"postgresql://{DB_CONFIG['USER']}:{DB_CONFIG['PASSWORD']}@{DB_CONFIG['HOST']}:{DB_CONFIG['PORT']}/{DB_CONFIG['DBNAME']}")
+# built from parts so a missing config only fails on first connect, not on import
+# (local loader backends run without any Postgres settings)
+engine = create_engine(URL.create(
+    'postgresql',
+    username=DB_CONFIG['USER'],
+    password=DB_CONFIG['PASSWORD'],
+    host=DB_CONFIG['HOST'],
+    port=int(DB_CONFIG['PORT']) if DB_CONFIG['PORT'] else None,
+    database=DB_CONFIG['DBNAME']
+))
 
-def insert_data(df, table_name):
+# Primary key of the train_movements table
+TRAIN_MOVEMENTS_PK = ['TrainCode', 'TrainDate', 'LocationOrder']
+
+# Rows per COPY buffer, keeps memory flat on large frames
+COPY_CHUNKSIZE = 50000
+COPY_NULL = '\\N'
+
+# Order tables are written in one transaction; stations last, so the
+# exclusive lock of its swap is held for the shortest time
+LOAD_ORDER = ['station_boards', 'current_trains', 'train_movements', 'stations']
+
+
+def _ensure_table(conn, df, table_name, keys=None):
+    """Create a missing table with the column types pandas infers from the frame"""
+    if not inspect(conn).has_table(table_name):
+        conn.execute(text(pd.io.sql.get_schema(df, table_name, keys=keys, con=conn)))
+
+
+def _copy_frame(conn, df, table_name):
     """
-    Insert data into the specified table in the database with duplicate handling
-    that preserves historical data.
+    Stream a frame into an existing table with COPY, COPY_CHUNKSIZE rows per buffer.
     """
-    try:
-        if table_name == 'stations':
-            # For stations, replace all data since it changes rarely
-            df.to_sql(table_name, con=engine, index=False, if_exists='replace')
-            print(f"Replaced {len(df)} records in {table_name} successfully.")
-            
-        elif table_name == 'current_trains':
-            # For current trains, we want the latest snapshot, so replace today's data
-            today = datetime.now().date()
-            
-            with engine.connect() as conn:
-                delete_query = text('DELETE FROM current_trains WHERE "TrainDate" = :today')
-                result = conn.execute(delete_query, {"today": today})
-                deleted_count = result.rowcount
-                
-                if deleted_count > 0:
-                    print(f"Deleted {deleted_count} existing current train records for {today}")
-                
-                df.to_sql(table_name, con=conn, index=False, if_exists='append', method='multi')
-                conn.commit()
-                
-            print(f"Successfully loaded {len(df)} current train records")
-            
-        elif table_name == 'train_movements':
-            # For train movements, use UPSERT to preserve historical data
-            # but update records if they already exist
-            _upsert_train_movements(df)
-            
-        else:
-            # For other tables append
-            df.to_sql(table_name, con=engine, index=False, if_exists='append')
-            print(f"Data inserted into {table_name} successfully.")
+    columns = ', '.join(f'"{col}"' for col in df.columns)
+    copy_sql = f"COPY \"{table_name}\" ({columns}) FROM STDIN WITH (FORMAT csv, NULL '{COPY_NULL}')"
 
-    except Exception as e:
-        print(f"Error inserting data into {table_name}: {e}")
-        raise
+    with conn.connection.cursor() as cur:
+        for start in range(0, len(df), COPY_CHUNKSIZE):
+            buffer = io.StringIO()
+            # an explicit NULL marker keeps empty strings apart from missing values
+            df.iloc[start:start + COPY_CHUNKSIZE].to_csv(buffer, header=False, index=False, na_rep=COPY_NULL)
+            buffer.seek(0)
+            cur.copy_expert(copy_sql, buffer)
+
+
+def _swap_stations(conn, df):
+    """
+    Write stations to a staging table and rename it into place, so readers
+    see either the old or the new stations and never an empty table.
+    """
+    conn.execute(text('DROP TABLE IF EXISTS stations_staging'))
+    _ensure_table(conn, df, 'stations_staging')
+    _copy_frame(conn, df, 'stations_staging')
+    conn.execute(text('DROP TABLE IF EXISTS stations_old'))
+    conn.execute(text('ALTER TABLE IF EXISTS stations RENAME TO stations_old'))
+    conn.execute(text('ALTER TABLE stations_staging RENAME TO stations'))
+    conn.execute(text('DROP TABLE IF EXISTS stations_old'))
+
+
+def _replace_current_trains(conn, df):
+    """Replace today's snapshot of current trains"""
+    _ensure_table(conn, df, 'current_trains')
+    today = datetime.now().date()
+    result = conn.execute(text('DELETE FROM current_trains WHERE "TrainDate" = :today'), {"today": today})
+    if result.rowcount > 0:
+        print(f"Deleted {result.rowcount} existing current train records for {today}")
+    _copy_frame(conn, df, 'current_trains')
 
-def _upsert_train_movements(df):
+
+def _merge_train_movements(conn, df):
     """
-    Alternative UPSERT using individual record processing.
-    Slower but more reliable for data type issues.
+    UPSERT train movements: COPY into a temporary table, then one
+    INSERT ... SELECT ... ON CONFLICT into train_movements.
     """
-    if df.empty:
-        return
-        
+    df = df.copy()
+    # integer columns must not reach COPY as '1.0'
+    for col in ['LocationOrder', 'delay_minutes']:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype('Int64')
+
+    columns = ', '.join(f'"{col}"' for col in df.columns)
+    update_cols = [col for col in df.columns if col not in TRAIN_MOVEMENTS_PK]
+    set_clause = ', '.join(f'"{col}" = EXCLUDED."{col}"' for col in update_cols)
+    pk = ', '.join(f'"{col}"' for col in TRAIN_MOVEMENTS_PK)
+
+    _ensure_table(conn, df, 'train_movements', keys=TRAIN_MOVEMENTS_PK)
+    conn.execute(text('CREATE TEMP TABLE train_movements_batch '
+                      '(LIKE train_movements INCLUDING DEFAULTS) ON COMMIT DROP'))
+    _copy_frame(conn, df, 'train_movements_batch')
+    conn.execute(text(f'''
+        INSERT INTO train_movements ({columns})
+        SELECT {columns} FROM train_movements_batch
+        ON CONFLICT ({pk}) DO UPDATE SET {set_clause}
+    '''))
+
+
+def _append_rows(conn, df, table_name):
+    _ensure_table(conn, df, table_name)
+    _copy_frame(conn, df, table_name)
+
+
+TABLE_WRITERS = {
+    'stations': _swap_stations,
+    'current_trains': _replace_current_trains,
+    'train_movements': _merge_train_movements,
+}
+
+
+def load_tables(frames):
+    """
+    Load coordinator: write several tables on one pooled connection in a single
+    transaction, so either every table is updated or none is.
+
+    Args:
+        frames (dict): table name -> DataFrame
+
+    Returns:
+        dict: table name -> {'rows', 'seconds', 'rows_per_sec'}
+    """
+    stats = {}
+    ordered = sorted(frames, key=lambda name: LOAD_ORDER.index(name) if name in LOAD_ORDER else -1)
     try:
-        with engine.connect() as conn:
-            upserted_count = 0
-            
-            for _, row in df.iterrows():
-                # Convert row to dict and handle data types
-                record = row.to_dict()
-                
-                # Ensure proper types
-                if 'LocationOrder' in record:
-                    record['LocationOrder'] = int(float(record['LocationOrder'])) if pd.notna(record['LocationOrder']) else 1
-                if 'delay_minutes' in record:
-                    record['delay_minutes'] = int(float(record['delay_minutes'])) if pd.notna(record['delay_minutes']) else None
-                
-                # Build column lists
-                columns = list(record.keys())
-                placeholders = [f':{col}' for col in columns]
-                
-                primary_key_cols = ['TrainCode', 'TrainDate', 'LocationOrder']
-                update_cols = [col for col in columns if col not in primary_key_cols]
-                set_clause = ', '.join([f'"{col}" = EXCLUDED."{col}"' for col in update_cols])
-                
-                # Individual UPSERT query
-                query = text(f'''
-                    INSERT INTO train_movements ({', '.join([f'"{col}"' for col in columns])})
-                    VALUES ({', '.join(placeholders)})
-                    ON CONFLICT ("TrainCode", "TrainDate", "LocationOrder")
-                    DO UPDATE SET {set_clause}
-                ''')
-                
-                conn.execute(query, record)
-                upserted_count += 1
-            
-            conn.commit()
-            print(f"Successfully upserted {upserted_count} train movement records")
-            
+        with engine.begin() as conn:
+            for table_name in ordered:
+                df = frames[table_name]
+                if df is None or df.empty:
+                    continue
+                start = time.perf_counter()
+                if table_name in TABLE_WRITERS:
+                    TABLE_WRITERS[table_name](conn, df)
+                else:
+                    _append_rows(conn, df, table_name)
+                seconds = time.perf_counter() - start
+                stats[table_name] = {'rows': len(df), 'seconds': seconds,
+                                     'rows_per_sec': len(df) / seconds if seconds else float('inf')}
     except Exception as e:
-        print(f"Failed to upsert train movements: {e}")
+        print(f"Error loading {', '.join(ordered)}, nothing was committed: {e}")
         raise
 
+    for table_name, stat in stats.items():
+        print(f"Loaded {stat['rows']} rows into {table_name} in {stat['seconds']:.2f}s "
+              f"({stat['rows_per_sec']:,.0f} rows/s)")
+    return stats
+
+
+def insert_data(df, table_name):
+    """
+    Insert data into the specified table in the database with duplicate handling
+    that preserves historical data.
+    """
+    # stations are swapped in atomically, today's current trains replaced,
+    # movements upserted to keep history, anything else appended with COPY
+    return load_tables({table_name: df})
+
 
 # Only insert truly new records
 #def _insert_only_new_movements(df):
@@ -0,0 +1,375 @@
+# scripts/loaders.py
+# Load backends: the Postgres database, or a local SQLite/DuckDB file for offline runs
+#
+# Every backend loads the four tables with the same semantics as insert_data:
+#   stations        - replace the whole table
+#   current_trains  - replace today's snapshot
+#   train_movements - upsert on (TrainCode, TrainDate, LocationOrder)
+#   station_boards  - append
+# Pick one with LOAD_BACKEND=postgres|sqlite|duckdb (and LOAD_PATH for the local file).
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import Counter
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from .insert import engine, insert_data, load_tables, TRAIN_MOVEMENTS_PK
+
+try:
+    import duckdb
+except ImportError:  # optional, only needed for LOAD_BACKEND=duckdb
+    duckdb = None
+
+logger = logging.getLogger(__name__)
+
+LOAD_BACKEND = os.getenv('LOAD_BACKEND', 'postgres')
+
+DEFAULT_PATHS = {
+    'sqlite': 'irish_rail.sqlite',
+    'duckdb': 'irish_rail.duckdb',
+}
+
+# How each table is written
+TABLE_MODES = {
+    'stations': 'replace',
+    'current_trains': 'snapshot',
+    'train_movements': 'upsert',
+    'station_boards': 'append',
+}
+
+UPSERT_KEYS = {
+    'train_movements': TRAIN_MOVEMENTS_PK,
+}
+
+# Bound parameters per statement (SQLite allows 32766, Postgres 65535)
+MAX_PARAMS = 32000
+
+
+class Loader(ABC):
+    """
+    Base loader: dispatches each table to append, upsert or replace.
+    Subclasses implement the three write primitives and delete_date, and
+    cannot be created without them.
+    """
+    name = None
+    # delay observations, predictions, trip points and quarantine are Postgres-only
+    sidecars = False
+    # rows written per table by this process, for the run ledger
+    loaded = None
+
+    def _count(self, table_name, rows):
+        if self.loaded is None:
+            self.loaded = Counter()
+        self.loaded[table_name] += rows
+        return rows
+
+    def load(self, df, table_name):
+        """Write a transformed frame with the table's load semantics, returning rows written."""
+        if df.empty:
+            return 0
+        mode = TABLE_MODES.get(table_name, 'append')
+        if mode == 'replace':
+            self.replace(df, table_name)
+        elif mode == 'snapshot':
+            self.delete_date(table_name, datetime.now().date())
+            self.append(df, table_name)
+        elif mode == 'upsert':
+            self.upsert(df, table_name, UPSERT_KEYS[table_name])
+        else:
+            self.append(df, table_name)
+        return self._count(table_name, len(df))
+
+    def load_many(self, frames):
+        """
+        Load several tables (table name -> DataFrame), returning rows, seconds
+        and rows/sec per table.
+        """
+        stats = {}
+        for table_name, df in frames.items():
+            if df is None or df.empty:
+                continue
+            start = time.perf_counter()
+            rows = self.load(df, table_name)
+            seconds = time.perf_counter() - start
+            stats[table_name] = {'rows': rows, 'seconds': seconds,
+                                 'rows_per_sec': rows / seconds if seconds else float('inf')}
+        return stats
+
+    @abstractmethod
+    def append(self, df, table_name):
+        """Append rows to a table, creating it if needed."""
+
+    @abstractmethod
+    def upsert(self, df, table_name, keys):
+        """Insert rows, updating those whose keys already exist."""
+
+    @abstractmethod
+    def replace(self, df, table_name):
+        """Replace the whole table with the rows."""
+
+    @abstractmethod
+    def delete_date(self, table_name, train_date):
+        """Delete a day's rows from a table, if the table exists."""
+
+
+class SQLAlchemyLoader(Loader):
+    """
+    Loader over a SQLAlchemy engine, letting pandas map the column types.
+    Upserts use the dialect's INSERT ... ON CONFLICT DO UPDATE against a
+    unique index on the keys.
+    """
+    # dialect insert() construct supporting on_conflict_do_update
+    dialect_insert = None
+    # SQL expression for the date part of "TrainDate"
+    train_date_sql = 'CAST("TrainDate" AS date)'
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def _chunksize(self, df):
+        return max(1, MAX_PARAMS // max(len(df.columns), 1))
+
+    def append(self, df, table_name):
+        # executemany of one compiled INSERT; multi-row VALUES spends most of its time compiling
+        df.to_sql(table_name, con=self.engine, index=False, if_exists='append',
+                  chunksize=self._chunksize(df))
+
+    def upsert(self, df, table_name, keys):
+        dialect_insert = self.dialect_insert
+
+        def on_conflict_update(pd_table, conn, columns, data_iter):
+            stmt = dialect_insert(pd_table.table)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=keys,
+                set_={col: stmt.excluded[col] for col in columns if col not in keys}
+            )
+            conn.execute(stmt, [dict(zip(columns, row)) for row in data_iter])
+
+        key_list = ', '.join(f'"{key}"' for key in keys)
+        with self.engine.begin() as conn:
+            if not inspect(conn).has_table(table_name):
+                # first load is a plain insert; pandas needs the rows to infer column types
+                df.to_sql(table_name, con=conn, index=False, chunksize=self._chunksize(df))
+                conn.execute(text(f'CREATE UNIQUE INDEX "{table_name}_pk" ON "{table_name}" ({key_list})'))
+                return
+            conn.execute(text(f'CREATE UNIQUE INDEX IF NOT EXISTS "{table_name}_pk" ON "{table_name}" ({key_list})'))
+            df.to_sql(table_name, con=conn, index=False, if_exists='append',
+                      method=on_conflict_update, chunksize=self._chunksize(df))
+
+    def replace(self, df, table_name):
+        # DDL is transactional here, so readers never see the table missing
+        with self.engine.begin() as conn:
+            df.to_sql(table_name, con=conn, index=False, if_exists='replace',
+                      chunksize=self._chunksize(df))
+
+    def delete_date(self, table_name, train_date):
+        with self.engine.begin() as conn:
+            if inspect(conn).has_table(table_name):
+                conn.execute(text(f'DELETE FROM "{table_name}" WHERE {self.train_date_sql} = :day'),
+                             {'day': train_date})
+
+
+class PostgresLoader(SQLAlchemyLoader):
+    """The production database. Pipeline loads go through the insert.py load coordinator."""
+    name = 'postgres'
+    sidecars = True
+    dialect_insert = staticmethod(pg_insert)
+
+    def __init__(self):
+        super().__init__(engine)
+
+    def load(self, df, table_name):
+        if df.empty:
+            return 0
+        insert_data(df, table_name)
+        return self._count(table_name, len(df))
+
+    def load_many(self, frames):
+        # one connection and one transaction for every table
+        stats = load_tables(frames)
+        for table_name, stat in stats.items():
+            self._count(table_name, stat['rows'])
+        return stats
+
+
+class SQLiteLoader(SQLAlchemyLoader):
+    """Local SQLite file, needs nothing beyond the standard library."""
+    name = 'sqlite'
+    dialect_insert = staticmethod(sqlite_insert)
+    # dates are stored as ISO text
+    train_date_sql = 'date("TrainDate")'
+
+    def __init__(self, path=None):
+        self.path = path or os.getenv('LOAD_PATH', DEFAULT_PATHS['sqlite'])
+        super().__init__(create_engine(f"sqlite:///{self.path}"))
+
+    def delete_date(self, table_name, train_date):
+        super().delete_date(table_name, train_date.isoformat())
+
+
+class DuckDBLoader(Loader):
+    """
+    Local DuckDB file. Frames are registered as views and copied column-wise,
+    which is much faster than row inserts for large movement batches.
+    """
+    name = 'duckdb'
+
+    def __init__(self, path=None):
+        if duckdb is None:
+            raise ImportError("LOAD_BACKEND=duckdb needs the duckdb package (pip install duckdb)")
+        self.path = path or os.getenv('LOAD_PATH', DEFAULT_PATHS['duckdb'])
+        self.conn = duckdb.connect(self.path)
+
+    def _execute(self, df, *statements):
+        """Run statements against the frame registered as 'batch'"""
+        # a cursor per call: DAG loads run in parallel threads and a DuckDB
+        # connection must not be shared between them
+        cursor = self.conn.cursor()
+        try:
+            cursor.register('batch', df)
+            cursor.execute('BEGIN TRANSACTION')
+            for statement in statements:
+                cursor.execute(statement)
+            cursor.execute('COMMIT')
+        except Exception:
+            cursor.execute('ROLLBACK')
+            raise
+        finally:
+            cursor.close()
+
+    def _insert_sql(self, df, table_name, conflict=''):
+        columns = ', '.join(f'"{col}"' for col in df.columns)
+        return f'INSERT INTO "{table_name}" ({columns}) SELECT {columns} FROM batch {conflict}'
+
+    def append(self, df, table_name):
+        self._execute(df,
+                      f'CREATE TABLE IF NOT EXISTS "{table_name}" AS SELECT * FROM batch LIMIT 0',
+                      self._insert_sql(df, table_name))
+
+    def upsert(self, df, table_name, keys):
+        key_list = ', '.join(f'"{key}"' for key in keys)
+        updates = ', '.join(f'"{col}" = EXCLUDED."{col}"' for col in df.columns if col not in keys)
+        self._execute(df,
+                      f'CREATE TABLE IF NOT EXISTS "{table_name}" AS SELECT * FROM batch LIMIT 0',
+                      f'CREATE UNIQUE INDEX IF NOT EXISTS "{table_name}_pk" ON "{table_name}" ({key_list})',
+                      self._insert_sql(df, table_name, f'ON CONFLICT ({key_list}) DO UPDATE SET {updates}'))
+
+    def replace(self, df, table_name):
+        self._execute(df, f'CREATE OR REPLACE TABLE "{table_name}" AS SELECT * FROM batch')
+
+    def delete_date(self, table_name, train_date):
+        cursor = self.conn.cursor()
+        try:
+            exists = cursor.execute('SELECT count(*) FROM information_schema.tables WHERE table_name = ?',
+                                    [table_name]).fetchone()[0]
+            if exists:
+                cursor.execute(f'DELETE FROM "{table_name}" WHERE CAST("TrainDate" AS DATE) = ?', [train_date])
+        finally:
+            cursor.close()
+
+
+BACKENDS = {
+    'postgres': PostgresLoader,
+    'sqlite': SQLiteLoader,
+    'duckdb': DuckDBLoader,
+}
+
+_LOADER = None
+
+
+# Loader for the configured backend, built once per process
+def get_loader():
+    """
+    Return the loader selected by LOAD_BACKEND, creating it on first use
+    """
+    global _LOADER
+    if _LOADER is None:
+        if LOAD_BACKEND not in BACKENDS:
+            raise ValueError(f"Unknown LOAD_BACKEND {LOAD_BACKEND!r}, expected one of {', '.join(BACKENDS)}")
+        _LOADER = BACKENDS[LOAD_BACKEND]()
+        logger.info(f"Loading into {LOAD_BACKEND}")
+    return _LOADER
+
+
+### Benchmark ###
+
+def _synthetic_movements(rows, seed=0):
+    """Movement-shaped frame with the column types the transform produces"""
+    rng = np.random.default_rng(seed)
+    stops = 25
+    trains = max(rows // stops, 1)
+    now = pd.Timestamp.now().floor('s')
+    df = pd.DataFrame({
+        'TrainCode': np.repeat([f'E{i:04d}' for i in range(trains)], stops)[:rows],
+        'TrainDate': now.normalize(),
+        'LocationOrder': np.tile(np.arange(1, stops + 1), trains)[:rows],
+        'LocationCode': rng.choice(['CNLLY', 'PERSE', 'HSTON', 'KENT', 'GALWY'], rows),
+        'ScheduledArrival': [t.time() for t in now + pd.to_timedelta(rng.integers(0, 3600, rows), unit='s')],
+        'arrival_actual': now + pd.to_timedelta(rng.integers(0, 3600, rows), unit='s'),
+        'delay_minutes': rng.integers(-2, 30, rows),
+        'fetched_at': now,
+    })
+    return df
+
+
+def drop_table(loader, table_name):
+    """Drop a scratch table on any backend"""
+    if isinstance(loader, DuckDBLoader):
+        loader.conn.execute(f'DROP TABLE IF EXISTS "{table_name}"')
+    else:
+        with loader.engine.begin() as conn:
+            conn.execute(text(f'DROP TABLE IF EXISTS "{table_name}"'))
+
+
+# Compare load throughput between backends
+def benchmark(rows=50000, backends=('sqlite', 'duckdb'), directory='.'):
+    """
+    Append then upsert the same synthetic movements into a scratch table on each
+    backend and print rows/sec. Postgres is only included when asked for.
+    """
+    df = _synthetic_movements(rows)
+    table_name = 'loader_benchmark'
+    for name in backends:
+        if name == 'duckdb' and duckdb is None:
+            print(f"{name:>9}: skipped (duckdb not installed)")
+            continue
+        path = os.path.join(directory, f"loader_benchmark.{name}")
+        if os.path.exists(path):
+            os.remove(path)
+
+        if name == 'postgres':
+            loader = PostgresLoader()
+        else:
+            loader = BACKENDS[name](path)
+        drop_table(loader, table_name)
+
+        timings = {}
+        start = time.perf_counter()
+        loader.append(df, table_name)
+        timings['append'] = time.perf_counter() - start
+        drop_table(loader, table_name)
+
+        # first upsert inserts, the second hits every key
+        for label in ['upsert_new', 'upsert_existing']:
+            start = time.perf_counter()
+            loader.upsert(df, table_name, TRAIN_MOVEMENTS_PK)
+            timings[label] = time.perf_counter() - start
+
+        print(f"{name:>9}: " + ', '.join(f"{label} {rows / seconds:,.0f} rows/s"
+                                          for label, seconds in timings.items()))
+        drop_table(loader, table_name)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    import sys
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 50000,
+              backends=tuple(sys.argv[2:]) or ('sqlite', 'duckdb'))
@@ -0,0 +1,322 @@
+# scripts/loadtest.py
+# Load test of the dashboard queries against synthetic history in a local Postgres
+#
+#   python -m scripts.loadtest generate --days 365 --trains 600
+#   python -m scripts.loadtest run --users 20 --seconds 60 --output loadtest_baseline.json
+#   python -m scripts.loadtest run --users 20 --compare loadtest_baseline.json
+#
+# Everything lives in its own schema (LOADTEST_SCHEMA), created through the
+# same table writers as the pipeline, so the real tables are never touched and
+# the indexes match what the ETL builds. Each simulated user loads the
+# dashboard page over and over: every query in DASHBOARD_QUERIES, uncached, as
+# happens when st.cache_data expires or a new Streamlit process starts. The
+# report gives p50/p95/p99 latency per query and the database time spent on
+# it, from pg_stat_statements when that extension is installed, else from one
+# EXPLAIN ANALYZE per query.
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, text
+
+from .dashboard_queries import DASHBOARD_QUERIES, DASHBOARD_SQL
+from .insert import _copy_frame, _ensure_table, engine, TRAIN_MOVEMENTS_PK
+
+logger = logging.getLogger(__name__)
+
+LOADTEST_SCHEMA = os.getenv('LOADTEST_SCHEMA', 'loadtest')
+
+# Stops per synthetic train, and stations on the network
+STOPS_PER_TRAIN = 20
+STATIONS = 150
+
+# Latency percentiles reported per query
+PERCENTILES = (50, 95, 99)
+
+
+def loadtest_engine(pool_size=5):
+    """Engine on the configured database with only the load test schema on the search path"""
+    with engine.begin() as conn:
+        conn.execute(text(f'CREATE SCHEMA IF NOT EXISTS "{LOADTEST_SCHEMA}"'))
+    return create_engine(engine.url, pool_size=pool_size, max_overflow=0,
+                         connect_args={'options': f'-csearch_path={LOADTEST_SCHEMA}'})
+
+
+### Synthetic history ###
+
+def synthetic_stations(stations=STATIONS, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'StationDesc': [f'Station {i:03d}' for i in range(stations)],
+        'StationAlias': None,
+        'StationLatitude': rng.uniform(51.5, 55.2, stations),
+        'StationLongitude': rng.uniform(-10.0, -6.0, stations),
+        'StationCode': [f'S{i:04d}' for i in range(stations)],
+        'StationId': np.arange(stations).astype(str),
+        'StationType': rng.choice(['D', 'S', 'M', 'DM'], stations),
+        'updated_at': pd.Timestamp.now(),
+    })
+
+
+def synthetic_movements(day, trains, stations=STATIONS, seed=0):
+    """One day of train_movements shaped like transform_train_movements output"""
+    rng = np.random.default_rng(seed)
+    rows = trains * STOPS_PER_TRAIN
+    start = pd.Timestamp(day) + pd.to_timedelta(rng.integers(5 * 3600, 23 * 3600, trains), unit='s')
+    origin = rng.integers(0, stations, trains)
+    destination = (origin + rng.integers(1, stations, trains)) % stations
+    # delays drift along a journey
+    delays = rng.normal(1, 2, rows).reshape(trains, STOPS_PER_TRAIN).cumsum(axis=1).clip(-2, 90).round()
+    scheduled = pd.DatetimeIndex(np.repeat(start, STOPS_PER_TRAIN)) + pd.to_timedelta(
+        np.tile(np.arange(STOPS_PER_TRAIN) * 240, trains), unit='s')
+    arrival = scheduled + pd.to_timedelta(delays.ravel(), unit='m')
+    return pd.DataFrame({
+        'TrainCode': np.repeat([f'{c}{i:03d}' for i, c in enumerate(rng.choice(list('ADEP'), trains))],
+                               STOPS_PER_TRAIN),
+        'TrainDate': pd.Timestamp(day).date(),
+        'LocationCode': [f'S{i:04d}' for i in rng.integers(0, stations, rows)],
+        'LocationFullName': [f'Station {i:03d}' for i in rng.integers(0, stations, rows)],
+        'LocationOrder': np.tile(np.arange(1, STOPS_PER_TRAIN + 1), trains),
+        'LocationType': np.tile(['O'] + ['S'] * (STOPS_PER_TRAIN - 2) + ['D'], trains),
+        'TrainOrigin': np.repeat([f'Station {i:03d}' for i in origin], STOPS_PER_TRAIN),
+        'TrainDestination': np.repeat([f'Station {i:03d}' for i in destination], STOPS_PER_TRAIN),
+        # scheduled times are times of day, actual ones full timestamps, as after object_to_time/datetime
+        'ScheduledArrival': scheduled.time,
+        'ScheduledDeparture': (scheduled + pd.Timedelta(minutes=1)).time,
+        'arrival_actual': arrival,
+        'departure_actual': arrival + pd.Timedelta(minutes=1),
+        'StopType': 'C',
+        'fetched_at': pd.Timestamp.now(),
+        'delay_minutes': delays.ravel().astype(int),
+        'enhanced_at': pd.Timestamp.now(),
+    })
+
+
+def synthetic_current_trains(trains, seed=0):
+    """Today's current trains snapshot shaped like transform_current_trains output"""
+    rng = np.random.default_rng(seed)
+    delays = rng.gamma(1.2, 3, trains).round().astype(int)
+    codes = [f'{c}{i:03d}' for i, c in enumerate(rng.choice(list('ADEP'), trains))]
+    return pd.DataFrame({
+        'TrainStatus': rng.choice(['R', 'N', 'T'], trains, p=[0.7, 0.2, 0.1]),
+        'TrainLatitude': rng.uniform(51.5, 55.2, trains),
+        'TrainLongitude': rng.uniform(-10.0, -6.0, trains),
+        'TrainCode': codes,
+        'TrainDate': date.today(),
+        'PublicMessage': [f'{code}\\n12:00 - Station 001 to Station 002 ({d} mins late)\\n'
+                          f'Departed Station 003 next stop Station 004' for code, d in zip(codes, delays)],
+        'Direction': rng.choice(['Northbound', 'Southbound'], trains),
+        'delay_minutes': delays,
+        'current_location': 'Station 003',
+        'train_type': rng.choice(['DART', 'Commuter', 'Intercity'], trains),
+        'enhanced_at': pd.Timestamp.now(),
+    })
+
+
+# Fill the load test schema with a history of movements
+def generate_history(days=365, trains=600, active=150, seed=0):
+    """
+    Replace the load test schema's tables with days of train movements up to
+    today, today's snapshot of active current trains, and the stations.
+    """
+    lt_engine = loadtest_engine()
+    with lt_engine.begin() as conn:
+        for table in ['stations', 'current_trains', 'train_movements']:
+            conn.execute(text(f'DROP TABLE IF EXISTS "{table}"'))
+        stations = synthetic_stations(seed=seed)
+        _ensure_table(conn, stations, 'stations')
+        _copy_frame(conn, stations, 'stations')
+        current = synthetic_current_trains(active, seed=seed)
+        _ensure_table(conn, current, 'current_trains')
+        _copy_frame(conn, current, 'current_trains')
+
+    start = time.perf_counter()
+    for n, offset in enumerate(range(days - 1, -1, -1)):
+        day = date.today() - timedelta(days=offset)
+        movements = synthetic_movements(day, trains, seed=seed + n)
+        # one transaction per day keeps memory flat for a year of history
+        with lt_engine.begin() as conn:
+            _ensure_table(conn, movements, 'train_movements', keys=TRAIN_MOVEMENTS_PK)
+            _copy_frame(conn, movements, 'train_movements')
+        if (n + 1) % 30 == 0:
+            logger.info(f"Generated {n + 1}/{days} days ({(n + 1) * len(movements):,} movement rows)")
+
+    with lt_engine.begin() as conn:
+        for table in ['stations', 'current_trains', 'train_movements']:
+            conn.execute(text(f'ANALYZE "{table}"'))
+    logger.info(f"Generated {days * trains * STOPS_PER_TRAIN:,} movement rows in {time.perf_counter() - start:.0f}s")
+
+
+### Database time ###
+
+def _statement_stats(conn):
+    """
+    pg_stat_statements totals by query text, or None without the extension.
+    The view is looked up in the schema the extension was created in, as the
+    load test search path holds only LOADTEST_SCHEMA.
+    """
+    schema = conn.execute(text('''
+        SELECT n.nspname FROM pg_extension e JOIN pg_namespace n ON n.oid = e.extnamespace
+        WHERE e.extname = 'pg_stat_statements'
+    ''')).scalar()
+    if schema is None:
+        logger.info("pg_stat_statements not installed, timing with EXPLAIN ANALYZE")
+        return None
+    try:
+        rows = conn.execute(text(f'SELECT query, calls, total_exec_time FROM "{schema}".pg_stat_statements')).fetchall()
+    except Exception as e:
+        # installed but not in shared_preload_libraries
+        logger.warning(f"pg_stat_statements unavailable, timing with EXPLAIN ANALYZE: {e}")
+        conn.rollback()
+        return None
+    return {row[0]: (row[1], row[2]) for row in rows}
+
+
+def _db_ms_from_statements(before, after):
+    """Mean execution ms per query from two pg_stat_statements snapshots"""
+    result = {}
+    for name in DASHBOARD_SQL:
+        calls = ms = 0
+        for query, (after_calls, after_ms) in after.items():
+            if f'dashboard:{name} ' in query:
+                before_calls, before_ms = before.get(query, (0, 0.0))
+                calls += after_calls - before_calls
+                ms += after_ms - before_ms
+        result[name] = ms / calls if calls else None
+    return result
+
+
+def _db_ms_from_explain(conn):
+    """Execution ms per query from one EXPLAIN ANALYZE each"""
+    result = {}
+    for name, sql in DASHBOARD_SQL.items():
+        plan = conn.execute(text(f'EXPLAIN (ANALYZE, FORMAT JSON) {sql.strip().rstrip(";")}')).scalar()
+        plan = json.loads(plan) if isinstance(plan, str) else plan
+        result[name] = plan[0]['Execution Time']
+    return result
+
+
+### Run ###
+
+def _user(lt_engine, deadline, iterations, latencies, errors, lock):
+    done = 0
+    while time.perf_counter() < deadline and (iterations is None or done < iterations):
+        for name, query in DASHBOARD_QUERIES.items():
+            start = time.perf_counter()
+            try:
+                query(lt_engine)
+            except Exception as e:
+                with lock:
+                    errors[name] = errors.get(name, 0) + 1
+                logger.warning(f"{name} failed: {e}")
+                continue
+            with lock:
+                latencies[name].append((time.perf_counter() - start) * 1000)
+        done += 1
+
+
+# Run the dashboard queries as concurrent users
+def run_load_test(users=10, seconds=30, iterations=None):
+    """
+    Run every dashboard query as users concurrent page loads for the given
+    time (or iterations page loads per user).
+
+    Returns:
+        dict: Per query: calls, errors, p50/p95/p99/mean latency ms and db_ms,
+        plus the run settings and total page loads per second.
+    """
+    lt_engine = loadtest_engine(pool_size=users + 1)
+    latencies = {name: [] for name in DASHBOARD_QUERIES}
+    errors = {}
+    lock = threading.Lock()
+
+    with lt_engine.connect() as conn:
+        stats_before = _statement_stats(conn)
+
+    start = time.perf_counter()
+    deadline = start + seconds
+    with ThreadPoolExecutor(max_workers=users) as pool:
+        for _ in range(users):
+            pool.submit(_user, lt_engine, deadline, iterations, latencies, errors, lock)
+    elapsed = time.perf_counter() - start
+
+    with lt_engine.connect() as conn:
+        stats_after = _statement_stats(conn) if stats_before is not None else None
+        if stats_after is not None:
+            db_ms, db_source = _db_ms_from_statements(stats_before, stats_after), 'pg_stat_statements'
+        else:
+            db_ms, db_source = _db_ms_from_explain(conn), 'explain_analyze'
+        movement_rows = conn.execute(text('SELECT count(*) FROM train_movements')).scalar()
+
+    report = {'users': users, 'seconds': round(elapsed, 1), 'movement_rows': movement_rows,
+              'db_source': db_source, 'queries': {}}
+    page_loads = min(len(values) for values in latencies.values()) if latencies else 0
+    report['page_loads_per_sec'] = round(page_loads / elapsed, 2) if elapsed else None
+    for name, values in latencies.items():
+        values = np.array(values)
+        entry = {'calls': len(values), 'errors': errors.get(name, 0),
+                 'db_ms': round(db_ms[name], 2) if db_ms.get(name) is not None else None}
+        if len(values):
+            entry.update({f'p{p}_ms': round(float(np.percentile(values, p)), 2) for p in PERCENTILES})
+            entry['mean_ms'] = round(float(values.mean()), 2)
+        report['queries'][name] = entry
+    return report
+
+
+def print_report(report, baseline=None):
+    """Print a report as a table, with the change against a baseline report when given."""
+    print(f"{report['users']} users for {report['seconds']}s on {report['movement_rows']:,} movement rows, "
+          f"{report['page_loads_per_sec']} page loads/s (db time from {report['db_source']})")
+    columns = ['calls', 'errors'] + [f'p{p}_ms' for p in PERCENTILES] + ['mean_ms', 'db_ms']
+    table = pd.DataFrame(report['queries']).T.reindex(columns=columns)
+    table[['calls', 'errors']] = table[['calls', 'errors']].astype(int)
+    if baseline:
+        before = pd.DataFrame(baseline['queries']).T.reindex(columns=columns)
+        for col in ['p50_ms', 'p95_ms', 'p99_ms', 'db_ms']:
+            change = (table[col].astype(float) / before[col].astype(float) - 1) * 100
+            table[f'{col} vs base'] = change.map(lambda v: f'{v:+.0f}%' if pd.notna(v) else '')
+    print(table.to_string())
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Load test the dashboard queries on synthetic history")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    generate = commands.add_parser('generate', help="Create synthetic history in the load test schema")
+    generate.add_argument('--days', type=int, default=365, help="Days of train movements")
+    generate.add_argument('--trains', type=int, default=600, help="Trains per day")
+    generate.add_argument('--active', type=int, default=150, help="Trains in today's current trains snapshot")
+
+    run = commands.add_parser('run', help="Run the dashboard queries as concurrent users")
+    run.add_argument('--users', type=int, default=10, help="Concurrent simulated viewers")
+    run.add_argument('--seconds', type=float, default=30, help="How long to run")
+    run.add_argument('--iterations', type=int, help="Page loads per user, instead of running for --seconds")
+    run.add_argument('--output', help="Write the report as JSON, e.g. as a baseline")
+    run.add_argument('--compare', help="Baseline JSON report to compare against")
+
+    args = parser.parse_args()
+    if args.command == 'generate':
+        generate_history(args.days, args.trains, args.active)
+        return
+
+    report = run_load_test(args.users, args.seconds if args.iterations is None else float('inf'), args.iterations)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+# scripts/memo.py
+# Unique-value memoization for per-row enrichment of message text, routes and train codes
+#
+# A column is factorized, only the unique values not already cached are
+# computed, and the results are spread back over the rows. The cache is a
+# bounded LRU shared by every run in the process, so the adaptive poller and
+# other long-running callers reuse results from earlier snapshots.
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Entries kept per memo
+MEMO_SIZE = int(os.getenv('MEMO_SIZE', 20000))
+
+# Every memo created, by name, for reporting
+MEMOS = {}
+
+
+def _keys(columns):
+    """One hashable key per row: the value itself, or a tuple across several columns"""
+    if len(columns) == 1:
+        values = pd.Series(columns[0], dtype=object)
+        return values.where(values.notna(), None).to_numpy(dtype=object)
+    keys = np.empty(len(columns[0]), dtype=object)
+    columns = [pd.Series(col, dtype=object) for col in columns]
+    columns = [col.where(col.notna(), None).to_numpy(dtype=object) for col in columns]
+    keys[:] = list(zip(*columns))
+    return keys
+
+
+class UniqueMemo:
+    """
+    Bounded LRU of key -> result for an enrichment function.
+
+    func takes one key (a value, or a tuple when several columns are given) and
+    returns its result. With batch=True it takes a list of keys and returns a
+    list of results, for functions that are already vectorised.
+    """
+
+    def __init__(self, name, func, batch=False, maxsize=MEMO_SIZE):
+        self.name = name
+        self.func = func
+        self.batch = batch
+        self.maxsize = maxsize
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = self._empty_stats()
+        MEMOS[name] = self
+
+    @staticmethod
+    def _empty_stats():
+        return {'rows': 0, 'unique': 0, 'hits': 0, 'computed': 0, 'compute_seconds': 0.0, 'seconds': 0.0}
+
+    def __len__(self):
+        return len(self._cache)
+
+    def apply(self, *columns):
+        """
+        Results for every row of the given columns, as an object array.
+        Missing values are passed to func as None.
+        """
+        start = time.perf_counter()
+        codes, uniques = pd.factorize(_keys(columns))
+        uniques = list(uniques)
+        if len(codes) and codes.min() < 0:
+            # missing values share one slot, computed from None
+            codes = np.where(codes < 0, len(uniques), codes)
+            uniques.append(None)
+
+        results = np.empty(len(uniques), dtype=object)
+        missing = []
+        with self._lock:
+            for i, key in enumerate(uniques):
+                try:
+                    results[i] = self._cache[key]
+                    self._cache.move_to_end(key)
+                except KeyError:
+                    missing.append(i)
+
+        compute_start = time.perf_counter()
+        if missing:
+            keys = [uniques[i] for i in missing]
+            computed = self.func(keys) if self.batch else [self.func(key) for key in keys]
+            for i, result in zip(missing, computed):
+                results[i] = result
+        compute_seconds = time.perf_counter() - compute_start
+
+        with self._lock:
+            for i in missing:
+                self._cache[uniques[i]] = results[i]
+            while len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+            stats = self.stats
+            stats['rows'] += len(codes)
+            stats['unique'] += len(uniques)
+            stats['hits'] += len(uniques) - len(missing)
+            stats['computed'] += len(missing)
+            stats['compute_seconds'] += compute_seconds
+            stats['seconds'] += time.perf_counter() - start
+
+        return results[codes]
+
+    def take_stats(self):
+        """
+        Counters since the last call, with the unique-value hit rate and an
+        estimate of the time saved against computing every row. A batch
+        function's cost is not per value, so it gets no estimate (None).
+        """
+        with self._lock:
+            stats, self.stats = self.stats, self._empty_stats()
+        stats['hit_rate'] = stats['hits'] / stats['unique'] if stats['unique'] else 0.0
+        stats['saved_seconds'] = None
+        if stats['computed'] and not self.batch:
+            per_value = stats['compute_seconds'] / stats['computed']
+            stats['saved_seconds'] = per_value * stats['rows'] - stats['seconds']
+        return stats
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+
+def memo_stats():
+    """take_stats() of every memo that saw rows since it was last reported"""
+    report = {}
+    for name, memo in MEMOS.items():
+        stats = memo.take_stats()
+        if stats['rows']:
+            report[name] = stats
+    return report
+
+
+# Hit rates for the run metrics
+def log_memo_stats():
+    """Log each memo's rows, unique values, hit rate and time saved since the last report."""
+    report = memo_stats()
+    for name, stats in report.items():
+        saved = f", ~{stats['saved_seconds'] * 1000:.1f}ms saved" if stats['saved_seconds'] is not None else ""
+        logger.info(f"Memo {name}: {stats['rows']} rows, {stats['unique']} unique, "
+                    f"{stats['hit_rate'] * 100:.0f}% cached, {stats['computed']} computed{saved}")
+    return report
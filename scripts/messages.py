@@ -0,0 +1,184 @@
+# scripts/messages.py
+# Single-pass parser for the PublicMessage text of getCurrentTrainsXML
+#
+# A message looks like (line breaks arrive as a literal "\n", and are spaces
+# once transform_current_trains has cleaned the column):
+#
+#   E109\n14:52 - Bray to Howth (0 mins late)\nDeparted Sandymount next stop Lansdowne Road
+#   A623\n14:25 - Dublin Heuston to Galway\nExpected Departure 14:25
+#   E816\n16:30 - Malahide to Bray(1 mins late)\nTERMINATED Bray at 17:42
+#
+# Each message is tokenised once: the status keyword splits it into a header
+# (train code, time, route and delay) and a status tail (where the train is),
+# and the service keywords of the train type rule table are looked up in the
+# same pass. Every step runs over the whole column of distinct messages.
+import re
+import time
+
+import numpy as np
+import pandas as pd
+
+from .memo import UniqueMemo
+
+# The whole message in two patterns, applied with Series.str.extract so a
+# column of messages takes two regex passes rather than a chain of splits.
+# Status: the first status word splits the message into header and tail, and
+# the tail is read according to the status:
+#   Departed Sandymount next stop Lansdowne Road / TERMINATED Bray at 17:42 /
+#   Expected Departure 14:25
+CLOCK = r'\d{1,2}:\d{2}'
+STATUS_PATTERN = (
+    r'^(?P<header>.*?) (?:'
+    r'(?P<moving>Departed|Arrived) \s*(?P<current>.*?)(?: next stop (?P<next_stop>\s*\S.*))?'
+    r'|(?P<terminated>TERMINATED|Terminated) \s*(?:(?P<place>.+) at \s*(?P<end_time>' + CLOCK + r')\s*|(?P<end_place>.*))'
+    r'|(?P<expected>Expected Departure)\s*(?:(?P<expected_time>' + CLOCK + r')(?:\s.*)?|.*)'
+    r'|(?P<not_departed>Not yet departed).*)$')
+# Header: optional train code, then "HH:MM - Origin to Destination (N mins late)";
+# the delay is the first word inside the bracket, when the bracket says "late"
+HEADER_PATTERN = (
+    r'^(?:(?P<train_code>[A-Z]\d{3,4})(?: |$))?'
+    r'(?:\s*(?P<scheduled_time>' + CLOCK + r')\s* - '
+    r'(?:(?P<origin>.*?) to (?P<destination>[^(]*)'
+    r'(?:\((?P<late>\s*(?:(?P<delay>[+-]*\d+)(?=\s|$))?.*))?)?)?')
+
+# Columns of the structured result
+MESSAGE_COLUMNS = ['train_code', 'scheduled_time', 'origin', 'destination', 'delay_minutes', 'status',
+                   'current_location', 'next_stop', 'event_time', 'service_hint']
+
+
+def _stripped_or_none(values):
+    values = values.str.strip()
+    return values.where(values.str.len() > 0)
+
+
+class MessageParser:
+    """
+    PublicMessage parser built once from the message keyword rules of the
+    train type rule table ({'keyword', 'type', 'priority'} dicts).
+    """
+
+    def __init__(self, message_rules=(), default='Unknown'):
+        self.default = default
+        self.rules = sorted(message_rules, key=lambda rule: rule['priority'])
+        # uppercase keywords in priority order, so the first hit wins like the old if/elif scan
+        self.hints = [(rule['keyword'].upper(), rule['type']) for rule in self.rules]
+        # messages repeat within a snapshot and between polls; each distinct one is parsed once
+        self.memo = UniqueMemo('public_message', self.parse_many, batch=True)
+
+    def parse_many(self, messages):
+        """Parse a list of messages into a list of tuples in MESSAGE_COLUMNS order."""
+        messages = pd.Series(messages, dtype=object)
+        valid = messages.map(lambda message: isinstance(message, str) and message != '').to_numpy(dtype=bool)
+        # line breaks arrive as a literal "\n" until the column is cleaned;
+        # the leading space lets every status word be matched after a space
+        text = (' ' + messages.where(valid, '').str.replace('\\n', ' ', regex=False)
+                .str.replace('\n', ' ', regex=False)).astype('string')
+
+        status = text.str.extract(STATUS_PATTERN)
+        header = text.where(status['header'].isna(), status['header']).str.strip().str.extract(HEADER_PATTERN)
+        delay = pd.to_numeric(header['delay'].where(header['late'].str.contains(' late', regex=False).fillna(False)),
+                              errors='coerce')
+
+        upper = text.str.upper()
+        hint = pd.Series(self.default, index=text.index, dtype=object)
+        for keyword, train_type in reversed(self.hints):
+            hint[upper.str.contains(keyword, regex=False)] = train_type
+
+        result = pd.DataFrame({
+            'train_code': header['train_code'],
+            'scheduled_time': header['scheduled_time'],
+            'origin': _stripped_or_none(header['origin']),
+            'destination': _stripped_or_none(header['destination']),
+            'delay_minutes': delay.fillna(0).astype(int),
+            'status': (status['moving'].fillna(status['terminated'].str.title())
+                       .fillna(status['expected'].where(status['expected'].isna(), 'Expected'))
+                       .fillna(status['not_departed'].where(status['not_departed'].isna(), 'Not departed'))),
+            # without a time the whole tail is the place a train terminated at
+            'current_location': _stripped_or_none(status['current'].fillna(status['place'])
+                                                  .fillna(status['end_place'])),
+            'next_stop': _stripped_or_none(status['next_stop']),
+            'event_time': status['end_time'].fillna(status['expected_time']),
+            'service_hint': hint,
+        }).astype(object)
+        result = result.where(result.notna(), None)
+        result[~valid] = (None, None, None, None, 0, None, None, None, None, self.default)
+        return list(result.itertuples(index=False, name=None))
+
+    def parse(self, messages):
+        """
+        Parse a column of messages.
+
+        Returns:
+            DataFrame: MESSAGE_COLUMNS on the same index. delay_minutes is 0
+            when the message gives none, as a train with no delay is on time;
+            service_hint is the rule table default when no keyword is present.
+        """
+        messages = pd.Series(messages, dtype=object)
+        rows = self.memo.apply(messages)
+        result = pd.DataFrame(list(rows), columns=MESSAGE_COLUMNS, index=messages.index, dtype=object)
+        result['delay_minutes'] = result['delay_minutes'].astype(int)
+        return result
+
+
+# Parser for the current rule table, built with the train type classifier
+def get_message_parser():
+    from .train_types import get_train_type_classifier
+    return get_train_type_classifier().message_parser
+
+
+def parse_messages(messages):
+    """Parse a column of PublicMessage text into MESSAGE_COLUMNS."""
+    return get_message_parser().parse(messages)
+
+
+### Benchmark ###
+
+# A day's worth of message shapes, cycled to the benchmark size
+SAMPLE_MESSAGES = [
+    'E109\\n14:52 - Bray to Howth (0 mins late)\\nDeparted Sandymount next stop Lansdowne Road',
+    'A102\\n07:00 - Cork to Dublin Heuston (3 mins late)\\nArrived Mallow next stop Charleville',
+    'A623\\n14:25 - Dublin Heuston to Galway\\nExpected Departure 14:25',
+    'E816\\n16:30 - Malahide to Bray(1 mins late)\\nTERMINATED Bray at 17:42',
+    'D805\\n10:40 - Drogheda to Dublin Pearse (-1 mins late)\\nDeparted Laytown next stop Gormanston',
+    'A123\\n07:35 - Belfast to Dublin Connolly (5 mins late)\\nEnterprise\\nDeparted Newry next stop Dundalk',
+]
+
+
+def _three_pass(messages, rules):
+    """What add_extra_fields used to do: two regex scans per row and an uppercased keyword scan"""
+    def delay(message):
+        match = re.search(r'\(([+-]?\d+) mins late\)', str(message))
+        return int(match.group(1)) if match else 0
+
+    def location(message):
+        match = (re.search(r'Departed ([^n]+) next stop', str(message))
+                 or re.search(r'Arrived ([^n]+?)(?:\s+next stop|$)', str(message)))
+        return match.group(1).strip() if match else None
+
+    upper = messages.astype('string').str.upper()
+    hits = [upper.str.contains(re.escape(rule['keyword'].upper())).fillna(False).to_numpy(dtype=bool)
+            for rule in rules]
+    return (messages.apply(delay), messages.apply(location),
+            np.select(hits, [rule['type'] for rule in rules], default='Unknown'))
+
+
+def benchmark(rows=100000):
+    """Time the single-pass parser against the three separate scans it replaced."""
+    parser = get_message_parser()
+    messages = pd.Series((SAMPLE_MESSAGES * (rows // len(SAMPLE_MESSAGES) + 1))[:rows], dtype=object)
+
+    start = time.perf_counter()
+    _three_pass(messages, parser.rules)
+    old_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    parser.parse(messages)
+    new_seconds = time.perf_counter() - start
+
+    print(f"{rows} messages: three scans {old_seconds:.2f}s, single pass {new_seconds:.2f}s "
+          f"({old_seconds / new_seconds:.2f}x), {rows / new_seconds:,.0f} messages/s")
+
+
+if __name__ == '__main__':
+    import sys
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,248 @@
+# scripts/movement_cache.py
+# Per-train cache of the last movements fetched, so only changed stops are transformed and loaded
+#
+# getTrainMovementsXML returns a train's whole journey on every fetch, and the
+# stops it has already passed come back unchanged. The cache keeps a hash of
+# every stop per (TrainCode, TrainDate); a new response is compared stop by stop
+# and only new or changed stops go on to transform and load. Each changed stop
+# brings the stop before it along, so per-stop delay deltas still have their
+# previous stop. Trains are evicted least recently fetched first, and every
+# train from before yesterday is dropped at the start of a run.
+#
+# With the Postgres backend the hashes are kept in the movement_hashes table,
+# so a fresh CI runner starts from the last run's state. The local backends
+# keep them in a JSON file next to their database.
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from .loaders import get_loader
+
+logger = logging.getLogger(__name__)
+
+MOVEMENT_CACHE_PATH = os.getenv('MOVEMENT_CACHE_PATH', 'movement_cache.json')
+
+# Trains kept in the cache, comfortably more than run in one day
+MAX_TRAINS = int(os.getenv('MOVEMENT_CACHE_TRAINS', 2000))
+
+TRAIN_KEY = ['TrainCode', 'TrainDate']
+
+# Stamped per fetch, so they differ even when the stop has not changed
+VOLATILE_COLUMNS = ['fetched_at', 'enhanced_at']
+
+HASHES_SCHEMA_SQL = '''
+    CREATE TABLE IF NOT EXISTS movement_hashes (
+        "TrainCode"     text      NOT NULL,
+        "TrainDate"     text      NOT NULL,
+        "LocationOrder" text      NOT NULL,
+        stop_hash       bigint    NOT NULL,
+        seen_at         timestamp NOT NULL,
+        PRIMARY KEY ("TrainCode", "TrainDate", "LocationOrder")
+    )
+'''
+
+HASHES_MERGE_SQL = '''
+    INSERT INTO movement_hashes ("TrainCode", "TrainDate", "LocationOrder", stop_hash, seen_at)
+    SELECT "TrainCode", "TrainDate", "LocationOrder", stop_hash, seen_at FROM movement_hashes_batch
+    ON CONFLICT ("TrainCode", "TrainDate", "LocationOrder")
+    DO UPDATE SET stop_hash = EXCLUDED.stop_hash, seen_at = EXCLUDED.seen_at
+'''
+
+_CACHE = None
+
+
+def stop_hashes(df):
+    """One int64 per row over every column that describes the stop itself"""
+    columns = [col for col in df.columns if col not in VOLATILE_COLUMNS]
+    # signed, so the hashes fit a Postgres bigint
+    return pd.util.hash_pandas_object(df[columns].astype(str), index=False).to_numpy().view(np.int64)
+
+
+class MovementCache:
+    """
+    Last seen stop hashes per train: (TrainCode, TrainDate) -> {LocationOrder: hash},
+    in least to most recently fetched order.
+    """
+
+    def __init__(self, max_trains=MAX_TRAINS):
+        self.max_trains = max_trains
+        self._trains = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._trains)
+
+    def changed_mask(self, df):
+        """Boolean array marking the stops that are new or differ from the cached ones"""
+        hashes = stop_hashes(df)
+        with self._lock:
+            return np.array([self._trains.get((code, date), {}).get(str(order)) != int(h)
+                             for code, date, order, h in zip(df['TrainCode'], df['TrainDate'],
+                                                             df['LocationOrder'], hashes)], dtype=bool)
+
+    def changed_stops(self, df):
+        """
+        The rows of a raw movements frame to forward: changed stops plus the
+        stop before each of them, in the original row order.
+        """
+        if df.empty:
+            return df
+        changed = pd.Series(self.changed_mask(df), index=df.index)
+        order = pd.to_numeric(df['LocationOrder'], errors='coerce')
+        ordered = changed.loc[order.sort_values(kind='stable').index]
+        keys = [df.loc[ordered.index, col] for col in TRAIN_KEY]
+        # a stop is context when the next stop of the same train changed
+        context = ordered.groupby(keys, sort=False).shift(-1, fill_value=False).astype(bool)
+        forward = (changed | context.reindex(df.index)).to_numpy()
+        return df[forward].copy()
+
+    def remember(self, df):
+        """Store the stops of a raw movements frame as the latest seen."""
+        if df.empty:
+            return
+        hashes = stop_hashes(df)
+        with self._lock:
+            for code, date, order, h in zip(df['TrainCode'], df['TrainDate'], df['LocationOrder'], hashes):
+                stops = self._trains.get((code, date))
+                if stops is None:
+                    stops = self._trains[(code, date)] = {}
+                self._trains.move_to_end((code, date))
+                stops[str(order)] = int(h)
+            while len(self._trains) > self.max_trains:
+                self._trains.popitem(last=False)
+
+    def evict_before(self, day):
+        """Drop every train whose TrainDate is before day, returning how many went."""
+        with self._lock:
+            dates = pd.to_datetime(pd.Series([key[1] for key in self._trains], dtype=object), errors='coerce')
+            old = [key for key, date in zip(list(self._trains), dates) if pd.isna(date) or date.date() < day]
+            for key in old:
+                del self._trains[key]
+        return len(old)
+
+    def save(self, path, backend=None):
+        with self._lock:
+            trains = [[code, date, stops] for (code, date), stops in self._trains.items()]
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'backend': backend, 'trains': trains}, f)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path, backend=None, max_trains=MAX_TRAINS):
+        """
+        Read a saved cache. A missing or unreadable file, or one written for a
+        different load backend, gives an empty cache so every stop is loaded.
+        """
+        cache = cls(max_trains)
+        if not os.path.exists(path):
+            return cache
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable movement cache {path}: {e}")
+            return cache
+        if data.get('backend') != backend:
+            return cache
+        for code, date, stops in data['trains']:
+            cache._trains[(code, date)] = stops
+        return cache
+
+    @classmethod
+    def load_table(cls, conn, since, max_trains=MAX_TRAINS):
+        """
+        Read the hashes of trains seen since a time from movement_hashes,
+        dropping older ones from the table.
+        """
+        conn.execute(text(HASHES_SCHEMA_SQL))
+        conn.execute(text('DELETE FROM movement_hashes WHERE seen_at < :since'), {'since': since})
+        rows = conn.execute(text(
+            'SELECT "TrainCode", "TrainDate", "LocationOrder", stop_hash FROM movement_hashes '
+            'WHERE seen_at >= :since ORDER BY seen_at'), {'since': since})
+        cache = cls(max_trains)
+        for code, date, order, h in rows:
+            cache._trains.setdefault((code, date), {})[order] = h
+        return cache
+
+    @staticmethod
+    def save_table(conn, df, seen_at):
+        """Upsert the stop hashes of a raw movements frame into movement_hashes."""
+        from .insert import _copy_frame
+        batch = pd.DataFrame({'TrainCode': df['TrainCode'].astype(str), 'TrainDate': df['TrainDate'].astype(str),
+                              'LocationOrder': df['LocationOrder'].astype(str), 'stop_hash': stop_hashes(df),
+                              'seen_at': seen_at})
+        # a response can repeat a stop; the last one wins, as in remember()
+        batch = batch.drop_duplicates(TRAIN_KEY + ['LocationOrder'], keep='last')
+        conn.execute(text(HASHES_SCHEMA_SQL))
+        conn.execute(text('CREATE TEMP TABLE movement_hashes_batch '
+                          '(LIKE movement_hashes INCLUDING DEFAULTS) ON COMMIT DROP'))
+        _copy_frame(conn, batch, 'movement_hashes_batch')
+        conn.execute(text(HASHES_MERGE_SQL))
+
+
+def _load_cache():
+    """movement_hashes with Postgres, the JSON file with a local backend"""
+    loader = get_loader()
+    if not loader.sidecars:
+        return MovementCache.load(MOVEMENT_CACHE_PATH, backend=loader.name)
+    from .insert import engine
+    try:
+        with engine.begin() as conn:
+            cache = MovementCache.load_table(conn, pd.Timestamp.now() - pd.Timedelta(days=2))
+        logger.info(f"Warmed the movement cache with {len(cache)} trains from movement_hashes")
+        return cache
+    except SQLAlchemyError as e:
+        logger.warning(f"Movement cache not warmed, every stop is loaded: {e}")
+        return MovementCache()
+
+
+# Shared cache, read from the database or disk on first use
+def get_movement_cache():
+    global _CACHE
+    if _CACHE is None:
+        _CACHE = _load_cache()
+        # overnight trains keep yesterday's TrainDate after midnight
+        evicted = _CACHE.evict_before((pd.Timestamp.now() - pd.Timedelta(days=1)).date())
+        if evicted:
+            logger.info(f"Evicted {evicted} finished trains from the movement cache")
+    return _CACHE
+
+
+def changed_movements(df):
+    """
+    Narrow freshly extracted movements to the stops that changed since they
+    were last loaded.
+    """
+    if df.empty:
+        return df
+    changed = get_movement_cache().changed_stops(df)
+    logger.info(f"{len(changed)} of {len(df)} movement rows changed since the last fetch "
+                f"({df.groupby(TRAIN_KEY).ngroups} trains)")
+    return changed
+
+
+def remember_movements(df):
+    """Record extracted movements once they have been loaded, and persist the cache."""
+    if df.empty:
+        return
+    cache = get_movement_cache()
+    cache.remember(df)
+    loader = get_loader()
+    try:
+        if loader.sidecars:
+            from .insert import engine
+            with engine.begin() as conn:
+                MovementCache.save_table(conn, df, pd.Timestamp.now())
+        else:
+            cache.save(MOVEMENT_CACHE_PATH, backend=loader.name)
+    except (OSError, SQLAlchemyError) as e:
+        logger.warning(f"Failed to save movement cache: {e}")
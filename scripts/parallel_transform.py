@@ -0,0 +1,222 @@
+# scripts/parallel_transform.py
+# Parallel train movements transform for backfills and replays with millions of rows
+#
+# The frame is split by TrainCode (a train's stops stay together), each part is
+# transformed by transform_train_movements in a worker process, and the parts are
+# put back in the original row order. Partitions travel as Arrow IPC streams,
+# which are far cheaper to serialise than pickled object-dtype DataFrames.
+import json
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from .pipeline import transform_train_movements
+from .station_registry import get_station_registry
+
+try:
+    import pyarrow as pa
+except ImportError:  # optional, partitions are pickled without it
+    pa = None
+
+logger = logging.getLogger(__name__)
+
+# Below this many rows the serial transform is faster than starting workers
+PARALLEL_MIN_ROWS = 100000
+
+# Partitions per worker, so an unlucky partition with long trains does not hold up the pool
+PARTITIONS_PER_WORKER = 2
+
+# Keeps the original position of every row through the workers
+_ROW = '_row'
+
+
+### Arrow transfer ###
+
+def to_ipc(df):
+    """
+    Serialise a frame to Arrow IPC bytes. The pandas dtype of every column is
+    kept in the schema metadata so from_ipc can restore object columns.
+    """
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    meta = {'dtypes': {col: str(dtype) for col, dtype in df.dtypes.items()}, 'attrs': df.attrs}
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}),
+                                           b'irish_rail': json.dumps(meta, default=str).encode()})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def from_ipc(data):
+    """
+    Read a frame written by to_ipc, restoring its original dtypes: nullable
+    integers stay Python ints, and columns that were object dtype are object
+    again with None for missing values.
+    """
+    table = pa.ipc.open_stream(data).read_all()
+    meta = json.loads(table.schema.metadata[b'irish_rail'])
+    df = table.to_pandas(integer_object_nulls=True, date_as_object=True)
+    for col, dtype in meta['dtypes'].items():
+        if str(df[col].dtype) == dtype:
+            continue
+        if dtype == 'object':
+            df[col] = df[col].astype(object).where(df[col].notna(), None)
+        else:
+            df[col] = df[col].astype(dtype)
+    df.attrs = meta['attrs']
+    return df
+
+
+### Workers ###
+
+def _transform_partition(payload):
+    """Worker: transform one partition, keeping its row positions"""
+    df = from_ipc(payload) if pa is not None else payload
+    rows = df.pop(_ROW).to_numpy()
+    out = transform_train_movements(df)
+    out[_ROW] = rows
+    return to_ipc(out) if pa is not None else out
+
+
+def partition_by_train(df, partitions):
+    """
+    Split a frame into partitions with every row of a train in the same one.
+    Rows keep their original position in the _row column.
+    """
+    codes, _ = pd.factorize(df['TrainCode'])
+    # missing train codes all go to the first partition
+    part = np.where(codes < 0, 0, codes % partitions)
+    df = df.assign(**{_ROW: np.arange(len(df))})
+    return [df[part == i] for i in range(partitions) if (part == i).any()]
+
+
+def _merge_stats(parts):
+    """Combine the train type stats of the transformed partitions"""
+    stats = [p.attrs.get('train_type_stats') for p in parts if p.attrs.get('train_type_stats')]
+    if not stats:
+        return None
+    return {key: sum(s[key] for s in stats) for key in stats[0]}
+
+
+def _init_worker():
+    # per-partition progress lines from every worker would drown the parent's log
+    logging.getLogger('scripts.pipeline').setLevel(logging.WARNING)
+
+
+def _pool(workers):
+    # forkserver: workers do not inherit the locks of the fetch threads running in the parent
+    return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                               mp_context=multiprocessing.get_context('forkserver'))
+
+
+# Transform train movements across a process pool
+def transform_train_movements_parallel(df, workers=None):
+    """
+    Run transform_train_movements over TrainCode partitions in worker processes
+    and return the same frame the serial transform would (rows in input order,
+    one enhanced_at for the whole frame).
+    """
+    if df.empty:
+        return df
+
+    workers = workers or os.cpu_count() or 1
+    # built and saved here when missing, so the workers read the artifact rather than the stations table
+    get_station_registry()
+    parts = partition_by_train(df, workers * PARTITIONS_PER_WORKER)
+    payloads = [to_ipc(part) for part in parts] if pa is not None else parts
+
+    with _pool(workers) as pool:
+        results = list(pool.map(_transform_partition, payloads))
+    transformed = [from_ipc(result) for result in results] if pa is not None else results
+
+    out = pd.concat(transformed, ignore_index=True)
+    out = out.sort_values(_ROW, kind='stable').drop(columns=_ROW).reset_index(drop=True)
+    # every partition stamped its own time; the serial path stamps once, in
+    # the column's own dtype
+    if 'enhanced_at' in out.columns:
+        dtype = out['enhanced_at'].dtype
+        out['enhanced_at'] = pd.Series(pd.Timestamp.now(), index=out.index).astype(dtype)
+    stats = _merge_stats(transformed)
+    if stats:
+        out.attrs['train_type_stats'] = stats
+    return out
+
+
+def transform_train_movements_auto(df, workers=None):
+    """Serial transform for everyday frames, the process pool for large ones."""
+    if len(df) < PARALLEL_MIN_ROWS:
+        return transform_train_movements(df)
+    logger.info(f"Transforming {len(df)} movement rows across {workers or os.cpu_count()} processes")
+    return transform_train_movements_parallel(df, workers=workers)
+
+
+### Benchmark ###
+
+def _synthetic_raw_movements(rows, seed=0):
+    """Raw, string-typed movements as parse_train_movements returns them"""
+    rng = np.random.default_rng(seed)
+    stops = 20
+    trains = max(rows // stops, 1)
+    routes = [('Cork', 'Dublin Heuston'), ('Belfast', 'Dublin Connolly'), ('Howth', 'Bray'),
+              ('Limerick', 'Ennis'), ('Galway', 'Dublin Heuston'), ('Sligo', 'Dublin Connolly')]
+    route = rng.integers(0, len(routes), trains)
+    codes = np.array([f'{"AEDP"[i % 4]}{i:05d}' for i in range(trains)])
+    minutes = rng.integers(300, 1400, rows)
+    df = pd.DataFrame({
+        'TrainCode': np.repeat(codes, stops)[:rows],
+        'TrainDate': pd.Timestamp.now().strftime('%d %b %Y'),
+        'LocationCode': rng.choice(['CNLLY', 'PERSE', 'HSTON', 'KENT', 'GALWY'], rows),
+        'LocationFullName': rng.choice(['Dublin Connolly', 'Dublin Pearse', 'Cork', 'Galway'], rows),
+        'LocationOrder': np.tile(np.arange(1, stops + 1), trains)[:rows].astype(str),
+        'LocationType': 'S',
+        'TrainOrigin': np.repeat([routes[r][0] for r in route], stops)[:rows],
+        'TrainDestination': np.repeat([routes[r][1] for r in route], stops)[:rows],
+        'ScheduledArrival': [f'{m // 60:02d}:{m % 60:02d}:00' for m in minutes],
+        'ScheduledDeparture': [f'{m // 60:02d}:{m % 60 + 0:02d}:30' for m in minutes],
+        'arrival_actual': None,
+        'departure_actual': None,
+        'StopType': 'C',
+        'fetched_at': pd.Timestamp.now(),
+    })
+    for col in ['delay_minutes', 'train_category', 'route_classification', 'train_type_code',
+                'enhanced_at', 'route_type', 'train_type']:
+        df[col] = None
+    return df.astype({col: object for col in df.columns if col != 'fetched_at'})
+
+
+# Compare serial and parallel transforms
+def benchmark(rows=500000, worker_counts=(1, 2, 4, 8)):
+    """
+    Time the serial transform and the process pool at each worker count, and
+    check every parallel result is identical to the serial one.
+    """
+    logging.getLogger().setLevel(logging.WARNING)
+    raw = _synthetic_raw_movements(rows)
+
+    start = time.perf_counter()
+    serial = transform_train_movements(raw.copy())
+    serial_seconds = time.perf_counter() - start
+    print(f"{'serial':>10}: {serial_seconds:6.2f}s")
+
+    for workers in worker_counts:
+        start = time.perf_counter()
+        parallel = transform_train_movements_parallel(raw.copy(), workers=workers)
+        seconds = time.perf_counter() - start
+        # the two runs stamp different times, so enhanced_at must match in
+        # dtype and be one stamp per frame; the stamp itself is then aligned
+        stamped = (parallel['enhanced_at'].dtype == serial['enhanced_at'].dtype
+                   and parallel['enhanced_at'].nunique(dropna=False) == serial['enhanced_at'].nunique(dropna=False))
+        parallel['enhanced_at'] = serial['enhanced_at']
+        same = stamped and parallel.equals(serial)
+        print(f"{workers:>2} workers: {seconds:6.2f}s  speedup {serial_seconds / seconds:4.2f}x  "
+              f"identical={same}")
+
+
+if __name__ == '__main__':
+    import sys
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 500000)
@@ -2,21 +2,49 @@
 
 import pandas as pd
 import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import time
+from collections import Counter
 
-from .fetch_api import fetch_from_api
+from .fetch_api import fetch_from_api, RateLimiter, CircuitOpenError, API_BREAKER
 from .parse import parse_xml_to_df
 from .cleaning import *
 from .results_mapping import *
 from .helper_functions import *
 from .train_types import *
 from .insert import * 
+from .dag import run_dag
+from .analytics import delay_summary
+from .timeseries import (record_delay_observations, observations_from_current_trains,
+                         observations_from_movements)
+from .prediction import store_arrival_predictions, update_propagation_stats
+from .trips import record_trip_points
+from .validation import validate_stage, PRIMARY_KEYS
+from .loaders import get_loader
+from .movement_cache import changed_movements, remember_movements
+from .export import export_current_trains, export_movement_days
+from .station_registry import save_station_registry
 
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Station boards: minutes ahead to ask for, and how hard to poll the API
+STATION_BOARD_NUM_MINS = 90
+STATION_BOARD_WORKERS = 8
+STATION_BOARD_RATE = 5.0  # requests per second
+
+# Column deciding which copy of a repeated primary key is the freshest
+FRESHNESS_COLUMNS = {
+    'current_trains': 'collected_at',
+    'train_movements': 'fetched_at',
+}
+
+# Rows handed to each dataset's transform by this process, so a scheduled run
+# can tell a quiet API apart from rows that were fetched but never loaded
+EXTRACTED_ROWS = Counter()
 
 
 ### EXTRACT - Get data from API ###
@@ -49,42 +77,128 @@ def extract_current_trains():
         return pd.DataFrame()
 
 
+# get one typed variant of an endpoint
+def _fetch_typed(url, param, type_code, record_tag, field_map, type_col):
+    """Fetch a ?{param}={type_code} filtered endpoint and tag rows with the type"""
+    xml = fetch_from_api(url + f"?{param}={type_code}")
+    df = parse_xml_to_df(xml, record_tag, field_map)
+    df[type_col] = type_code
+    return df
+
+
+# get current trains tagged with their API train type
+def extract_current_trains_typed(type_codes=('D', 'S', 'M')):
+    """
+    Extract current trains from the D, S and M filtered endpoints concurrently.
+    TrainType holds the authoritative type code, so add_train_types only
+    runs its heuristics on trains the API leaves ambiguous.
+    """
+    try:
+        logger.info("Extracting typed current trains...")
+        with ThreadPoolExecutor(max_workers=len(type_codes)) as pool:
+            frames = list(pool.map(
+                lambda code: _fetch_typed(URL_CURRENT_TRAINS_WITH_TYPE, 'TrainType', code,
+                                          'objTrainPositions', FIELD_MAP_CURRENT_TRAINS_WITH_TYPE, 'TrainType'),
+                type_codes
+            ))
+        df = pd.concat(frames, ignore_index=True)
+        # keep the first (most specific) type if a train is listed twice
+        df = df.drop_duplicates(subset=['TrainCode', 'TrainDate'], keep='first').reset_index(drop=True)
+        logger.info(f"Extracted {len(df)} typed current trains: {df['TrainType'].value_counts().to_dict()}")
+        return df
+    except Exception as e:
+        logger.error(f"Failed to extract typed current trains: {e}")
+        return pd.DataFrame()
+
+
+# get stations tagged with their API station type
+def extract_stations_typed(type_codes=('D', 'S', 'M')):
+    """
+    Extract stations from the D, S and M filtered endpoints concurrently.
+    A station served by several types gets all of them, e.g. 'DM'.
+    """
+    try:
+        logger.info("Extracting typed station data...")
+        with ThreadPoolExecutor(max_workers=len(type_codes)) as pool:
+            frames = list(pool.map(
+                lambda code: _fetch_typed(URL_STATIONS_WITH_TYPE, 'StationType', code,
+                                          'objStation', FIELD_MAP_STATIONS_WITH_TYPE, 'StationType'),
+                type_codes
+            ))
+        df = pd.concat(frames, ignore_index=True)
+        types = df.groupby('StationCode', sort=False)['StationType'].agg(''.join)
+        df = df.drop_duplicates(subset=['StationCode'], keep='first').reset_index(drop=True)
+        df['StationType'] = df['StationCode'].map(types)
+        logger.info(f"Extracted {len(df)} typed stations")
+        return df
+    except Exception as e:
+        logger.error(f"Failed to extract typed stations: {e}")
+        return pd.DataFrame()
+
+
+# build the movements URL for one train
+def train_movements_url(train_code, train_date):
+    """Build the getTrainMovementsXML URL for a train on a given date"""
+    # Handle case where TrainDate is a string or datetime
+    if isinstance(train_date, str):
+        # If it's already a string, use it directly
+        formatted_date = train_date
+    else:
+        # If it's a datetime, format it
+        formatted_date = train_date.strftime('%d %b %Y')
+    
+    return URL_TRAIN_MOVEMENTS + f"?TrainId={train_code}&TrainDate={formatted_date}"
+
+
+# parse the movements XML for one train
+def parse_train_movements(xml):
+    """Parse a getTrainMovementsXML response and stamp the fetch time"""
+    df = parse_xml_to_df(xml, 'objTrainMovements', FIELD_MAP_TRAIN_MOVEMENTS)
+    if not df.empty:
+        df['fetched_at'] = pd.Timestamp.now()
+    return df
+
+
+# get train movements for one train
+def fetch_train_movements(train_code, train_date):
+    """Fetch and parse the movements of a single train"""
+    xml = fetch_from_api(train_movements_url(train_code, train_date))
+    return parse_train_movements(xml)
+
+
 # get train movements
-def extract_train_movements():
-    """Extract train movements for all current trains"""
+def extract_train_movements(trains_df=None):
+    """
+    Extract train movements for all current trains.
+    Pass an already extracted current trains frame to avoid fetching it twice.
+    """
     try:
         logger.info("Extracting train movements...")
         
         # First get current trains to know which movements to fetch
-        trains_df = extract_current_trains()
+        if trains_df is None:
+            trains_df = extract_current_trains()
         if trains_df.empty:
             return pd.DataFrame()
         
         all_movements = []
         
-        for row in trains_df.itertuples():
+        for position, row in enumerate(trains_df.itertuples()):
             train_code = row.TrainCode
             train_date = row.TrainDate
             
             try:
-                # Handle case where TrainDate is a string or datetime
-                if isinstance(train_date, str):
-                    # If it's already a string, use it directly
-                    formatted_date = train_date
-                else:
-                    # If it's a datetime, format it
-                    formatted_date = train_date.strftime('%d %b %Y')
-                
-                url = URL_TRAIN_MOVEMENTS + f"?TrainId={train_code}&TrainDate={formatted_date}"
-                xml = fetch_from_api(url)
-                df = parse_xml_to_df(xml, 'objTrainMovements', FIELD_MAP_TRAIN_MOVEMENTS)
+                df = fetch_train_movements(train_code, train_date)
                 
                 if not df.empty:
-                    df['fetched_at'] = pd.Timestamp.now()
                     all_movements.append(df)
                 
                 time.sleep(0.2)  # Rate limiting
                 
+            except CircuitOpenError as e:
+                # keep what was fetched; the rest would only fail fast one by one
+                logger.warning(f"{e} - skipping movements for the remaining {len(trains_df) - position} trains")
+                break
             except Exception as e:
                 logger.warning(f"Failed to get movements for {train_code}: {e}")
                 continue
@@ -102,6 +216,64 @@ def extract_train_movements():
 
 
 
+# get the board for one station
+def fetch_station_board(station_code, num_mins=STATION_BOARD_NUM_MINS):
+    """Fetch and parse the trains due at one station in the next num_mins minutes"""
+    url = URL_STATION_DATA_BY_CODE_WITH_MINUTES + f"?StationCode={station_code}&NumMins={num_mins}"
+    xml = fetch_from_api(url)
+    return parse_xml_to_df(xml, 'objStationData', FIELD_MAP_STATION_DATA_BY_CODE_WITH_MINUTES)
+
+
+# get station boards
+def extract_station_boards(station_codes=None, num_mins=STATION_BOARD_NUM_MINS,
+                           workers=STATION_BOARD_WORKERS, rate=STATION_BOARD_RATE):
+    """
+    Extract station boards for all stations, or a hot subset.
+    The subset comes from station_codes or the comma separated
+    STATION_BOARD_CODES environment variable.
+    """
+    try:
+        if station_codes is None and os.getenv("STATION_BOARD_CODES"):
+            station_codes = [code.strip() for code in os.getenv("STATION_BOARD_CODES").split(',') if code.strip()]
+        if station_codes is None:
+            stations_df = extract_stations()
+            if stations_df.empty:
+                return pd.DataFrame()
+            station_codes = stations_df['StationCode'].dropna().str.strip().unique().tolist()
+        
+        logger.info(f"Extracting station boards for {len(station_codes)} stations...")
+        start = time.perf_counter()
+        limiter = RateLimiter(rate)
+        
+        def fetch(station_code):
+            limiter.acquire()
+            try:
+                return fetch_station_board(station_code, num_mins)
+            except CircuitOpenError:
+                return pd.DataFrame()
+            except Exception as e:
+                logger.warning(f"Failed to get station board for {station_code}: {e}")
+                return pd.DataFrame()
+        
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            boards = [df for df in pool.map(fetch, station_codes) if not df.empty]
+        
+        duration = time.perf_counter() - start
+        if API_BREAKER.rejected:
+            logger.warning(f"Skipped {API_BREAKER.rejected} station board requests while the API circuit was open")
+        if not boards:
+            logger.info(f"No station board rows returned ({duration:.1f}s)")
+            return pd.DataFrame()
+        
+        combined_df = pd.concat(boards, ignore_index=True)
+        logger.info(f"Extracted {len(combined_df)} station board rows from {len(station_codes)} stations "
+                    f"in {duration:.1f}s")
+        return combined_df
+        
+    except Exception as e:
+        logger.error(f"Failed to extract station boards: {e}")
+        return pd.DataFrame()
+
 
 ### TRANSFORM - Clean and transform data ###
 
@@ -142,11 +314,16 @@ def transform_current_trains(df):
     # Add extra fields
     df = add_extra_fields(df)
     df = add_train_types(df)
+    log_train_type_stats(df)
     
     # Add collection timestamp
     df['collected_at'] = pd.Timestamp.now()
     
     logger.info(f"Enhanced {len(df)} current trains with delay/type information")
+    stats = delay_summary(df['delay_minutes'])
+    if stats['count']:
+        logger.info(f"Delays: {stats['on_time_pct']:.1f}% on time, mean {stats['mean']:.1f} min, "
+                    f"p95 {stats['p95']:.0f} min, {stats['severely_delayed']} severely delayed")
     return df
 
 
@@ -178,61 +355,269 @@ def transform_train_movements(df):
 
 
 
+# clean station boards
+def transform_station_boards(df):
+    """Transform station board data into typed columns"""
+    if df.empty:
+        return df
+    
+    logger.info("Transforming station board data...")
+    
+    text_cols = ['TrainCode', 'StationFullName', 'StationCode', 'Origin', 'Destination',
+                 'Status', 'LastLocation', 'Direction', 'TrainType', 'LocationType']
+    df = object_tostring(df, text_cols)
+    df = remove_whitespace(df, text_cols)
+    df = object_to_datetime(df, ['ServerTime'])
+    df = object_to_date(df, ['TrainDate'])
+    df = object_to_time(df, ['QueryTime'])
+    df = object_to_time(df, ['OriginTime', 'DestinationTime', 'ExpArrival', 'ExpDepart',
+                             'SchArrival', 'SchDepart'], time_format='%H:%M')
+    df = object_to_integer(df, ['DueIn', 'Late'])
+    
+    # remove string "NaT" and "NaN" values
+    df = clean_nat(df)
+    
+    df['collected_at'] = pd.Timestamp.now()
+    return df
+
+# report how many rows the typed API resolved
+def log_train_type_stats(df):
+    """Log the share of rows typed by the API and the heuristic time that saved"""
+    stats = df.attrs.get('train_type_stats')
+    if not stats or not stats['rows']:
+        return
+    
+    share = stats['api_resolved'] / stats['rows'] * 100
+    per_row = stats['seconds'] / max(stats['heuristic_rows'], 1)
+    saved = per_row * stats['api_resolved']
+    logger.info(f"Train types: {stats['api_resolved']}/{stats['rows']} rows ({share:.0f}%) typed by the API, "
+                f"heuristics took {stats['seconds'] * 1000:.1f}ms, ~{saved * 1000:.1f}ms saved")
+
+
+# drop repeated primary keys before they reach the upsert
+def dedupe_for_load(df, dataset):
+    """Keep the freshest row of each primary key, logging how many rows were dropped"""
+    if df.empty:
+        return df
+    df, dropped = dedupe_keys(df, PRIMARY_KEYS[dataset], FRESHNESS_COLUMNS.get(dataset))
+    if dropped:
+        logger.info(f"Dropped {dropped} duplicate {dataset} rows, {len(df)} left")
+    return df
+
+
+# transform then validate, so the validation cost is logged against the transform
+def transform_and_validate(transform, df, dataset):
+    """Run a transform, dedup and the validation stage, returning only rows safe to load"""
+    EXTRACTED_ROWS[dataset] += len(df)
+    start = time.perf_counter()
+    df = dedupe_for_load(transform(df), dataset)
+    return validate_stage(df, dataset, transform_seconds=time.perf_counter() - start)
+
 
 ### LOAD - Insert into database ###
 
 # Insert stations into DB
 def load_stations(df):
-    """Load stations into database"""
+    """Load stations into database, returning False if the load failed"""
     if df.empty:
-        return
+        return True
     
     try:
-        insert_data(df, 'stations')
+        get_loader().load(df, 'stations')
         logger.info(f"Loaded {len(df)} stations to database")
     except Exception as e:
         logger.error(f"Failed to load stations: {e}")
+        return False
+    
+    after_stations_load(df)
+    return True
+
+
+# local artifacts built from loaded stations
+def after_stations_load(df):
+    """Rebuild the station metadata registry from the stations just loaded"""
+    if df.empty:
+        return
+    
+    run_optional("build station registry", save_station_registry, df)
 
 
 # Insert current trains into DB
 def load_current_trains(df):
-    """Load current trains into database"""
+    """Load current trains into database, returning False if the load failed"""
     if df.empty:
-        return
+        return True
     
     try:
-        insert_data(df, 'current_trains')
+        get_loader().load(df, 'current_trains')
         logger.info(f"Loaded {len(df)} current trains to database")
     except Exception as e:
         logger.error(f"Failed to load current trains: {e}")
+        return False
+    
+    after_current_trains_load(df)
+    return True
+
+
+# secondary tables fed by a loaded current trains snapshot
+def after_current_trains_load(df):
+    """Record delay observations, arrival predictions and trip points for loaded current trains"""
+    if df.empty or not get_loader().sidecars:
+        return
+    
+    run_optional("record delay observations", record_delay_observations, observations_from_current_trains(df))
+    run_optional("predict arrivals", store_arrival_predictions, df)
+    run_optional("record trip points", record_trip_points, df)
+    run_optional("export current trains snapshot", export_current_trains, df)
 
 
 # insert train movements into DB
 def load_train_movements(df):
-    """Load train movements into database"""
+    """Load train movements into database, returning False if the load failed"""
     if df.empty:
-        return
+        return True
     
     try:
-        insert_data(df, 'train_movements')
+        get_loader().load(df, 'train_movements')
         logger.info(f"Loaded {len(df)} train movements to database")
     except Exception as e:
         logger.error(f"Failed to load train movements: {e}")
+        return False
+    
+    after_train_movements_load(df)
+    return True
+
+
+# secondary tables fed by loaded train movements
+def after_train_movements_load(df):
+    """Record delay observations and update propagation stats for loaded movements"""
+    if df.empty or not get_loader().sidecars:
+        return
+    
+    run_optional("record delay observations", record_delay_observations, observations_from_movements(df))
+    run_optional("update delay propagation stats", update_propagation_stats, df)
+    run_optional("export finished movement days", export_movement_days)
+
+
+# load all three datasets together
+def load_all(stations_df, trains_df, movements_df):
+    """
+    Load stations, current trains and movements in one transaction through the
+    load coordinator, then feed the secondary tables.
+    Raises if the load fails, since nothing was written.
+    """
+    stats = get_loader().load_many({
+        'stations': stations_df,
+        'current_trains': trains_df,
+        'train_movements': movements_df,
+    })
+    for table_name, stat in stats.items():
+        logger.info(f"Loaded {stat['rows']} {table_name} rows at {stat['rows_per_sec']:,.0f} rows/s")
+    
+    after_stations_load(stations_df)
+    after_current_trains_load(trains_df)
+    after_train_movements_load(movements_df)
+    return stats
+
+
+# post-load steps that must not fail the load itself
+def run_optional(step_name, func, *args):
+    """Run a secondary step after a load, logging instead of raising on failure"""
+    try:
+        return func(*args)
+    except Exception as e:
+        logger.warning(f"Failed to {step_name}: {e}")
+
+
+# insert station boards into DB
+def load_station_boards(df):
+    """Load station boards into database, returning False if the load failed"""
+    if df.empty:
+        return True
+    
+    try:
+        get_loader().load(df, 'station_boards')
+        logger.info(f"Loaded {len(df)} station board rows to database")
+    except Exception as e:
+        logger.error(f"Failed to load station boards: {e}")
+        return False
+    return True
+
+
+# the run_* functions raise on a failed load, so the run is not recorded as succeeded
+def _require_loaded(loaded, dataset):
+    if not loaded:
+        raise RuntimeError(f"Failed to load {dataset}")
 
 
 def run_stations_etl():
     df = extract_stations()
-    df = transform_stations(df)
-    load_stations(df)
+    df = transform_and_validate(transform_stations, df, 'stations')
+    _require_loaded(load_stations(df), 'stations')
 
 
 def run_current_trains_etl():
     df = extract_current_trains()
-    df = transform_current_trains(df)
-    load_current_trains(df)
+    df = transform_and_validate(transform_current_trains, df, 'current_trains')
+    _require_loaded(load_current_trains(df), 'current_trains')
+    return df
 
 
 def run_train_movements_etl():
-    df = extract_train_movements()
-    df = transform_train_movements(df)
-    load_train_movements(df)
\ No newline at end of file
+    raw = extract_train_movements()
+    # only stops that changed since the last fetch are transformed and loaded
+    df = changed_movements(raw)
+    df = transform_and_validate(transform_train_movements, df, 'train_movements')
+    _require_loaded(load_train_movements(df), 'train_movements')
+    remember_movements(raw)
+
+
+def run_current_trains_typed_etl():
+    df = extract_current_trains_typed()
+    df = transform_and_validate(transform_current_trains, df, 'current_trains')
+    _require_loaded(load_current_trains(df), 'current_trains')
+
+
+def run_stations_typed_etl():
+    df = extract_stations_typed()
+    df = transform_and_validate(transform_stations, df, 'stations')
+    _require_loaded(load_stations(df), 'stations')
+
+
+def run_station_boards_etl():
+    start = time.perf_counter()
+    df = extract_station_boards()
+    EXTRACTED_ROWS['station_boards'] += len(df)
+    df = transform_station_boards(df)
+    _require_loaded(load_station_boards(df), 'station_boards')
+    logger.info(f"Station boards ETL finished in {time.perf_counter() - start:.1f}s")
+
+
+def run_all_etl():
+    """
+    Run all three ETLs as one DAG.
+    Stations, current trains and movements are extracted and transformed side
+    by side, the movements branch reuses the current trains fetch, and all
+    three are loaded together in a single transaction.
+    """
+    stages = {
+        'extract_stations'        : (extract_stations, []),
+        'transform_stations'      : (lambda df: transform_and_validate(transform_stations, df, 'stations'),
+                                     ['extract_stations']),
+        'extract_current_trains'  : (extract_current_trains, []),
+        # transforms modify their input, so work on a copy of the shared fetch
+        'transform_current_trains': (lambda df: transform_and_validate(transform_current_trains, df.copy(), 'current_trains'),
+                                     ['extract_current_trains']),
+        'extract_train_movements' : (extract_train_movements, ['extract_current_trains']),
+        'changed_train_movements' : (changed_movements, ['extract_train_movements']),
+        'transform_train_movements': (lambda df: transform_and_validate(transform_train_movements, df, 'train_movements'),
+                                      ['changed_train_movements']),
+        'load_all'                : (load_all, ['transform_stations', 'transform_current_trains',
+                                                'transform_train_movements']),
+    }
+
+    results, timings, errors = run_dag(stages)
+    if errors:
+        raise RuntimeError(f"ETL stages failed: {', '.join(sorted(errors))}")
+    remember_movements(results['extract_train_movements'])
+    return results
@@ -0,0 +1,255 @@
+# scripts/prediction.py
+# Arrival-time prediction from delay propagation statistics of past movements
+#
+# For every (route, station, scheduled hour) we keep the running mean and
+# variance of how much delay a train gains or loses arriving at that stop
+# compared with its previous stop. A train's expected delay at an upcoming
+# stop is its current delay plus the mean changes of the stops in between.
+import logging
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text, table, column
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from .insert import engine
+from .timeseries import movement_stop_delays
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_SQL = [
+    '''
+    CREATE TABLE IF NOT EXISTS delay_propagation_stats (
+        route       text             NOT NULL,
+        station     text             NOT NULL,
+        hour        smallint         NOT NULL,
+        n           bigint           NOT NULL,
+        mean_delta  double precision NOT NULL,
+        m2          double precision NOT NULL,
+        updated_at  timestamp,
+        PRIMARY KEY (route, station, hour)
+    )
+    ''',
+    # stops already folded into the statistics, so re-fetched journeys are not counted twice
+    '''
+    CREATE TABLE IF NOT EXISTS delay_propagation_seen (
+        "TrainCode"     text    NOT NULL,
+        "TrainDate"     date    NOT NULL,
+        "LocationOrder" integer NOT NULL,
+        PRIMARY KEY ("TrainCode", "TrainDate", "LocationOrder")
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS arrival_predictions (
+        "TrainCode"        text NOT NULL,
+        "TrainDate"        date NOT NULL,
+        "LocationOrder"    integer,
+        "LocationCode"     text,
+        "ScheduledArrival" time,
+        expected_delay     double precision,
+        expected_arrival   timestamp,
+        predicted_at       timestamp
+    )
+    ''',
+]
+
+# Chan et al. parallel update of count, mean and sum of squared deviations
+MERGE_STATS_SQL = '''
+    INSERT INTO delay_propagation_stats AS s (route, station, hour, n, mean_delta, m2, updated_at)
+    VALUES (:route, :station, :hour, :n, :mean_delta, :m2, :updated_at)
+    ON CONFLICT (route, station, hour) DO UPDATE SET
+        n          = s.n + EXCLUDED.n,
+        mean_delta = s.mean_delta + (EXCLUDED.mean_delta - s.mean_delta) * EXCLUDED.n / (s.n + EXCLUDED.n),
+        m2         = s.m2 + EXCLUDED.m2
+                     + (EXCLUDED.mean_delta - s.mean_delta) ^ 2 * s.n * EXCLUDED.n / (s.n + EXCLUDED.n),
+        updated_at = EXCLUDED.updated_at
+'''
+
+UPCOMING_STOPS_SQL = '''
+    SELECT "TrainCode", "TrainDate", "LocationOrder", "LocationCode",
+           "TrainOrigin", "TrainDestination", "ScheduledArrival"
+    FROM train_movements
+    WHERE "TrainDate" = :train_date
+      AND arrival_actual IS NULL
+      AND "ScheduledArrival" IS NOT NULL
+      AND "TrainCode" = ANY(:codes)
+'''
+
+_SCHEMA_READY = False
+_STATS = None
+
+
+def ensure_prediction_schema():
+    """Create the prediction tables if they do not exist."""
+    global _SCHEMA_READY
+    if _SCHEMA_READY:
+        return
+    with engine.begin() as conn:
+        for statement in SCHEMA_SQL:
+            conn.execute(text(statement))
+    _SCHEMA_READY = True
+
+
+def route_key(origins, destinations):
+    """Route key used by the statistics, e.g. 'Cork->Dublin Heuston'"""
+    return origins.astype('string').str.strip() + '->' + destinations.astype('string').str.strip()
+
+
+def _scheduled_hour(scheduled):
+    """Hour of day of a column of scheduled times"""
+    return pd.to_timedelta(scheduled.astype(str), errors='coerce').dt.components['hours']
+
+
+### Statistics ###
+
+def stop_delay_deltas(df):
+    """
+    Change in delay at every arrived stop compared with the train's previous
+    arrived stop (the first stop counts its whole delay).
+    """
+    arrived = movement_stop_delays(df)
+    if arrived.empty:
+        return arrived
+
+    arrived = arrived.dropna(subset=['stop_delay', 'LocationOrder']).copy()
+    arrived['LocationOrder'] = arrived['LocationOrder'].astype(int)
+    arrived = arrived.sort_values(['TrainCode', 'TrainDate', 'LocationOrder'])
+    previous = arrived.groupby(['TrainCode', 'TrainDate'])['stop_delay'].shift()
+    arrived['delta'] = arrived['stop_delay'] - previous.fillna(0)
+    arrived['route'] = route_key(arrived['TrainOrigin'], arrived['TrainDestination'])
+    arrived['hour'] = _scheduled_hour(arrived['ScheduledArrival'])
+    return arrived.dropna(subset=['route', 'hour'])
+
+
+def update_propagation_stats(df):
+    """
+    Fold the newly arrived stops of a movements batch into the statistics.
+    Stops seen in an earlier load are skipped, so each stop is counted once.
+    """
+    global _STATS
+    deltas = stop_delay_deltas(df)
+    if deltas.empty:
+        return 0
+
+    ensure_prediction_schema()
+    keys = deltas[['TrainCode', 'TrainDate', 'LocationOrder']].copy()
+    keys['TrainDate'] = pd.to_datetime(keys['TrainDate']).dt.date
+    keys = keys.drop_duplicates()
+    seen = table('delay_propagation_seen', column('TrainCode'), column('TrainDate'), column('LocationOrder'))
+
+    with engine.begin() as conn:
+        stmt = (pg_insert(seen).values(keys.to_dict('records')).on_conflict_do_nothing()
+                .returning(seen.c.TrainCode, seen.c.TrainDate, seen.c.LocationOrder))
+        new_keys = pd.DataFrame(conn.execute(stmt).fetchall(), columns=['TrainCode', 'TrainDate', 'LocationOrder'])
+        if new_keys.empty:
+            return 0
+
+        deltas['TrainDate'] = pd.to_datetime(deltas['TrainDate']).dt.date
+        new = deltas.merge(new_keys, on=['TrainCode', 'TrainDate', 'LocationOrder'])
+        grouped = new.groupby(['route', 'LocationCode', 'hour'])['delta']
+        batch = pd.DataFrame({
+            'n': grouped.count(),
+            'mean_delta': grouped.mean(),
+            'm2': grouped.var(ddof=0) * grouped.count()
+        }).reset_index().rename(columns={'LocationCode': 'station'})
+        batch['hour'] = batch['hour'].astype(int)
+        batch['updated_at'] = pd.Timestamp.now().to_pydatetime()
+
+        conn.execute(text(MERGE_STATS_SQL), batch.to_dict('records'))
+
+    _STATS = None  # reload on next prediction
+    logger.info(f"Updated delay propagation stats with {len(new)} new stops ({len(batch)} keys)")
+    return len(new)
+
+
+def load_propagation_stats():
+    """
+    Load the statistics table once per process (it only has a row per
+    route, station and hour).
+    """
+    global _STATS
+    if _STATS is None:
+        ensure_prediction_schema()
+        with engine.connect() as conn:
+            _STATS = pd.read_sql(text('SELECT route, station, hour, n, mean_delta FROM delay_propagation_stats'), conn)
+    return _STATS
+
+
+### Prediction ###
+
+def predict_arrivals(trains_df, upcoming, stats):
+    """
+    Expected delay and arrival time at every upcoming stop of every current train.
+
+    Args:
+        trains_df (DataFrame): Current trains with TrainCode and delay_minutes.
+        upcoming (DataFrame): Not yet reached stops from train_movements.
+        stats (DataFrame): route, station, hour, n, mean_delta.
+
+    Returns:
+        DataFrame: One row per upcoming stop with expected_delay and expected_arrival.
+    """
+    if upcoming.empty:
+        return pd.DataFrame()
+
+    stops = upcoming.copy()
+    stops['LocationOrder'] = pd.to_numeric(stops['LocationOrder'], errors='coerce')
+    stops = stops.sort_values(['TrainCode', 'LocationOrder'], kind='stable').reset_index(drop=True)
+    stops['route'] = route_key(stops['TrainOrigin'], stops['TrainDestination'])
+    stops['hour'] = _scheduled_hour(stops['ScheduledArrival']).astype(float)
+
+    # route-specific statistic, falling back to the station/hour mean over all routes
+    stats = stats.astype({'hour': float})
+    route_stats = stats[['route', 'station', 'hour', 'mean_delta']]
+    station_stats = (stats.assign(weighted=stats['mean_delta'] * stats['n'])
+                     .groupby(['station', 'hour'])[['weighted', 'n']].sum())
+    station_stats = (station_stats['weighted'] / station_stats['n']).rename('station_delta').reset_index()
+
+    stops = stops.merge(route_stats, left_on=['route', 'LocationCode', 'hour'],
+                        right_on=['route', 'station', 'hour'], how='left').drop(columns='station')
+    stops = stops.merge(station_stats, left_on=['LocationCode', 'hour'],
+                        right_on=['station', 'hour'], how='left').drop(columns='station')
+    delta = stops['mean_delta'].fillna(stops['station_delta']).fillna(0.0)
+
+    current_delay = (trains_df.drop_duplicates('TrainCode').set_index('TrainCode')['delay_minutes']
+                     .astype(float))
+    stops['expected_delay'] = (stops['TrainCode'].map(current_delay).fillna(0.0).to_numpy()
+                               + delta.groupby(stops['TrainCode']).cumsum().to_numpy())
+
+    scheduled = (pd.to_datetime(stops['TrainDate'])
+                 + pd.to_timedelta(stops['ScheduledArrival'].astype(str), errors='coerce'))
+    stops['expected_arrival'] = scheduled + pd.to_timedelta(np.round(stops['expected_delay'] * 60), unit='s')
+    stops['predicted_at'] = pd.Timestamp.now()
+
+    return stops[['TrainCode', 'TrainDate', 'LocationOrder', 'LocationCode', 'ScheduledArrival',
+                  'expected_delay', 'expected_arrival', 'predicted_at']]
+
+
+def store_arrival_predictions(trains_df):
+    """
+    Predict arrivals for the current trains snapshot and replace today's predictions.
+    """
+    if trains_df.empty:
+        return 0
+
+    start = time.perf_counter()
+    ensure_prediction_schema()
+    train_date = pd.Timestamp.now().date()
+    codes = trains_df['TrainCode'].dropna().astype(str).unique().tolist()
+
+    with engine.connect() as conn:
+        upcoming = pd.read_sql(text(UPCOMING_STOPS_SQL), conn, params={'train_date': train_date, 'codes': codes})
+
+    predictions = predict_arrivals(trains_df, upcoming, load_propagation_stats())
+    if predictions.empty:
+        return 0
+
+    with engine.begin() as conn:
+        conn.execute(text('DELETE FROM arrival_predictions WHERE "TrainDate" = :today'), {'today': train_date})
+        predictions.to_sql('arrival_predictions', con=conn, index=False, if_exists='append',
+                           method='multi', chunksize=1000)
+
+    logger.info(f"Predicted {len(predictions)} upcoming arrivals for {len(codes)} trains "
+                f"in {time.perf_counter() - start:.2f}s")
+    return len(predictions)
@@ -0,0 +1,218 @@
+# scripts/runs.py
+# Run ledger and cross-process locks, so overlapping cron runs never load the same data twice
+#
+# Every scheduled run takes a Postgres advisory lock for each table it writes
+# before it starts. A run whose tables are locked by another process exits at
+# once instead of waiting, since the other process is doing the same work.
+# With the locks held, the run claims its slot in etl_runs: the job name and
+# its start time floored to the job's schedule interval. A slot that already
+# succeeded is not run again; one that failed or ran degraded is retried, and
+# one still marked running belongs to a process that died, as its locks are free.
+import json
+import logging
+import os
+import socket
+import uuid
+import zlib
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+from sqlalchemy import text
+
+from .insert import engine
+from .loaders import get_loader
+
+logger = logging.getLogger(__name__)
+
+# Set RUN_LEDGER=0 to run without locks or the ledger, e.g. when debugging by hand
+RUN_LEDGER = os.getenv('RUN_LEDGER', '1') != '0'
+
+# First key of every advisory lock taken here, so they cannot collide with other users
+LOCK_NAMESPACE = 0x4952  # 'IR'
+
+SCHEMA_SQL = [
+    '''
+    CREATE TABLE IF NOT EXISTS etl_runs (
+        run_id      text      PRIMARY KEY,
+        job         text      NOT NULL,
+        slot        timestamp NOT NULL,
+        datasets    text      NOT NULL,
+        status      text      NOT NULL,
+        attempts    integer   NOT NULL DEFAULT 1,
+        started_at  timestamp NOT NULL,
+        finished_at timestamp,
+        rows        jsonb,
+        details     jsonb,
+        error       text,
+        host        text,
+        pid         integer,
+        UNIQUE (job, slot)
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS etl_runs_started_idx ON etl_runs (started_at)',
+]
+
+# Take the slot unless it already succeeded; the run that took it last owns it
+CLAIM_SQL = '''
+    INSERT INTO etl_runs (run_id, job, slot, datasets, status, started_at, host, pid)
+    VALUES (:run_id, :job, :slot, :datasets, 'running', :started_at, :host, :pid)
+    ON CONFLICT (job, slot) DO UPDATE
+        SET run_id = EXCLUDED.run_id, status = 'running', attempts = etl_runs.attempts + 1,
+            started_at = EXCLUDED.started_at, finished_at = NULL, rows = NULL, details = NULL,
+            error = NULL, host = EXCLUDED.host, pid = EXCLUDED.pid
+        WHERE etl_runs.status <> 'succeeded'
+    RETURNING run_id, attempts
+'''
+
+FINISH_SQL = '''
+    UPDATE etl_runs
+    SET status = :status, finished_at = :finished_at, rows = CAST(:rows AS jsonb),
+        details = CAST(:details AS jsonb), error = :error
+    WHERE run_id = :run_id
+'''
+
+
+_SCHEMA_READY = False
+
+
+def ensure_ledger_schema(conn):
+    """Create the ledger table if it does not exist."""
+    global _SCHEMA_READY
+    if _SCHEMA_READY:
+        return
+    # concurrent CREATE TABLE IF NOT EXISTS can still collide, so first runs take turns
+    conn.execute(text('SELECT pg_advisory_xact_lock(:namespace, 0)'), {'namespace': LOCK_NAMESPACE})
+    for statement in SCHEMA_SQL:
+        conn.execute(text(statement))
+    conn.commit()
+    _SCHEMA_READY = True
+
+
+def ledger_enabled():
+    """Locks and the ledger need Postgres"""
+    return RUN_LEDGER and get_loader().sidecars
+
+
+def slot_for(now, slot_minutes):
+    """Start of the schedule slot now falls in, counting from midnight"""
+    minutes = (now.hour * 60 + now.minute) // slot_minutes * slot_minutes
+    return now.replace(hour=minutes // 60, minute=minutes % 60, second=0, microsecond=0)
+
+
+def lock_key(dataset):
+    """Stable signed 32-bit advisory lock key for a table name"""
+    key = zlib.crc32(dataset.encode())
+    return key - (1 << 32) if key >= (1 << 31) else key
+
+
+def loaded_rows():
+    """Rows written per table by this process so far"""
+    return Counter(get_loader().loaded or {})
+
+
+def unloaded_datasets(datasets, extracted, loaded):
+    """Tables of a run that had rows extracted for them but none written"""
+    return [dataset for dataset in datasets if extracted.get(dataset, 0) > 0 and not loaded.get(dataset)]
+
+
+class Run:
+    """A claimed slot: record how it ended with finish()."""
+
+    def __init__(self, job, slot, run_id=None, conn=None):
+        self.job = job
+        self.slot = slot
+        self.run_id = run_id
+        self.conn = conn
+        self.status = 'running'
+        self._rows_before = loaded_rows()
+
+    def rows(self):
+        """Rows written per table since the run was claimed"""
+        return dict(loaded_rows() - self._rows_before)
+
+    def finish(self, status, details=None, error=None):
+        """Record the run's status ('succeeded', 'degraded' or 'failed'), rows and details."""
+        self.status = status
+        if self.conn is None:
+            return
+        self.conn.execute(text(FINISH_SQL), {
+            'run_id': self.run_id, 'status': status, 'finished_at': datetime.now(),
+            'rows': json.dumps(self.rows()), 'details': json.dumps(details or {}, default=str),
+            'error': error})
+        self.conn.commit()
+
+
+def _try_locks(conn, datasets):
+    """Take every table's advisory lock or none, in sorted order so runs cannot deadlock"""
+    taken = []
+    for key in sorted({lock_key(dataset) for dataset in datasets}):
+        if not conn.execute(text('SELECT pg_try_advisory_lock(:namespace, :key)'),
+                            {'namespace': LOCK_NAMESPACE, 'key': key}).scalar():
+            _release_locks(conn, taken)
+            return None
+        taken.append(key)
+    return taken
+
+
+def _release_locks(conn, keys):
+    for key in keys:
+        conn.execute(text('SELECT pg_advisory_unlock(:namespace, :key)'), {'namespace': LOCK_NAMESPACE, 'key': key})
+
+
+# Claim a run slot for a scheduled job
+@contextmanager
+def claimed_run(job, datasets, slot_minutes, now=None):
+    """
+    Lock the job's tables and claim its slot in the run ledger.
+
+    Args:
+        job (str): Name of the scheduled job, e.g. "Train Movements".
+        datasets (list): Tables the job writes.
+        slot_minutes (int): The job's schedule interval.
+
+    Yields:
+        Run | None: The claimed run, or None when another process holds the
+        tables or the slot has already succeeded. A run left running when the
+        block exits, e.g. on an exception, is recorded as failed.
+    """
+    now = now or datetime.now()
+    slot = slot_for(now, slot_minutes)
+    if not ledger_enabled():
+        yield Run(job, slot)
+        return
+
+    with engine.connect() as conn:
+        # one session holds the locks for the whole run; the ledger is written
+        # through it too, committed after each statement
+        ensure_ledger_schema(conn)
+
+        keys = _try_locks(conn, datasets)
+        if keys is None:
+            logger.info(f"{job}: {', '.join(datasets)} locked by another run - exiting")
+            yield None
+            return
+
+        try:
+            claimed = conn.execute(text(CLAIM_SQL), {
+                'run_id': str(uuid.uuid4()), 'job': job, 'slot': slot, 'datasets': ','.join(datasets),
+                'started_at': now, 'host': socket.gethostname(), 'pid': os.getpid()}).fetchone()
+            conn.commit()
+            if claimed is None:
+                logger.info(f"{job}: slot {slot:%Y-%m-%d %H:%M} already done - exiting")
+                yield None
+                return
+            if claimed[1] > 1:
+                logger.info(f"{job}: retrying slot {slot:%Y-%m-%d %H:%M} (attempt {claimed[1]})")
+
+            run = Run(job, slot, run_id=claimed[0], conn=conn)
+            try:
+                yield run
+            finally:
+                if run.status == 'running':
+                    conn.rollback()
+                    run.finish('failed', error='run did not finish')
+        finally:
+            conn.rollback()
+            _release_locks(conn, keys)
+            conn.commit()
@@ -2,8 +2,15 @@
 import os
 import sys
 import logging
+from collections import Counter
 from datetime import datetime
-from .pipeline import (run_current_trains_etl, run_train_movements_etl, run_stations_etl)
+from .pipeline import (EXTRACTED_ROWS, run_current_trains_etl, run_train_movements_etl, run_stations_etl, run_all_etl,
+                       run_station_boards_etl, run_current_trains_typed_etl, run_stations_typed_etl)
+from .streaming import run_train_movements_etl_streaming
+from .adaptive import run_adaptive_current_trains, run_adaptive_loop
+from .fetch_api import API_BREAKER
+from .memo import log_memo_stats
+from .runs import claimed_run, unloaded_datasets
 
 # Logging setup
 logging.basicConfig(
@@ -25,22 +32,65 @@ def run_etl_based_on_schedule():
     elif minute % 15 == 0:
         # Every 15 minutes: run train movements
         run_etl_with_logging(run_train_movements_etl, "Train Movements")
-    elif minute % 5 == 0:
-        # Every 5 minutes: run current trains
-        run_etl_with_logging(run_current_trains_etl, "Current Trains")
     else:
-        logging.info(f"No ETL scheduled for {now.strftime('%H:%M')} - skipping")
+        # Current trains whenever the adaptive policy says they are due:
+        # every tick at peak, up to half an hour overnight
+        run_etl_with_logging(run_adaptive_current_trains, "Current Trains (adaptive)")
+
+# Tables each job writes and its schedule interval in minutes, for the run ledger
+JOBS = {
+    "Stations": (['stations'], 1440),
+    "Stations (typed)": (['stations'], 1440),
+    "Current Trains": (['current_trains'], 5),
+    "Current Trains (typed)": (['current_trains'], 5),
+    # the workflow ticks every 5 minutes and the policy decides whether a poll is due
+    "Current Trains (adaptive)": (['current_trains'], 5),
+    "Train Movements": (['train_movements'], 15),
+    "Train Movements (streaming)": (['train_movements'], 15),
+    "Station Boards": (['station_boards'], 15),
+    "All": (['stations', 'current_trains', 'train_movements'], 5),
+}
 
 def run_etl_with_logging(etl_func, etl_name):
-    """Run an ETL function with error handling and logging."""
-    try:
-        logging.info(f"Starting {etl_name} ETL...")
-        result = etl_func()
-        logging.info(f"{etl_name} ETL completed successfully.")
-        return result
-    except Exception as e:
-        logging.error(f"{etl_name} ETL failed: {e}", exc_info=True)
-        sys.exit(1)  # Fail the job if ETL fails
+    """
+    Run an ETL function with error handling and logging.
+    The run is skipped when another process is loading the same tables or
+    its schedule slot has already completed. A run that fetched rows for a
+    table but wrote none is recorded as degraded, so its slot is retried.
+    """
+    datasets, slot_minutes = JOBS[etl_name]
+    with claimed_run(etl_name, datasets, slot_minutes) as run:
+        if run is None:
+            return None
+        try:
+            logging.info(f"Starting {etl_name} ETL...")
+            API_BREAKER.reset()
+            extracted_before = Counter(EXTRACTED_ROWS)
+            result = etl_func()
+            details = {'memo': log_memo_stats()}
+            unloaded = unloaded_datasets(datasets, Counter(EXTRACTED_ROWS) - extracted_before, run.rows())
+            if unloaded:
+                logging.warning(f"{etl_name} ETL completed degraded: rows extracted but none loaded "
+                                f"for {', '.join(unloaded)}")
+                details['unloaded'] = unloaded
+                run.finish('degraded', details)
+            elif API_BREAKER.degraded:
+                # the API was down or too slow; whatever it did return was loaded and
+                # tables it returned nothing for keep their last good snapshot
+                logging.warning(f"{etl_name} ETL completed degraded: API circuit opened "
+                                f"{API_BREAKER.trips} time(s) ({API_BREAKER.last_reason}), "
+                                f"{API_BREAKER.rejected} requests skipped")
+                details['api'] = {'trips': API_BREAKER.trips, 'rejected': API_BREAKER.rejected,
+                                  'reason': API_BREAKER.last_reason}
+                run.finish('degraded', details)
+            else:
+                logging.info(f"{etl_name} ETL completed successfully.")
+                run.finish('succeeded', details)
+            return result
+        except Exception as e:
+            logging.error(f"{etl_name} ETL failed: {e}", exc_info=True)
+            run.finish('failed', error=str(e))
+            sys.exit(1)  # Fail the job if ETL fails
 
 def run_specific_etl():
     """Run specific ETL based on command line argument"""
@@ -49,17 +99,31 @@ def run_specific_etl():
         
         if etl_type == 'trains':
             run_etl_with_logging(run_current_trains_etl, "Current Trains")
+        elif etl_type == 'trains-typed':
+            # Train types come from the WithTrainType endpoints where possible
+            run_etl_with_logging(run_current_trains_typed_etl, "Current Trains (typed)")
+        elif etl_type == 'trains-adaptive':
+            # Polls only when the interval chosen after the last poll has passed
+            run_etl_with_logging(run_adaptive_current_trains, "Current Trains (adaptive)")
+        elif etl_type == 'trains-adaptive-loop':
+            run_adaptive_loop()
         elif etl_type == 'movements':
             run_etl_with_logging(run_train_movements_etl, "Train Movements")
+        elif etl_type == 'movements-stream':
+            # Batches are loaded while later trains are still being fetched
+            run_etl_with_logging(run_train_movements_etl_streaming, "Train Movements (streaming)")
+        elif etl_type == 'boards':
+            run_etl_with_logging(run_station_boards_etl, "Station Boards")
         elif etl_type == 'stations':
             run_etl_with_logging(run_stations_etl, "Stations")
+        elif etl_type == 'stations-typed':
+            run_etl_with_logging(run_stations_typed_etl, "Stations (typed)")
         elif etl_type == 'all':
-            run_etl_with_logging(run_current_trains_etl, "Current Trains")
-            run_etl_with_logging(run_train_movements_etl, "Train Movements")
-            run_etl_with_logging(run_stations_etl, "Stations")
+            # Independent ETLs run concurrently and share the current trains fetch
+            run_etl_with_logging(run_all_etl, "All")
         else:
             logging.error(f"Unknown ETL type: {etl_type}")
-            logging.info("Usage: python single_etl_run.py [trains|movements|stations|all]")
+            logging.info("Usage: python single_etl_run.py [trains|trains-typed|trains-adaptive|trains-adaptive-loop|movements|movements-stream|boards|stations|stations-typed|all]")
             sys.exit(1)
     else:
         # No argument provided - run based on schedule
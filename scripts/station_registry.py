@@ -0,0 +1,247 @@
+# scripts/station_registry.py
+# Station metadata registry: name -> code -> type and coordinates, saved as a local artifact
+#
+# Built from the latest stations extract each time stations are loaded, and
+# read once per process (memory-mapped when large). A process that finds no
+# saved artifact, e.g. a fresh CI runner between daily stations runs, builds
+# it from the stations table instead and saves it as a cache. Station names from the API
+# (TrainOrigin, TrainDestination, message locations) are normalised the same
+# way as the registry's names and aliases, so a whole column is resolved with
+# one hash lookup per value instead of a substring scan per keyword. Names the
+# registry does not know fall back to the keyword scan.
+import logging
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from .memo import MEMOS
+
+logger = logging.getLogger(__name__)
+
+STATION_REGISTRY_PATH = os.getenv('STATION_REGISTRY_PATH', 'station_registry.npy')
+
+# Artifacts at least this big are memory-mapped rather than read into memory
+REGISTRY_MMAP_BYTES = int(os.getenv('REGISTRY_MMAP_BYTES', 1 << 20))
+
+# One row per station name or alias
+REGISTRY_DTYPE = [('name', 'U48'), ('code', 'U8'), ('desc', 'U48'), ('type', 'U4'),
+                  ('lat', 'f8'), ('lon', 'f8')]
+
+# Memos whose results depend on the registry
+ROUTE_MEMOS = ['route_type', 'route_classification']
+
+_REGISTRY = None
+_LOADED = False
+
+
+def normalize_names(names):
+    """
+    Station names in one comparable form: upper case, accents and apostrophes
+    removed, other punctuation as spaces, single spaces. Missing stays missing.
+    """
+    names = pd.Series(names, dtype=object)
+    text = names.where(names.notna(), '').astype(str)
+    text = (text.str.normalize('NFKD').str.encode('ascii', 'ignore').str.decode('ascii')
+            .str.upper().str.replace("'", '', regex=False)
+            .str.replace(r'[^A-Z0-9]+', ' ', regex=True).str.strip())
+    return text.where(names.notna() & (text != ''), None)
+
+
+def _keyword_scan(names, keywords):
+    """Substring scan of already normalised names, as the rule table did before the registry"""
+    regex = '|'.join(re.escape(keyword) for keyword in normalize_names(keywords).dropna())
+    if not regex:
+        return np.zeros(len(names), dtype=bool)
+    return pd.Series(names, dtype=object).astype('string').str.contains(regex, regex=True) \
+        .fillna(False).to_numpy(dtype=bool)
+
+
+class StationRegistry:
+    """Lookup tables over a REGISTRY_DTYPE array, which may be a read-only memory map."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.index = pd.Index(rows['name'])
+        self._masks = {}
+
+    def __len__(self):
+        return len(self.rows)
+
+    @classmethod
+    def from_stations(cls, df):
+        """Build from a stations frame, with a row for each StationDesc and StationAlias."""
+        frames = []
+        for column in ['StationDesc', 'StationAlias']:
+            if column not in df.columns:
+                continue
+            frames.append(pd.DataFrame({
+                'name': normalize_names(df[column]),
+                'code': df['StationCode'].astype('string').str.strip().str.upper(),
+                'desc': df['StationDesc'].astype('string').str.strip(),
+                'type': df['StationType'].astype('string').str.strip() if 'StationType' in df.columns else '',
+                'lat': pd.to_numeric(df['StationLatitude'], errors='coerce'),
+                'lon': pd.to_numeric(df['StationLongitude'], errors='coerce'),
+            }))
+        table = pd.concat(frames, ignore_index=True).dropna(subset=['name', 'code'])
+        # a name used by two stations keeps its StationDesc owner, as descs come first
+        table = table.drop_duplicates('name', keep='first')
+        # 0,0 is how the API reports a station without coordinates
+        unknown = (table['lat'] == 0) & (table['lon'] == 0)
+        table.loc[unknown, ['lat', 'lon']] = np.nan
+
+        rows = np.empty(len(table), dtype=REGISTRY_DTYPE)
+        for field, _ in REGISTRY_DTYPE:
+            values = table[field]
+            rows[field] = values.fillna('').to_numpy(dtype=str) if values.dtype != float else values.to_numpy()
+        return cls(rows)
+
+    def save(self, path):
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            np.save(f, np.asarray(self.rows), allow_pickle=False)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        mmap = os.path.getsize(path) >= REGISTRY_MMAP_BYTES
+        return cls(np.load(path, mmap_mode='r' if mmap else None, allow_pickle=False))
+
+    def _unique_lookup(self, names):
+        """Row codes into the unique names, their normalised form and their registry rows"""
+        codes, uniques = pd.factorize(pd.Series(names, dtype=object))
+        # missing names take an extra unique slot that is never found
+        normalized = normalize_names(list(uniques) + [None])
+        return np.where(codes < 0, len(uniques), codes), normalized, self.index.get_indexer(normalized)
+
+    def lookup(self, names):
+        """Registry row of each name, -1 where the name is unknown"""
+        codes, _, positions = self._unique_lookup(names)
+        return positions[codes]
+
+    def codes(self, names):
+        """StationCode of each name, None where unknown"""
+        positions = self.lookup(names)
+        codes = np.asarray(self.rows['code'], dtype=object)[positions]
+        return np.where(positions >= 0, codes, None)
+
+    def coordinates(self, names):
+        """(lat, lon) arrays for each name, NaN where unknown or without coordinates"""
+        positions = self.lookup(names)
+        known = positions >= 0
+        lat, lon = np.full(len(positions), np.nan), np.full(len(positions), np.nan)
+        lat[known] = self.rows['lat'][positions[known]]
+        lon[known] = self.rows['lon'][positions[known]]
+        return lat, lon
+
+    def keyword_mask(self, keywords, station_types=''):
+        """
+        Per registry row: the station's name or StationDesc contains one of the
+        keywords, or its StationType has one of the station_types letters.
+        Computed once per keyword list.
+        """
+        key = (tuple(keywords), station_types)
+        if key not in self._masks:
+            mask = (_keyword_scan(self.rows['name'], keywords)
+                    | _keyword_scan(normalize_names(self.rows['desc']), keywords))
+            for letter in station_types:
+                mask |= np.char.find(np.asarray(self.rows['type']), letter) >= 0
+            self._masks[key] = mask
+        return self._masks[key]
+
+    def matches(self, names, keywords, station_types=''):
+        """keyword_mask() for each name, with a keyword scan of names the registry does not know"""
+        codes, normalized, positions = self._unique_lookup(names)
+        known = positions >= 0
+        hits = np.zeros(len(positions), dtype=bool)
+        hits[known] = self.keyword_mask(keywords, station_types)[positions[known]]
+        if not known.all():
+            hits[~known] = _keyword_scan(normalized[~known], keywords)
+        return hits[codes]
+
+
+def _registry_from_table():
+    """Build and cache the registry from the Postgres stations table, None without one"""
+    from sqlalchemy import text
+    from sqlalchemy.exc import SQLAlchemyError
+    from .insert import engine
+    from .loaders import get_loader
+    if not get_loader().sidecars:
+        return None
+    try:
+        with engine.connect() as conn:
+            stations = pd.read_sql(text('SELECT * FROM stations'), conn)
+    except SQLAlchemyError as e:
+        logger.warning(f"No station registry, station names are matched by keyword: {e}")
+        return None
+    if stations.empty:
+        return None
+    registry = StationRegistry.from_stations(stations)
+    try:
+        registry.save(STATION_REGISTRY_PATH)
+    except OSError as e:
+        logger.warning(f"Failed to cache station registry: {e}")
+    logger.info(f"Built station registry with {len(registry)} names from the stations table")
+    return registry
+
+
+# Registry artifact, read or built once per process
+def get_station_registry():
+    """
+    The saved registry, else one built from the stations table. None when
+    neither exists yet.
+    """
+    global _REGISTRY, _LOADED
+    if not _LOADED:
+        _LOADED = True
+        if os.path.exists(STATION_REGISTRY_PATH):
+            try:
+                _REGISTRY = StationRegistry.load(STATION_REGISTRY_PATH)
+                logger.info(f"Loaded station registry with {len(_REGISTRY)} names")
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable station registry {STATION_REGISTRY_PATH}: {e}")
+        if _REGISTRY is None:
+            _REGISTRY = _registry_from_table()
+    return _REGISTRY
+
+
+def match_keywords(names, keywords, station_types=''):
+    """
+    Boolean array: each station name matches one of the keywords (or, for
+    registry stations, has one of the station_types). Without a registry every
+    name is scanned for the keywords.
+    """
+    registry = get_station_registry()
+    if registry is None:
+        return _keyword_scan(normalize_names(names), keywords)
+    return registry.matches(names, keywords, station_types)
+
+
+# Rebuild the artifact from a loaded stations extract
+def save_station_registry(df, path=None):
+    """
+    Build the registry from a stations frame, save it and use it in this
+    process from now on. Cached route classifications are dropped, as they
+    were worked out from the previous registry.
+    """
+    global _REGISTRY, _LOADED
+    if df.empty:
+        return None
+    registry = StationRegistry.from_stations(df)
+    registry.save(path or STATION_REGISTRY_PATH)
+    _REGISTRY, _LOADED = registry, True
+    for name in ROUTE_MEMOS:
+        if name in MEMOS:
+            MEMOS[name].clear()
+    logger.info(f"Saved station registry with {len(registry)} names from {len(df)} stations")
+    return registry
+
+
+if __name__ == '__main__':
+    # rebuild from the stations table, e.g. after restoring a database
+    from sqlalchemy import text
+    from .insert import engine
+    logging.basicConfig(level=logging.INFO)
+    with engine.connect() as conn:
+        save_station_registry(pd.read_sql(text('SELECT * FROM stations'), conn))
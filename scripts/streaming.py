@@ -0,0 +1,188 @@
+# scripts/streaming.py
+# Streaming train movements ETL: fetch -> parse -> transform -> load connected by bounded queues
+import logging
+import queue
+import threading
+import time
+
+import pandas as pd
+
+from .fetch_api import fetch_from_api, CircuitOpenError
+from .movement_cache import changed_movements, remember_movements
+from .pipeline import (extract_current_trains, train_movements_url, parse_train_movements,
+                       transform_train_movements, transform_and_validate, load_train_movements)
+
+logger = logging.getLogger(__name__)
+
+# Marks the end of a stream
+_DONE = object()
+
+# Trains per transform/load batch
+DEFAULT_BATCH_SIZE = 10
+
+# Items each queue can hold before the upstream stage blocks
+DEFAULT_QUEUE_SIZE = 4
+
+
+# put with backpressure that still notices a stopped pipeline
+def _put(q, item, stop):
+    """Block until there is room in the queue, unless the pipeline is stopping."""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+# get that still notices a stopped pipeline
+def _get(q, stop):
+    """Block until an item arrives, returning _DONE if the pipeline is stopping."""
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.5)
+        except queue.Empty:
+            continue
+    return _DONE
+
+
+### Stages ###
+
+def _fetch_stage(trains_df, out_q, stop, stats):
+    """Fetch the raw movements XML for each train."""
+    try:
+        for row in trains_df.itertuples():
+            if stop.is_set():
+                break
+            try:
+                xml = fetch_from_api(train_movements_url(row.TrainCode, row.TrainDate))
+                stats['fetched'] += 1
+                if not _put(out_q, (row.TrainCode, xml), stop):
+                    break
+                time.sleep(0.2)  # Rate limiting
+            except CircuitOpenError as e:
+                logger.warning(f"{e} - not fetching the remaining trains")
+                break
+            except Exception as e:
+                logger.warning(f"Failed to get movements for {row.TrainCode}: {e}")
+    finally:
+        _put(out_q, _DONE, stop)
+
+
+def _parse_stage(in_q, out_q, stop, stats):
+    """Parse each XML response into a DataFrame."""
+    try:
+        while True:
+            item = _get(in_q, stop)
+            if item is _DONE:
+                break
+            train_code, xml = item
+            try:
+                df = parse_train_movements(xml)
+                if not df.empty:
+                    stats['parsed_rows'] += len(df)
+                    if not _put(out_q, df, stop):
+                        break
+            except Exception as e:
+                logger.warning(f"Failed to parse movements for {train_code}: {e}")
+    finally:
+        _put(out_q, _DONE, stop)
+
+
+def _transform_stage(in_q, out_q, stop, stats, batch_size):
+    """
+    Group per-train frames into batches and transform the stops of each batch
+    that changed since they were last loaded. The raw batch goes along with
+    it, to be remembered once loaded.
+    """
+    batch = []
+
+    def flush():
+        if not batch:
+            return True
+        raw = pd.concat(batch, ignore_index=True)
+        df = transform_and_validate(transform_train_movements, changed_movements(raw), 'train_movements')
+        batch.clear()
+        stats['batches'] += 1
+        return _put(out_q, (raw, df), stop)
+
+    try:
+        while True:
+            item = _get(in_q, stop)
+            if item is _DONE:
+                break
+            batch.append(item)
+            if len(batch) >= batch_size and not flush():
+                break
+        flush()
+    finally:
+        _put(out_q, _DONE, stop)
+
+
+def _load_stage(in_q, stop, stats):
+    """Load each transformed batch while upstream stages keep fetching."""
+    while True:
+        item = _get(in_q, stop)
+        if item is _DONE:
+            break
+        raw, df = item
+        if not load_train_movements(df):
+            raise RuntimeError(f"Failed to load a batch of {len(df)} train movements")
+        stats['loaded_rows'] += len(df)
+        remember_movements(raw)
+
+
+# Run the streaming movements ETL
+def run_train_movements_etl_streaming(batch_size=DEFAULT_BATCH_SIZE, queue_size=DEFAULT_QUEUE_SIZE):
+    """
+    Stream train movements through fetch, parse, transform and load stages.
+
+    Each stage runs in its own thread and hands work to the next one through a
+    bounded queue, so at most about queue_size batches are held in memory and
+    database writes overlap with network waits.
+
+    Returns:
+        dict: Counts of trains fetched, rows parsed, batches and rows loaded.
+    """
+    trains_df = extract_current_trains()
+    if trains_df.empty:
+        logger.warning("No current trains - nothing to stream")
+        return {}
+
+    logger.info(f"Streaming movements for {len(trains_df)} trains in batches of {batch_size}")
+    start = time.perf_counter()
+
+    stop = threading.Event()
+    xml_q = queue.Queue(maxsize=queue_size * batch_size)
+    frame_q = queue.Queue(maxsize=queue_size * batch_size)
+    load_q = queue.Queue(maxsize=queue_size)
+    stats = {'fetched': 0, 'parsed_rows': 0, 'batches': 0, 'loaded_rows': 0}
+    errors = []
+
+    def guarded(stage, *args):
+        try:
+            stage(*args)
+        except Exception as e:
+            errors.append(e)
+            logger.error(f"Streaming stage {stage.__name__} failed: {e}")
+            stop.set()
+
+    threads = [
+        threading.Thread(target=guarded, args=(_fetch_stage, trains_df, xml_q, stop, stats), name='fetch'),
+        threading.Thread(target=guarded, args=(_parse_stage, xml_q, frame_q, stop, stats), name='parse'),
+        threading.Thread(target=guarded, args=(_transform_stage, frame_q, load_q, stop, stats, batch_size), name='transform'),
+        threading.Thread(target=guarded, args=(_load_stage, load_q, stop, stats), name='load'),
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    duration = time.perf_counter() - start
+    logger.info(f"Streamed {stats['loaded_rows']} movement records from {stats['fetched']} trains "
+                f"in {stats['batches']} batches ({duration:.1f}s)")
+
+    if errors:
+        raise RuntimeError(f"Streaming movements ETL failed: {errors[0]}")
+    return stats
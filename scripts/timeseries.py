@@ -0,0 +1,231 @@
+# scripts/timeseries.py
+# Compact delay observations with hourly and daily rollups
+import logging
+
+import pandas as pd
+from sqlalchemy import text
+
+from .insert import engine
+from .analytics import bucket_count_sql
+from .station_registry import get_station_registry
+
+logger = logging.getLogger(__name__)
+
+# Raw observations are append-only and arrive in time order, so a BRIN index on
+# observed_at stays tiny. The unique index serves per-train lookups and stops
+# the same movement stop being recorded twice.
+SCHEMA_SQL = [
+    '''
+    CREATE TABLE IF NOT EXISTS delay_observations (
+        "TrainCode"   text      NOT NULL,
+        "TrainDate"   date      NOT NULL,
+        station       text      NOT NULL,
+        observed_at   timestamp NOT NULL,
+        delay_minutes smallint,
+        source        text      NOT NULL
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS delay_observations_observed_brin ON delay_observations USING BRIN (observed_at)',
+    'CREATE UNIQUE INDEX IF NOT EXISTS delay_observations_train_uq '
+    'ON delay_observations ("TrainCode", "TrainDate", station, observed_at)',
+    '''
+    CREATE TABLE IF NOT EXISTS delay_hourly (
+        bucket        timestamp NOT NULL,
+        station       text      NOT NULL,
+        observations  integer   NOT NULL,
+        delay_sum     bigint    NOT NULL,
+        delay_max     integer,
+        on_time       integer   NOT NULL,
+        minor         integer   NOT NULL,
+        major         integer   NOT NULL,
+        severe        integer   NOT NULL,
+        PRIMARY KEY (bucket, station)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS delay_daily (
+        bucket        date      NOT NULL,
+        station       text      NOT NULL,
+        observations  integer   NOT NULL,
+        delay_sum     bigint    NOT NULL,
+        delay_max     integer,
+        on_time       integer   NOT NULL,
+        minor         integer   NOT NULL,
+        major         integer   NOT NULL,
+        severe        integer   NOT NULL,
+        PRIMARY KEY (bucket, station)
+    )
+    ''',
+]
+
+# Recompute every hour touched by the new observations
+REFRESH_HOURLY_SQL = '''
+    INSERT INTO delay_hourly
+    SELECT date_trunc('hour', observed_at) AS bucket,
+           station,
+           COUNT(*),
+           COALESCE(SUM(delay_minutes), 0),
+           MAX(delay_minutes),
+           {bucket_counts}
+    FROM delay_observations
+    WHERE observed_at >= date_trunc('hour', CAST(:since AS timestamp))
+    GROUP BY 1, 2
+    ON CONFLICT (bucket, station) DO UPDATE SET
+        observations = EXCLUDED.observations,
+        delay_sum    = EXCLUDED.delay_sum,
+        delay_max    = EXCLUDED.delay_max,
+        on_time      = EXCLUDED.on_time,
+        minor        = EXCLUDED.minor,
+        major        = EXCLUDED.major,
+        severe       = EXCLUDED.severe
+'''.format(bucket_counts=',\n           '.join(bucket_count_sql()))
+
+# Days are rebuilt from the hourly rollup, not the raw rows
+REFRESH_DAILY_SQL = '''
+    INSERT INTO delay_daily
+    SELECT CAST(bucket AS date), station,
+           SUM(observations), SUM(delay_sum), MAX(delay_max),
+           SUM(on_time), SUM(minor), SUM(major), SUM(severe)
+    FROM delay_hourly
+    WHERE bucket >= date_trunc('day', CAST(:since AS timestamp))
+    GROUP BY 1, 2
+    ON CONFLICT (bucket, station) DO UPDATE SET
+        observations = EXCLUDED.observations,
+        delay_sum    = EXCLUDED.delay_sum,
+        delay_max    = EXCLUDED.delay_max,
+        on_time      = EXCLUDED.on_time,
+        minor        = EXCLUDED.minor,
+        major        = EXCLUDED.major,
+        severe       = EXCLUDED.severe
+'''
+
+OBSERVATION_COLUMNS = ['TrainCode', 'TrainDate', 'station', 'observed_at', 'delay_minutes', 'source']
+
+INSERT_SQL = '''
+    INSERT INTO delay_observations ("TrainCode", "TrainDate", station, observed_at, delay_minutes, source)
+    VALUES (:TrainCode, :TrainDate, :station, :observed_at, :delay_minutes, :source)
+    ON CONFLICT DO NOTHING
+'''
+
+# A train is polled every few minutes; it is only observed again once its
+# location or delay differs from its last current_trains observation, so a
+# train waiting at a station counts once like a movement stop
+INSERT_CHANGED_SQL = '''
+    INSERT INTO delay_observations ("TrainCode", "TrainDate", station, observed_at, delay_minutes, source)
+    SELECT :TrainCode, CAST(:TrainDate AS date), :station, :observed_at, :delay_minutes, :source
+    WHERE NOT EXISTS (
+        SELECT 1 FROM (
+            SELECT station, delay_minutes FROM delay_observations
+            WHERE "TrainCode" = :TrainCode AND "TrainDate" = CAST(:TrainDate AS date) AND source = :source
+            ORDER BY observed_at DESC LIMIT 1
+        ) last
+        WHERE last.station = :station AND last.delay_minutes IS NOT DISTINCT FROM CAST(:delay_minutes AS smallint)
+    )
+    ON CONFLICT DO NOTHING
+'''
+
+_SCHEMA_READY = False
+
+
+# Create the time-series tables once per process
+def ensure_timeseries_schema():
+    """
+    Create the delay observation and rollup tables if they do not exist.
+    """
+    global _SCHEMA_READY
+    if _SCHEMA_READY:
+        return
+    with engine.begin() as conn:
+        for statement in SCHEMA_SQL:
+            conn.execute(text(statement))
+    _SCHEMA_READY = True
+
+
+### Build observations ###
+
+def observations_from_current_trains(df):
+    """
+    One observation per train: its delay at its current location when collected.
+    Locations are station names, stored as their StationCode like movement
+    observations; trains at a name the station registry does not know are dropped.
+    record_delay_observations only stores those whose location or delay changed.
+    """
+    registry = get_station_registry()
+    if df.empty or 'current_location' not in df.columns or registry is None:
+        return pd.DataFrame(columns=OBSERVATION_COLUMNS)
+
+    obs = pd.DataFrame({
+        'TrainCode': df['TrainCode'],
+        'TrainDate': pd.to_datetime(df['TrainDate'], errors='coerce').dt.date,
+        'station': registry.codes(df['current_location']),
+        'observed_at': pd.to_datetime(df.get('collected_at', pd.Timestamp.now())),
+        'delay_minutes': pd.to_numeric(df['delay_minutes'], errors='coerce'),
+        'source': 'current_trains'
+    })
+    return obs.dropna(subset=['TrainCode', 'TrainDate', 'station', 'observed_at'])
+
+
+def movement_stop_delays(df):
+    """
+    Arrival delay in minutes (actual minus scheduled) for every stop that has
+    an actual arrival. Returns the arrived rows with a stop_delay column.
+    """
+    needed = {'arrival_actual', 'ScheduledArrival', 'TrainDate'}
+    if df.empty or not needed.issubset(df.columns):
+        return df.iloc[0:0].assign(stop_delay=pd.Series(dtype=float))
+
+    arrived = df[df['arrival_actual'].notna() & df['ScheduledArrival'].notna()]
+    train_date = pd.to_datetime(arrived['TrainDate'], errors='coerce')
+    actual = pd.to_datetime(arrived['arrival_actual'], errors='coerce')
+    scheduled = train_date + pd.to_timedelta(arrived['ScheduledArrival'].astype(str), errors='coerce')
+    return arrived.assign(stop_delay=((actual - scheduled).dt.total_seconds() / 60).round())
+
+
+def observations_from_movements(df):
+    """
+    One observation per stop with an actual arrival: arrival minus scheduled arrival.
+    """
+    if df.empty or 'LocationCode' not in df.columns:
+        return pd.DataFrame(columns=OBSERVATION_COLUMNS)
+
+    arrived = movement_stop_delays(df)
+    if arrived.empty:
+        return pd.DataFrame(columns=OBSERVATION_COLUMNS)
+
+    obs = pd.DataFrame({
+        'TrainCode': arrived['TrainCode'],
+        'TrainDate': pd.to_datetime(arrived['TrainDate'], errors='coerce').dt.date,
+        'station': arrived['LocationCode'].astype('string').str.strip().str.upper(),
+        'observed_at': pd.to_datetime(arrived['arrival_actual'], errors='coerce'),
+        'delay_minutes': arrived['stop_delay'],
+        'source': 'train_movements'
+    })
+    return obs.dropna(subset=['TrainCode', 'TrainDate', 'station', 'observed_at'])
+
+
+### Load ###
+
+def record_delay_observations(obs):
+    """
+    Append delay observations and refresh the hourly and daily rollups they touch.
+    """
+    if obs.empty:
+        return 0
+
+    ensure_timeseries_schema()
+    obs = obs[OBSERVATION_COLUMNS].copy()
+    obs['delay_minutes'] = obs['delay_minutes'].astype('Int16')
+    since = obs['observed_at'].min().to_pydatetime()
+    polled = (obs['source'] == 'current_trains').to_numpy()
+
+    recorded = 0
+    with engine.begin() as conn:
+        for sql, rows in [(INSERT_SQL, obs[~polled]), (INSERT_CHANGED_SQL, obs[polled])]:
+            if not rows.empty:
+                records = rows.astype(object).where(rows.notna(), None).to_dict('records')
+                recorded += max(conn.execute(text(sql), records).rowcount, 0)
+        conn.execute(text(REFRESH_HOURLY_SQL), {'since': since})
+        conn.execute(text(REFRESH_DAILY_SQL), {'since': since})
+
+    logger.info(f"Recorded {recorded} of {len(obs)} delay observations since {since:%Y-%m-%d %H:%M}")
+    return recorded
@@ -1,7 +1,168 @@
 # train_types.py -  API doesn't give  train types, use logic to find them
+# The rules live in data/train_type_rules.json so new ones need no code changes
 
-import pandas as pd
+import json
+import os
 import re
+import time
+
+import numpy as np
+import pandas as pd
+
+from .memo import UniqueMemo
+from .messages import MessageParser
+from .station_registry import match_keywords
+
+# Train types the API reports through getCurrentTrainsXML_WithTrainType.
+# DART and suburban trains are authoritative; mainline still needs the
+# heuristics to tell Intercity, Enterprise and Regional services apart.
+API_TRAIN_TYPES = {
+    'D': 'DART',
+    'S': 'Commuter',
+    'M': None
+}
+
+
+# Rule table with the code prefix, route keyword and message keyword rules
+RULES_PATH = os.getenv("TRAIN_TYPE_RULES", os.path.join(os.path.dirname(__file__), 'data', 'train_type_rules.json'))
+
+
+# Load the rule table
+def load_train_type_rules(path=RULES_PATH):
+    """
+    Read the train type rule table from a JSON file
+    """
+    with open(path) as f:
+        return json.load(f)
+
+
+class TrainTypeClassifier:
+    """
+    Train type rule table compiled into vectorised matchers.
+    Rules are applied in priority order, lowest number first.
+    """
+
+    def __init__(self, rules):
+        self.default = rules.get('default', 'Unknown')
+        self.route_default = rules.get('route_default', 'Regional')
+
+        # one anchored regex for all prefixes; alternation order is priority
+        # order, so the first rule that matches wins like an if/elif chain
+        prefix_rules = sorted(rules['code_prefix'], key=lambda r: (r['priority'], -len(r['prefix'])))
+        self.prefix_types = {}
+        for rule in prefix_rules:
+            self.prefix_types.setdefault(rule['prefix'].upper(), rule['type'])
+        self.prefix_regex = re.compile('^(' + '|'.join(re.escape(prefix) for prefix in self.prefix_types) + ')')
+
+        self.groups = rules['keyword_groups']
+        # StationType letters that put a registry station in a group, whatever its name
+        self.group_station_types = rules.get('station_type_groups', {})
+        self.route_rules = sorted(rules['route'], key=lambda r: r['priority'])
+        self.message_rules = sorted(rules['message'], key=lambda r: r['priority'])
+        self.message_parser = MessageParser(self.message_rules, default=self.default)
+
+        # the vectorised rules run on values not seen before only
+        self.code_memo = UniqueMemo('train_code_type', self._classify_codes, batch=True)
+        self.route_memo = UniqueMemo('route_type', self._classify_routes, batch=True)
+
+    def classify_codes(self, codes):
+        """Train type from the train code prefix"""
+        return pd.Series(self.code_memo.apply(codes), index=codes.index, dtype=object)
+
+    def classify_routes(self, origins, destinations):
+        """Train type from the origin and destination station names"""
+        return pd.Series(self.route_memo.apply(origins, destinations), index=origins.index, dtype=object)
+
+    def _classify_codes(self, codes):
+        codes = pd.Series(codes, dtype=object).astype('string').str.upper().str.strip()
+        prefixes = codes.str.extract(self.prefix_regex, expand=False)
+        types = prefixes.map(self.prefix_types).astype(object)
+        return types.where(types.notna(), self.default)
+
+    def _classify_routes(self, routes):
+        origins = pd.Series([origin for origin, _ in routes], dtype=object)
+        destinations = pd.Series([destination for _, destination in routes], dtype=object)
+
+        # each keyword group is matched once per end, by station registry lookup
+        hits = {}
+        for name, keywords in self.groups.items():
+            station_types = self.group_station_types.get(name, '')
+            hits[name] = (match_keywords(origins, keywords, station_types),
+                          match_keywords(destinations, keywords, station_types))
+
+        conditions = []
+        for rule in self.route_rules:
+            first = hits[rule['groups'][0]]
+            if rule['match'] == 'pair':
+                second = hits[rule['groups'][1]]
+                conditions.append((first[0] & second[1]) | (second[0] & first[1]))
+            elif rule['match'] == 'both':
+                conditions.append(first[0] & first[1])
+            elif rule['match'] == 'either':
+                conditions.append(first[0] | first[1])
+            else:
+                raise ValueError(f"Unknown route match type: {rule['match']}")
+
+        types = np.select(conditions, [rule['type'] for rule in self.route_rules], default=self.route_default)
+        missing = (origins.isna() | destinations.isna()).to_numpy(dtype=bool)
+        types = np.where(missing, self.default, types)
+        return pd.Series(types, index=origins.index, dtype=object)
+
+    def classify_messages(self, messages):
+        """Train type from service names mentioned in the public message"""
+        return self.message_parser.parse(messages)['service_hint']
+
+    def classify(self, df):
+        """
+        Classify a whole frame, returning the code, route and message types
+        and the combined train_type
+        """
+        result = pd.DataFrame(index=df.index)
+
+        if 'TrainCode' in df.columns:
+            result['train_type_code'] = self.classify_codes(df['TrainCode'])
+        if 'TrainOrigin' in df.columns and 'TrainDestination' in df.columns:
+            result['route_type'] = self.classify_routes(df['TrainOrigin'], df['TrainDestination'])
+        if 'message_type' in df.columns:
+            # already parsed out of the message by add_extra_fields; raw frames
+            # carry an empty column, so only missing values are classified here
+            result['message_type'] = df['message_type']
+            missing = result['message_type'].isna()
+            if missing.any() and 'PublicMessage' in df.columns:
+                result.loc[missing, 'message_type'] = self.classify_messages(df.loc[missing, 'PublicMessage'])
+        elif 'PublicMessage' in df.columns:
+            result['message_type'] = self.classify_messages(df['PublicMessage'])
+
+        # Using the route type as primary, code-based if route gives Unknown
+        train_type = result.get('route_type', result.get('train_type_code'))
+        if train_type is None:
+            train_type = pd.Series(self.default, index=df.index, dtype=object)
+        if 'route_type' in result.columns and 'train_type_code' in result.columns:
+            train_type = train_type.where(train_type != self.default, result['train_type_code'])
+
+        # Clean up E_Code_Unknown (these should be resolved by route)
+        train_type = train_type.where(train_type != 'E_Code_Unknown', self.default)
+
+        # Override with message type if still Unknown
+        if 'message_type' in result.columns:
+            train_type = train_type.where(train_type != self.default, result['message_type'])
+
+        result['train_type'] = train_type
+        return result
+
+
+_CLASSIFIER = None
+
+
+# Compiled rule table, built once per process
+def get_train_type_classifier():
+    """
+    Return the classifier compiled from the rule table, loading it on first use
+    """
+    global _CLASSIFIER
+    if _CLASSIFIER is None:
+        _CLASSIFIER = TrainTypeClassifier(load_train_type_rules())
+    return _CLASSIFIER
 
 
 # Get train type from code
@@ -10,37 +171,7 @@ def train_type_from_code(train_code):
     Gathers train type from the train code pattern
     NOTE: need to check routes too
     """
-    if pd.isna(train_code) or train_code == "":
-        return "Unknown"
-    
-    code = str(train_code).upper().strip()
-    
-    # DART services (Dublin Area Rapid Transit)
-    if code.startswith('D'):
-        return "DART"
-    
-    # Intercity services  
-    if code.startswith('A'):
-        return "Intercity"
-    
-    # Freight/Post services
-    if code.startswith('P'):
-        return "Freight"
-    
-    # E-codes could be Enterprise OR DART - need route info to determine
-    if code.startswith('E'):
-        return "E_Code_Unknown" 
-    
-    # Commuter services
-    if code.startswith('C'):
-        return "Commuter"
-    
-    # Mark and Lane (Special services)
-    if code.startswith('M') or code.startswith('L'):
-        return "Special"
-    
-    return "Unknown"
-
+    return get_train_type_classifier().classify_codes(pd.Series([train_code], dtype=object)).iloc[0]
 
 
 # Train type from route
@@ -48,58 +179,8 @@ def train_type_from_route(origin, destination):
     """
     Gather train type from route pattern
     """
-    if pd.isna(origin) or pd.isna(destination):
-        return "Unknown"
-    
-    origin_str = str(origin).upper()
-    dest_str = str(destination).upper()
-    
-    # REAL Enterprise routes (only Belfast-Dublin intercity)
-    belfast_keywords = ['BELFAST', 'CENTRAL']
-    dublin_keywords = ['DUBLIN', 'CONNOLLY']
-    
-    origin_belfast = any(keyword in origin_str for keyword in belfast_keywords)
-    dest_belfast = any(keyword in dest_str for keyword in belfast_keywords)
-    origin_dublin = any(keyword in origin_str for keyword in dublin_keywords)
-    dest_dublin = any(keyword in dest_str for keyword in dublin_keywords)
-    
-    # True Enterprise: Belfast <-> Dublin
-    if (origin_belfast and dest_dublin) or (origin_dublin and dest_belfast):
-        return "Enterprise"
-    
-    # DART routes (all within Dublin coastal area)
-    dart_stations = [
-        'MALAHIDE', 'PORTMARNOCK', 'CLONGRIFFIN', 'HOWTH', 'SUTTON', 'LAYTOWN',
-        'BALBRIGGAN', 'SKERRIES', 'MOUNT MERRION', 'BAYSIDE', 'KILLESTER', 'HARMONSTOWN', 
-        'RAHENY', 'KILBARRACK','CLONTARF', 'CONNOLLY', 'TARA STREET', 'PEARSE', 'GRAND CANAL',
-        'LANSDOWNE', 'SANDYMOUNT', 'SYDNEY PARADE', 'BOOTERSTOWN',
-        'BLACKROCK', 'SEAPOINT', 'SALTHILL', 'DUN LAOGHAIRE', 'SANDYCOVE',
-        'GLENAGEARY', 'DALKEY', 'KILLINEY', 'SHANKILL', 'BRAY', 'GREYSTONES', 'DROGHEDA'
-    ]
-    
-    origin_is_dart = any(station in origin_str for station in dart_stations)
-    dest_is_dart = any(station in dest_str for station in dart_stations)
-    
-    if origin_is_dart and dest_is_dart:
-        return "DART"
-    
-    # Major intercity routes (not Enterprise)
-    major_cities = ['CORK', 'GALWAY', 'LIMERICK', 'WATERFORD', 'SLIGO', 'TRALEE']
-    dublin_terminals = ['CONNOLLY', 'HEUSTON']
-    
-    origin_major = any(city in origin_str for city in major_cities)
-    dest_major = any(city in dest_str for city in major_cities)
-    origin_dublin_terminal = any(term in origin_str for term in dublin_terminals)
-    dest_dublin_terminal = any(term in dest_str for term in dublin_terminals)
-    
-    if (origin_major and dest_dublin_terminal) or (origin_dublin_terminal and dest_major):
-        return "Intercity"
-    
-    # Dublin commuter (not DART)
-    if origin_dublin_terminal or dest_dublin_terminal:
-        return "Commuter"
-    
-    return "Regional"
+    classifier = get_train_type_classifier()
+    return classifier.classify_routes(pd.Series([origin], dtype=object), pd.Series([destination], dtype=object)).iloc[0]
 
 
 # Train type from public message
@@ -107,68 +188,57 @@ def train_type_from_message(public_message):
     """
     Extract hints from public message
     """
-    if pd.isna(public_message):
-        return "Unknown"
-    
-    message = str(public_message).upper()
-    
-    # Look for service type mentions
-    if 'DART' in message:
-        return "DART"
-    if 'ENTERPRISE' in message:
-        return "Enterprise"
-    if 'INTERCITY' in message:
-        return "Intercity"
-    
-    return "Unknown"
+    return get_train_type_classifier().classify_messages(pd.Series([public_message], dtype=object)).iloc[0]
 
 
 # Add train types to DataFrame
 def add_train_types(df):
     """
-    Add train types to any DataFrame with train data
+    Add train types to any DataFrame with train data.
+    Rows already typed by the API (TrainType D or S) skip the heuristics.
+    Resolution stats are left in the returned frame's attrs['train_type_stats'].
     """
     if df.empty:
         return df
     
+    start = time.perf_counter()
     updated_df = df.copy()
     
-    # Method 1: From train code 
-    if 'TrainCode' in df.columns:
-        updated_df['train_type_code'] = df['TrainCode'].apply(train_type_from_code)
+    # Authoritative type from the typed API endpoints
+    api_type = pd.Series(None, index=df.index, dtype=object)
+    if 'TrainType' in df.columns:
+        api_type = df['TrainType'].map(API_TRAIN_TYPES)
+    resolved = api_type.notna()
     
-    # Method 2: From route 
-    if 'TrainOrigin' in df.columns and 'TrainDestination' in df.columns:
-        updated_df['route_type'] = df.apply(
-            lambda row: train_type_from_route(row['TrainOrigin'], row['TrainDestination']), axis=1
-        )
+    heuristic_df = updated_df.loc[~resolved]
+    if not heuristic_df.empty:
+        heuristic_df = _heuristic_train_types(heuristic_df)
+        for col in ['train_type_code', 'route_type', 'message_type', 'train_type']:
+            if col in heuristic_df.columns:
+                updated_df.loc[~resolved, col] = heuristic_df[col]
     
-    # Method 3: From public message
-    if 'PublicMessage' in df.columns:
-        updated_df['message_type'] = df['PublicMessage'].apply(train_type_from_message)
-    
-    # Using the route type as primary
-    if 'route_type' in updated_df.columns:
-        updated_df['train_type'] = updated_df['route_type']
-        
-        # Only use code-based if route gives Unknown
-        mask = updated_df['train_type'] == 'Unknown'
-        if 'train_type_code' in updated_df.columns:
-            updated_df.loc[mask, 'train_type'] = updated_df.loc[mask, 'train_type_code']
-    else:
-        updated_df['train_type'] = updated_df.get('train_type_code', 'Unknown')
+    if resolved.any():
+        updated_df.loc[resolved, 'train_type'] = api_type[resolved]
     
+    updated_df.attrs['train_type_stats'] = {
+        'rows': len(df),
+        'api_resolved': int(resolved.sum()),
+        'heuristic_rows': len(heuristic_df),
+        'seconds': time.perf_counter() - start
+    }
+    return updated_df
 
 
-    # Clean up E_Code_Unknown (these should be resolved by route)
-    mask = updated_df['train_type'] == 'E_Code_Unknown'
-    updated_df.loc[mask, 'train_type'] = 'Unknown'
-    
-    # Override with message type if still Unknown
-    if 'message_type' in updated_df.columns:
-        mask = updated_df['train_type'] == 'Unknown'
-        updated_df.loc[mask, 'train_type'] = updated_df.loc[mask, 'message_type']
-    
+# Heuristic train type passes
+def _heuristic_train_types(df):
+    """
+    Guess train types from the code, route and public message in one pass
+    of the compiled rule table
+    """
+    updated_df = df.copy()
+    types = get_train_type_classifier().classify(df)
+    for col in types.columns:
+        updated_df[col] = types[col]
     return updated_df
 
 # Summary of train types
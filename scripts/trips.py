@@ -0,0 +1,225 @@
+# scripts/trips.py
+# Trip tracking: keep only real state changes of each train across current_trains snapshots
+import logging
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from .geo import get_station_coordinates, haversine_km, progress_between_stops, speeds_kmh
+from .insert import engine
+from .messages import parse_messages
+
+logger = logging.getLogger(__name__)
+
+TRIP_KEY = ['TrainCode', 'TrainDate']
+
+# A new trajectory point is stored when any of these change
+STATE_COLUMNS = ['TrainStatus', 'TrainLatitude', 'TrainLongitude', 'PublicMessage']
+
+# Where the train is heading and how fast it got from its previous position
+MOTION_COLUMNS = ['next_stop', 'speed_kmh', 'fraction_to_next_stop', 'km_to_next_stop']
+
+POINT_COLUMNS = (TRIP_KEY + ['observed_at'] + STATE_COLUMNS + ['delay_minutes', 'current_location', 'state_hash']
+                 + MOTION_COLUMNS)
+
+SCHEMA_SQL = [
+    '''
+    CREATE TABLE IF NOT EXISTS trip_points (
+        "TrainCode"      text      NOT NULL,
+        "TrainDate"      date      NOT NULL,
+        observed_at      timestamp NOT NULL,
+        "TrainStatus"    text,
+        "TrainLatitude"  real,
+        "TrainLongitude" real,
+        "PublicMessage"  text,
+        delay_minutes    smallint,
+        current_location text,
+        state_hash       bigint    NOT NULL
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS trip_points_trip_idx ON trip_points ("TrainCode", "TrainDate", observed_at)',
+    'ALTER TABLE trip_points ADD COLUMN IF NOT EXISTS next_stop text',
+    'ALTER TABLE trip_points ADD COLUMN IF NOT EXISTS speed_kmh real',
+    'ALTER TABLE trip_points ADD COLUMN IF NOT EXISTS fraction_to_next_stop real',
+    'ALTER TABLE trip_points ADD COLUMN IF NOT EXISTS km_to_next_stop real',
+]
+
+# Latest state of every trip of the day, to warm the index in a fresh process
+LATEST_STATES_SQL = '''
+    SELECT DISTINCT ON ("TrainCode", "TrainDate") "TrainCode", "TrainDate", state_hash,
+           observed_at, "TrainLatitude", "TrainLongitude"
+    FROM trip_points
+    WHERE "TrainDate" = :train_date
+    ORDER BY "TrainCode", "TrainDate", observed_at DESC
+'''
+
+
+def state_hashes(df):
+    """
+    Hash of the state columns of every row, as signed 64-bit integers
+    so it fits a Postgres bigint.
+    """
+    state = df[STATE_COLUMNS].astype('string').fillna('')
+    # round positions so float32/float64 copies of the same point hash the same
+    for col in ['TrainLatitude', 'TrainLongitude']:
+        state[col] = pd.to_numeric(df[col], errors='coerce').round(5).astype('string').fillna('')
+    return pd.util.hash_pandas_object(state, index=False).to_numpy().view(np.int64)
+
+
+def _trip_keys(df):
+    dates = pd.to_datetime(df['TrainDate'], errors='coerce').dt.date
+    return list(zip(df['TrainCode'].astype(str), dates))
+
+
+class TripTracker:
+    """
+    In-memory index of active trips keyed by (TrainCode, TrainDate) holding
+    the hash of each trip's last stored state, and the last position of each
+    trip with the last time it was seen there.
+    """
+
+    def __init__(self):
+        self.trips = {}
+        self.positions = {}
+        self.seeded_for = None
+        self.observations = 0
+        self.points = 0
+
+    def seed(self, train_date):
+        """Load the last stored state of today's trips from the database."""
+        with engine.begin() as conn:
+            for statement in SCHEMA_SQL:
+                conn.execute(text(statement))
+            latest = pd.read_sql(text(LATEST_STATES_SQL), conn, params={'train_date': train_date})
+        for key, state_hash, seen_at, lat, lon in zip(_trip_keys(latest), latest['state_hash'], latest['observed_at'],
+                                                      latest['TrainLatitude'], latest['TrainLongitude']):
+            self.trips[key] = int(state_hash)
+            if pd.notna(lat) and pd.notna(lon):
+                self.positions[key] = (float(lat), float(lon), pd.Timestamp(seen_at))
+        self.seeded_for = train_date
+        logger.info(f"Trip index seeded with {len(latest)} trips for {train_date}")
+
+    def evict_before(self, train_date):
+        """Drop trips from earlier days."""
+        stale = [key for key in self.trips if key[1] is not None and key[1] < train_date]
+        for key in stale:
+            del self.trips[key]
+        for key in [key for key in self.positions if key[1] is not None and key[1] < train_date]:
+            del self.positions[key]
+        return len(stale)
+
+    def move(self, snapshot):
+        """
+        Speed of each train in a snapshot since its last known position, and
+        update the positions. Every poll refreshes the time a train was last
+        seen, so a train that waited at a stop is timed from when it left
+        rather than from when it arrived.
+
+        Returns:
+            tuple: speed_kmh Series on the snapshot's index (one row per trip),
+            NaN for trips without a known position, and the new positions,
+            which are only kept once passed to commit().
+        """
+        snapshot = snapshot.drop_duplicates(subset=TRIP_KEY, keep='last')
+        keys = _trip_keys(snapshot)
+        lat = pd.to_numeric(snapshot['TrainLatitude'], errors='coerce').to_numpy(dtype=float)
+        lon = pd.to_numeric(snapshot['TrainLongitude'], errors='coerce').to_numpy(dtype=float)
+        observed_at = snapshot['collected_at'] if 'collected_at' in snapshot.columns else pd.Timestamp.now()
+        times = pd.to_datetime(pd.Series(observed_at, index=snapshot.index)).to_numpy(dtype='datetime64[ns]')
+
+        last = [self.positions.get(key, (np.nan, np.nan, None)) for key in keys]
+        last_lat = np.array([p[0] for p in last], dtype=float)
+        last_lon = np.array([p[1] for p in last], dtype=float)
+        last_seen = pd.to_datetime(pd.Series([p[2] for p in last], dtype=object)).to_numpy(dtype='datetime64[ns]')
+
+        elapsed = (times - last_seen) / np.timedelta64(1, 's')
+        speed = speeds_kmh(haversine_km(last_lat, last_lon, lat, lon), elapsed)
+
+        positions = {keys[i]: (lat[i], lon[i], times[i]) for i in np.flatnonzero(~(np.isnan(lat) | np.isnan(lon)))}
+        return pd.Series(speed, index=snapshot.index), positions
+
+    def merge(self, snapshot):
+        """
+        Return only the rows of a snapshot whose trip is new or whose state
+        changed since its last stored point. The index is not updated until
+        the points are stored and passed to commit().
+        """
+        if snapshot.empty:
+            return snapshot
+
+        # the same train listed twice in one snapshot is one observation
+        snapshot = snapshot.drop_duplicates(subset=TRIP_KEY, keep='last')
+        hashes = state_hashes(snapshot)
+        keys = _trip_keys(snapshot)
+
+        previous = np.array([self.trips.get(key, 0) for key in keys], dtype=np.int64)
+        known = np.array([key in self.trips for key in keys], dtype=bool)
+        changed = ~known | (previous != hashes)
+
+        self.observations += len(snapshot)
+        return snapshot.loc[changed].assign(state_hash=hashes[changed])
+
+    def commit(self, points=None, positions=None):
+        """
+        Record the state hashes of points from merge() and the positions from
+        move() once the points are stored.
+        """
+        if points is not None:
+            for key, state_hash in zip(_trip_keys(points), points['state_hash']):
+                self.trips[key] = int(state_hash)
+            self.points += len(points)
+        self.positions.update(positions or {})
+
+
+TRIP_TRACKER = TripTracker()
+
+
+# Persist the trajectory points of a current trains snapshot
+def record_trip_points(df, tracker=TRIP_TRACKER):
+    """
+    Store a trajectory point for every train whose state changed in this snapshot.
+    """
+    if df.empty:
+        return 0
+
+    today = pd.Timestamp.now().date()
+    if tracker.seeded_for != today:
+        tracker.evict_before(today)
+        tracker.seed(today)
+
+    changed = tracker.merge(df)
+    speeds, positions = tracker.move(df)
+    if changed.empty:
+        tracker.commit(positions=positions)
+        logger.info(f"No trip state changes in {len(df)} trains")
+        return 0
+
+    points = changed.assign(observed_at=changed.get('collected_at', pd.Timestamp.now()))
+    points = add_motion(points, speeds)
+    for col in POINT_COLUMNS:
+        if col not in points.columns:
+            points[col] = None
+    points = points[POINT_COLUMNS]
+    points.to_sql('trip_points', con=engine, index=False, if_exists='append', method='multi', chunksize=1000)
+    # a failed insert leaves the index and positions as they were, so the same
+    # changes are stored, and timed from the last stored point, next poll
+    tracker.commit(points, positions)
+
+    logger.info(f"Stored {len(points)} trip points from {len(df)} trains "
+                f"({tracker.points}/{tracker.observations} observations kept this process)")
+    return len(points)
+
+
+def add_motion(points, speeds):
+    """
+    Add MOTION_COLUMNS to trajectory points: the speed from TripTracker.move,
+    the next stop from the public message, and progress from the current
+    location towards the next stop.
+    """
+    parsed = parse_messages(points['PublicMessage'])
+    points = points.assign(speed_kmh=speeds.reindex(points.index).to_numpy(),
+                           next_stop=parsed['next_stop'].to_numpy())
+    if 'current_location' not in points.columns:
+        points['current_location'] = parsed['current_location'].to_numpy()
+    return points.join(progress_between_stops(points, get_station_coordinates()))
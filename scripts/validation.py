@@ -0,0 +1,199 @@
+# scripts/validation.py
+# Data-quality checks between transform and load, with a quarantine table for failing rows
+import json
+import logging
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from .insert import engine
+from .loaders import get_loader
+
+logger = logging.getLogger(__name__)
+
+# Bounding box around the island of Ireland (including Northern Ireland)
+IRELAND_BBOX = {
+    'lat_min': 51.2, 'lat_max': 55.5,
+    'lon_min': -11.0, 'lon_max': -5.0
+}
+
+# Primary keys of the loaded tables
+PRIMARY_KEYS = {
+    'stations': ['StationCode'],
+    'current_trains': ['TrainCode', 'TrainDate'],
+    'train_movements': ['TrainCode', 'TrainDate', 'LocationOrder'],
+}
+
+COORDINATE_COLUMNS = {
+    'stations': ('StationLatitude', 'StationLongitude'),
+    'current_trains': ('TrainLatitude', 'TrainLongitude'),
+}
+
+# How far TrainDate may be from today, in days (past, future)
+DATE_WINDOWS = {
+    'current_trains': (1, 1),
+    'train_movements': (3650, 1),
+}
+
+QUARANTINE_SQL = '''
+    CREATE TABLE IF NOT EXISTS quarantine_rows (
+        dataset        text      NOT NULL,
+        rules          text      NOT NULL,
+        quarantined_at timestamp NOT NULL,
+        row_data       jsonb
+    )
+'''
+
+
+### Checks - each returns a boolean array marking failing rows ###
+
+def check_coordinates(df, dataset):
+    """Coordinates present but outside Ireland (this catches 0,0)."""
+    lat_col, lon_col = COORDINATE_COLUMNS[dataset]
+    lat = pd.to_numeric(df[lat_col], errors='coerce').to_numpy(dtype=float)
+    lon = pd.to_numeric(df[lon_col], errors='coerce').to_numpy(dtype=float)
+    present = ~np.isnan(lat) | ~np.isnan(lon)
+    with np.errstate(invalid='ignore'):
+        inside = ((lat >= IRELAND_BBOX['lat_min']) & (lat <= IRELAND_BBOX['lat_max'])
+                  & (lon >= IRELAND_BBOX['lon_min']) & (lon <= IRELAND_BBOX['lon_max']))
+    return present & ~inside
+
+
+def check_primary_key(df, dataset):
+    """Any primary key column missing or blank."""
+    missing = np.zeros(len(df), dtype=bool)
+    for col in PRIMARY_KEYS[dataset]:
+        values = df[col]
+        missing |= values.isna().to_numpy(dtype=bool)
+        # only text columns can hold blanks; numbers and dates skip the string pass
+        if values.dtype == object and pd.api.types.infer_dtype(values, skipna=True) in ('string', 'mixed'):
+            missing |= values.str.strip().eq('').fillna(False).to_numpy(dtype=bool)
+    return missing
+
+
+def check_train_date(df, dataset):
+    """TrainDate missing or outside the window expected for the dataset."""
+    past, future = DATE_WINDOWS[dataset]
+    today = pd.Timestamp.now().normalize()
+    dates = pd.to_datetime(df['TrainDate'], errors='coerce')
+    valid = (dates >= today - pd.Timedelta(days=past)) & (dates <= today + pd.Timedelta(days=future))
+    return ~valid.fillna(False).to_numpy(dtype=bool)
+
+
+def check_duplicate_key(df, dataset):
+    """Every copy of a repeated primary key except the last one."""
+    return df.duplicated(subset=PRIMARY_KEYS[dataset], keep='last').to_numpy(dtype=bool)
+
+
+RULES = {
+    'stations': {
+        'pk_incomplete': check_primary_key,
+        'duplicate_key': check_duplicate_key,
+        'coordinates_outside_ireland': check_coordinates,
+    },
+    'current_trains': {
+        'pk_incomplete': check_primary_key,
+        'train_date_out_of_range': check_train_date,
+        'duplicate_key': check_duplicate_key,
+        'coordinates_outside_ireland': check_coordinates,
+    },
+    'train_movements': {
+        'pk_incomplete': check_primary_key,
+        'train_date_out_of_range': check_train_date,
+        'duplicate_key': check_duplicate_key,
+    },
+}
+
+
+def null_coordinates(df, mask, dataset):
+    """Blank the coordinates of the marked rows, leaving the rest of each row to load."""
+    df.loc[mask, list(COORDINATE_COLUMNS[dataset])] = np.nan
+    return df
+
+
+# Rules whose failing rows are kept with the offending values nulled instead of
+# quarantined: a bad GPS fix should not take a train out of the live snapshot
+REPAIRS = {
+    'coordinates_outside_ireland': null_coordinates,
+}
+
+
+### Validation ###
+
+def validate(df, dataset):
+    """
+    Run every rule for the dataset over the whole frame. Rows failing only
+    REPAIRS rules are kept, with the failing values nulled.
+
+    Returns:
+        tuple: (valid rows, failing rows with a 'rules' column, per-rule failure counts)
+    """
+    failures = {}
+    for name, check in RULES[dataset].items():
+        failures[name] = check(df, dataset)
+
+    strict = {name: mask for name, mask in failures.items() if name not in REPAIRS}
+    names = np.array(list(strict), dtype=object)
+    matrix = np.column_stack(list(strict.values())) if strict else np.zeros((len(df), 0), dtype=bool)
+    failed = matrix.any(axis=1)
+    counts = {name: int(mask.sum()) for name, mask in failures.items()}
+
+    bad = df.loc[failed].copy()
+    bad['rules'] = [','.join(names[row]) for row in matrix[failed]]
+    good = df.loc[~failed]
+    for name, repair in REPAIRS.items():
+        mask = failures.get(name, np.zeros(len(df), dtype=bool))[~failed]
+        if mask.any():
+            good = repair(good.copy(), mask, dataset)
+    return good, bad, counts
+
+
+def quarantine_rows(bad, dataset):
+    """
+    Write failing rows, with the rules they broke, to the quarantine table.
+    """
+    if bad.empty:
+        return 0
+
+    rows = json.loads(bad.drop(columns='rules').to_json(orient='records', date_format='iso'))
+    now = pd.Timestamp.now().to_pydatetime()
+    records = [{'dataset': dataset, 'rules': rules, 'quarantined_at': now, 'row_data': json.dumps(row)}
+               for rules, row in zip(bad['rules'], rows)]
+
+    with engine.begin() as conn:
+        conn.execute(text(QUARANTINE_SQL))
+        conn.execute(text('''
+            INSERT INTO quarantine_rows (dataset, rules, quarantined_at, row_data)
+            VALUES (:dataset, :rules, :quarantined_at, CAST(:row_data AS jsonb))
+        '''), records)
+    return len(records)
+
+
+def validate_stage(df, dataset, transform_seconds=None):
+    """
+    Validation stage between transform and load: returns the rows safe to load,
+    quarantines the rest and logs per-rule counts and the time spent.
+    """
+    if df.empty:
+        return df
+
+    start = time.perf_counter()
+    good, bad, counts = validate(df, dataset)
+    seconds = time.perf_counter() - start
+
+    failing = {name: count for name, count in counts.items() if count}
+    share = f", {seconds / transform_seconds * 100:.1f}% of transform time" if transform_seconds else ""
+    logger.info(f"Validated {len(df)} {dataset} rows in {seconds * 1000:.1f}ms{share}: "
+                f"{len(bad)} quarantined {failing or ''}")
+    repaired = {name: count for name, count in failing.items() if name in REPAIRS}
+    if repaired:
+        logger.warning(f"Nulled failing values in {dataset} rows instead of quarantining them: {repaired}")
+
+    if not bad.empty and get_loader().sidecars:
+        try:
+            quarantine_rows(bad, dataset)
+        except Exception as e:
+            logger.warning(f"Failed to write {len(bad)} {dataset} rows to quarantine: {e}")
+    return good
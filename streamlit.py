@@ -8,6 +8,9 @@ from streamlit_folium import st_folium
 from datetime import datetime
 import pytz
 
+from scripts import dashboard_queries
+from scripts.analytics import DELAY_BUCKET_COLOURS, bucket_labels, bucket_map_colours
+
 # ----------------------
 # Page Config & Styling
 # ----------------------
@@ -89,10 +92,10 @@ def get_engine():
             f"postgresql+psycopg2://{db['DB_USER']}:{db['DB_PASSWORD']}@{db['DB_HOST']}:{db['DB_PORT']}/{db['DB_NAME']}"
         )
 
-def run_query(query: str) -> pd.DataFrame:
+def run_query(query) -> pd.DataFrame:
     try:
         engine = get_engine()
-        return pd.read_sql(query, engine)
+        return query(engine)
     except Exception as e:
         st.error(f"Query failed: {e}")
         return pd.DataFrame()
@@ -102,64 +105,19 @@ def run_query(query: str) -> pd.DataFrame:
 # ----------------------
 @st.cache_data(ttl=60)
 def get_kpis():
-    return run_query("""
-    SELECT
-        ROUND(AVG(CASE WHEN "delay_minutes" <= 5 THEN 1 ELSE 0 END) * 100, 1) AS on_time_pct,
-        ROUND(AVG("delay_minutes"::numeric), 1) AS avg_delay,
-        COUNT(*) AS total_trains,
-        SUM(CASE WHEN "TrainStatus" = 'Cancelled' THEN 1 ELSE 0 END) AS cancelled,
-        MAX("enhanced_at") AS last_update,
-        COUNT(*) FILTER (WHERE "delay_minutes" > 30) AS severely_delayed,
-        ROUND(AVG(CASE WHEN "delay_minutes" > 0 THEN "delay_minutes" END), 1) AS avg_delay_when_delayed
-    FROM "current_trains"
-    WHERE "TrainDate" = CURRENT_DATE;
-    """)
+    return run_query(dashboard_queries.get_kpis)
 
 @st.cache_data(ttl=60)
 def get_live_trains():
-    return run_query("""
-    SELECT 
-        ct."TrainCode", ct."Direction", ct."TrainStatus",
-        ct."TrainLatitude", ct."TrainLongitude", ct."delay_minutes",
-        ct."current_location", ct."train_type", ct."PublicMessage",
-        tm."TrainOrigin", tm."TrainDestination"
-    FROM "current_trains" ct
-    LEFT JOIN (
-        SELECT DISTINCT ON ("TrainCode", "TrainDate") "TrainCode", "TrainDate", "TrainOrigin", "TrainDestination"
-        FROM "train_movements"
-        ORDER BY "TrainCode", "TrainDate", "LocationOrder"
-    ) tm ON ct."TrainCode" = tm."TrainCode" AND ct."TrainDate" = tm."TrainDate"
-    WHERE ct."TrainDate" = CURRENT_DATE
-    AND ct."TrainLatitude" IS NOT NULL AND ct."TrainLongitude" IS NOT NULL
-    ORDER BY ct."enhanced_at" DESC;
-    """)
+    return run_query(dashboard_queries.get_live_trains)
 
 @st.cache_data(ttl=300)
 def get_stations():
-    return run_query("""
-    SELECT "StationDesc","StationCode","StationType","StationLatitude","StationLongitude"
-    FROM "stations"
-    WHERE "StationLatitude" IS NOT NULL AND "StationLongitude" IS NOT NULL
-    ORDER BY "StationType", "StationDesc";
-    """)
+    return run_query(dashboard_queries.get_stations)
 
 @st.cache_data(ttl=300)
 def get_delay_distribution():
-    return run_query("""
-    SELECT delay_category, COUNT(*) as count FROM (
-        SELECT CASE 
-            WHEN COALESCE("delay_minutes", 0) <= 5 THEN 'On Time'
-            WHEN "delay_minutes" <= 15 THEN 'Minor Delay'
-            WHEN "delay_minutes" <= 30 THEN 'Major Delay'
-            ELSE 'Severe Delay' END as delay_category
-        FROM "current_trains"
-        WHERE "TrainDate" = CURRENT_DATE
-    ) categorized
-    GROUP BY delay_category
-    ORDER BY CASE delay_category
-        WHEN 'On Time' THEN 1 WHEN 'Minor Delay' THEN 2
-        WHEN 'Major Delay' THEN 3 WHEN 'Severe Delay' THEN 4 END;
-    """)
+    return run_query(dashboard_queries.get_delay_distribution)
 
 # ----------------------
 # Header
@@ -226,12 +184,7 @@ if not dist.empty:
         values="count",
         hole=0.4,
         color="delay_category",
-        color_discrete_map={
-            "On Time":"#28a745",
-            "Minor Delay":"#ffc107",
-            "Major Delay":"#fd7e14",
-            "Severe Delay":"#dc3545"
-        },
+        color_discrete_map=DELAY_BUCKET_COLOURS,
         template="plotly_white"
     )
     fig.update_layout(
@@ -250,13 +203,7 @@ trains_df = get_live_trains()
 if not trains_df.empty:
     trains_df['delay_minutes'] = trains_df['delay_minutes'].fillna(0)
 
-    def punctuality(delay):
-        if delay <= 5: return 'On Time'
-        elif delay <= 15: return 'Minor Delay'
-        elif delay <= 30: return 'Major Delay'
-        else: return 'Severe Delay'
-
-    trains_df['Punctuality'] = trains_df['delay_minutes'].apply(punctuality)
+    trains_df['Punctuality'] = bucket_labels(trains_df['delay_minutes'])
 
     display_df = trains_df[['TrainCode','TrainOrigin','TrainDestination','TrainStatus','delay_minutes','train_type','Punctuality']]
     display_df = display_df.rename(columns={
@@ -264,8 +211,7 @@ if not trains_df.empty:
         'TrainStatus':'Status','delay_minutes':'Delay (min)','train_type':'Type'
     })
 
-    color_map = {'On Time': '#28a745','Minor Delay': '#ffc107','Major Delay': '#fd7e14','Severe Delay': '#dc3545'}
-    def color_punctuality(val): return f'color: {color_map.get(val, "#333")}'
+    def color_punctuality(val): return f'color: {DELAY_BUCKET_COLOURS.get(val, "#333")}'
 
     st.dataframe(
         display_df.fillna("Unknown").style.applymap(color_punctuality, subset=['Punctuality']),
@@ -300,9 +246,11 @@ with col_map:
             color="#2E86C1", fillColor="#2E86C1", fillOpacity=0.6
         ).add_to(m)
 
+    if not trains_df.empty:
+        trains_df = trains_df.assign(marker_colour=bucket_map_colours(trains_df['delay_minutes']))
     for _, t in trains_df.iterrows():
         delay = t.get('delay_minutes', 0) or 0
-        color = 'green' if delay <= 5 else 'orange' if delay <= 15 else 'red'
+        color = t['marker_colour']
         folium.Marker(
             [t['TrainLatitude'], t['TrainLongitude']],
             popup=f"<b>{t['TrainCode']}</b><br>{t.get('TrainOrigin','?')} → {t.get('TrainDestination','?')}<br>Delay: {delay} min",
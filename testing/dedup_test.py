@@ -0,0 +1,81 @@
+# Tests for the keyed dedup that runs before load
+# run with: python -m pytest testing/dedup_test.py
+import numpy as np
+import pandas as pd
+
+from scripts.cleaning import dedupe_keys
+
+KEY = ['TrainCode', 'TrainDate', 'LocationOrder']
+
+
+# movements frame where every stop is repeated `copies` times
+def duplicated_movements(trains=50, stops=20, copies=5, seed=0):
+    rng = np.random.default_rng(seed)
+    base = pd.DataFrame({
+        'TrainCode': np.repeat([f'E{i:03d}' for i in range(trains)], stops),
+        'TrainDate': pd.Timestamp('2025-06-01'),
+        'LocationOrder': np.tile(np.arange(1, stops + 1), trains),
+    })
+    df = pd.concat([base] * copies, ignore_index=True)
+    df['fetched_at'] = pd.Timestamp('2025-06-01 08:00') + pd.to_timedelta(rng.permutation(len(df)), unit='s')
+    return df.sample(frac=1, random_state=seed).reset_index(drop=True)
+
+
+def test_drops_every_repeated_key():
+    df = duplicated_movements()
+    deduped, dropped = dedupe_keys(df, KEY, 'fetched_at')
+
+    assert len(deduped) == 50 * 20
+    assert dropped == len(df) - len(deduped)
+    assert not deduped.duplicated(subset=KEY).any()
+
+
+def test_keeps_freshest_row():
+    df = duplicated_movements()
+    deduped, _ = dedupe_keys(df, KEY, 'fetched_at')
+
+    freshest = df.groupby(KEY)['fetched_at'].max().rename('expected')
+    merged = deduped.merge(freshest, left_on=KEY, right_index=True)
+    assert (merged['fetched_at'] == merged['expected']).all()
+
+
+def test_missing_timestamp_loses():
+    df = pd.DataFrame({
+        'TrainCode': ['A1', 'A1', 'A1'],
+        'TrainDate': ['2025-06-01'] * 3,
+        'LocationOrder': [1, 1, 1],
+        'fetched_at': [pd.Timestamp('2025-06-01 08:00'), None, pd.Timestamp('2025-06-01 07:00')],
+        'value': ['new', 'none', 'old'],
+    })
+    deduped, dropped = dedupe_keys(df, KEY, 'fetched_at')
+
+    assert dropped == 2
+    assert deduped['value'].tolist() == ['new']
+
+
+def test_without_fresh_column_keeps_last_and_order():
+    df = pd.DataFrame({
+        'TrainCode': ['A1', 'B2', 'A1', 'C3', 'B2'],
+        'TrainDate': ['2025-06-01'] * 5,
+        'value': [1, 2, 3, 4, 5],
+    })
+    deduped, dropped = dedupe_keys(df, ['TrainCode', 'TrainDate'])
+
+    assert dropped == 2
+    assert deduped['value'].tolist() == [3, 4, 5]
+
+
+def test_no_duplicates_returns_frame_unchanged():
+    df = duplicated_movements(copies=1)
+    deduped, dropped = dedupe_keys(df, KEY, 'fetched_at')
+
+    assert dropped == 0
+    assert deduped is df
+
+
+def test_matches_sort_and_drop_duplicates():
+    df = duplicated_movements(trains=200, stops=30, copies=8, seed=1)
+    deduped, _ = dedupe_keys(df, KEY, 'fetched_at')
+
+    expected = df.sort_values('fetched_at').drop_duplicates(subset=KEY, keep='last')
+    assert set(deduped.index) == set(expected.index)
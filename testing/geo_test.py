@@ -0,0 +1,92 @@
+# Tests for the vectorised speed and progress geometry and the trip tracker's timing
+# run with: python -m pytest testing/geo_test.py
+import numpy as np
+import pandas as pd
+
+from scripts.geo import MIN_SEGMENT_KM, haversine_km, segment_progress, track_speeds
+from scripts.trips import TripTracker
+
+T0 = pd.Timestamp('2025-06-01 08:00')
+
+
+def point(train, minutes, lat, lon=-6.25):
+    return {'TrainCode': train, 'TrainDate': '2025-06-01', 'TrainLatitude': lat, 'TrainLongitude': lon,
+            'observed_at': T0 + pd.Timedelta(minutes=minutes)}
+
+
+def test_track_speeds_pairs_each_point_with_its_trains_previous_one():
+    # two trains interleaved and out of time order
+    points = pd.DataFrame([
+        point('E101', 2, 53.02),
+        point('E202', 0, 54.00),
+        point('E101', 0, 53.00),
+        point('E202', 1, 54.01),
+        point('E101', 1, 53.01),
+    ], index=[10, 11, 12, 13, 14])
+    speeds = track_speeds(points)
+
+    assert speeds.index.equals(points.index)
+    # first point of each train has no predecessor
+    assert np.isnan(speeds.loc[12, 'distance_km']) and np.isnan(speeds.loc[11, 'distance_km'])
+    assert speeds.loc[[14, 10, 13], 'elapsed_seconds'].tolist() == [60.0, 60.0, 60.0]
+    expected = haversine_km(53.01, -6.25, 53.02, -6.25)
+    assert np.isclose(speeds.loc[10, 'distance_km'], expected)
+    assert np.isclose(speeds.loc[10, 'speed_kmh'], expected * 60)
+
+
+def test_track_speeds_drops_impossible_jumps():
+    points = pd.DataFrame([point('E101', 0, 53.0), point('E101', 1, 54.0)])
+    speeds = track_speeds(points)
+
+    assert speeds['distance_km'].iloc[1] > 100
+    assert np.isnan(speeds['speed_kmh'].iloc[1])
+
+
+def test_segment_progress_is_clipped_to_the_segment():
+    fraction, remaining = segment_progress(
+        lat=[53.0, 53.05, 52.9, 53.2], lon=[-6.25] * 4,
+        from_lat=[53.0] * 4, from_lon=[-6.25] * 4, to_lat=[53.1] * 4, to_lon=[-6.25] * 4)
+
+    assert np.allclose(fraction, [0.0, 0.5, 0.0, 1.0])
+    assert np.isclose(remaining[1], haversine_km(53.05, -6.25, 53.1, -6.25))
+
+
+def test_segment_progress_is_nan_for_a_too_short_segment():
+    # two stops closer together than MIN_SEGMENT_KM
+    offset = MIN_SEGMENT_KM / 2 / 111.0
+    fraction, remaining = segment_progress(
+        lat=[53.0], lon=[-6.25], from_lat=[53.0], from_lon=[-6.25], to_lat=[53.0 + offset], to_lon=[-6.25])
+
+    assert np.isnan(fraction[0]) and np.isnan(remaining[0])
+
+
+def snapshot(minutes, lat):
+    return pd.DataFrame([{'TrainCode': 'E101', 'TrainDate': '2025-06-01', 'TrainLatitude': lat,
+                          'TrainLongitude': -6.25, 'collected_at': T0 + pd.Timedelta(minutes=minutes)}])
+
+
+def move(tracker, minutes, lat, commit=True):
+    speeds, positions = tracker.move(snapshot(minutes, lat))
+    if commit:
+        tracker.commit(positions=positions)
+    return speeds.iloc[0]
+
+
+def test_move_times_a_waiting_train_from_when_it_left():
+    tracker = TripTracker()
+    assert np.isnan(move(tracker, 0, 53.0))
+    # waiting at the stop: no distance, but the last seen time moves on
+    assert move(tracker, 10, 53.0) == 0
+    speed = move(tracker, 12, 53.02)
+
+    assert np.isclose(speed, haversine_km(53.0, -6.25, 53.02, -6.25) / 2 * 60)
+
+
+def test_move_keeps_positions_until_committed():
+    tracker = TripTracker()
+    move(tracker, 0, 53.0)
+    # a snapshot whose points were never stored leaves the last position alone
+    move(tracker, 5, 53.5, commit=False)
+    speed = move(tracker, 10, 53.02)
+
+    assert np.isclose(speed, haversine_km(53.0, -6.25, 53.02, -6.25) / 10 * 60)
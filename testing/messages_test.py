@@ -0,0 +1,57 @@
+# Tests for the single-pass PublicMessage parser against a golden corpus
+# run with: python -m pytest testing/messages_test.py
+import json
+import os
+
+import pandas as pd
+import pytest
+
+from scripts.helper_functions import add_extra_fields, extract_current_location, extract_delay_from_message
+from scripts.messages import MESSAGE_COLUMNS, parse_messages
+from scripts.train_types import train_type_from_message
+
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), 'data', 'public_messages.json')
+
+with open(CORPUS_PATH) as f:
+    CORPUS = json.load(f)
+
+
+@pytest.mark.parametrize('case', CORPUS, ids=[str(case['message'])[:40] for case in CORPUS])
+def test_golden_message(case):
+    parsed = parse_messages([case['message']])
+    assert parsed.iloc[0].to_dict() == case['expected']
+
+
+def test_whole_corpus_in_one_call_keeps_index():
+    messages = pd.Series([case['message'] for case in CORPUS], index=range(100, 100 + len(CORPUS)))
+    parsed = parse_messages(messages)
+
+    assert list(parsed.columns) == MESSAGE_COLUMNS
+    assert parsed.index.equals(messages.index)
+    assert parsed.to_dict('records') == [case['expected'] for case in CORPUS]
+
+
+def test_station_names_with_n():
+    # the old 'Departed ([^n]+) next stop' pattern stopped at the first "n"
+    message = 'E109\\n14:52 - Bray to Howth (0 mins late)\\nDeparted Sandymount next stop Lansdowne Road'
+    assert extract_current_location(message) == 'Sandymount'
+    assert extract_current_location('E1 Arrived Dublin Connolly') == 'Dublin Connolly'
+
+
+def test_scalar_helpers_match_parser():
+    for case in CORPUS:
+        expected = case['expected']
+        assert extract_delay_from_message(case['message']) == expected['delay_minutes']
+        if case['message']:
+            assert extract_current_location(case['message']) == expected['current_location']
+            assert train_type_from_message(case['message']) == expected['service_hint']
+
+
+def test_add_extra_fields_uses_parsed_message():
+    df = pd.DataFrame({'TrainCode': ['E109', 'A123'],
+                       'PublicMessage': [CORPUS[0]['message'], CORPUS[9]['message']]})
+    out = add_extra_fields(df)
+
+    assert out['delay_minutes'].tolist() == [0, 5]
+    assert out['current_location'].tolist() == ['Sandymount', 'Newry']
+    assert out['message_type'].tolist() == ['Unknown', 'Enterprise']
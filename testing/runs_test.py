@@ -0,0 +1,29 @@
+# Tests for run ledger slots, advisory lock keys and unloaded dataset detection
+# run with: python -m pytest testing/runs_test.py
+from datetime import datetime
+
+from scripts.runs import lock_key, slot_for, unloaded_datasets
+
+
+def test_slot_for_floors_to_the_interval_from_midnight():
+    assert slot_for(datetime(2025, 6, 1, 8, 59, 30, 123), 15) == datetime(2025, 6, 1, 8, 45)
+    assert slot_for(datetime(2025, 6, 1, 8, 45), 15) == datetime(2025, 6, 1, 8, 45)
+    # intervals that do not divide an hour still count from midnight
+    assert slot_for(datetime(2025, 6, 1, 1, 50), 70) == datetime(2025, 6, 1, 1, 10)
+    assert slot_for(datetime(2025, 6, 1, 23, 59), 1440) == datetime(2025, 6, 1)
+
+
+def test_lock_key_is_stable_and_signed_32_bit():
+    # crc32, so every process agrees on the key
+    assert lock_key('current_trains') == 1396998611
+    keys = [lock_key(name) for name in ['current_trains', 'train_movements', 'stations', 'station_boards']]
+    assert len(set(keys)) == len(keys)
+    assert all(-(1 << 31) <= key < (1 << 31) for key in keys)
+
+
+def test_unloaded_datasets():
+    datasets = ['current_trains', 'train_movements', 'stations']
+    extracted = {'current_trains': 120, 'train_movements': 0, 'stations': 170}
+    loaded = {'current_trains': 120}
+
+    assert unloaded_datasets(datasets, extracted, loaded) == ['stations']
@@ -0,0 +1,39 @@
+# Tests for station name normalisation and registry keyword matching
+# run with: python -m pytest testing/station_registry_test.py
+import pandas as pd
+
+from scripts.station_registry import StationRegistry, normalize_names
+
+STATIONS = pd.DataFrame({
+    'StationDesc': ['Dublin Connolly', 'Dún Laoghaire', 'Cork', 'Howth Junction'],
+    'StationAlias': [None, "Dun Laoghaire Mallin", None, None],
+    'StationCode': ['CNLLY', 'DLERY', 'CORK', 'HWTHJ'],
+    'StationType': ['M', 'D', 'M', 'D'],
+    'StationLatitude': [53.35, 53.29, 51.90, 53.39],
+    'StationLongitude': [-6.25, -6.13, -8.46, -6.16],
+})
+
+
+def test_normalize_names():
+    names = normalize_names(['Dún Laoghaire', "O'Connell St.", '  dublin   connolly ', '', None, '--'])
+
+    assert names.tolist() == ['DUN LAOGHAIRE', 'OCONNELL ST', 'DUBLIN CONNOLLY', None, None, None]
+
+
+def test_codes_resolve_descs_and_aliases():
+    registry = StationRegistry.from_stations(STATIONS)
+
+    codes = registry.codes(['dublin connolly', 'Dun Laoghaire Mallin', 'Nowhere', None])
+    assert codes.tolist() == ['CNLLY', 'DLERY', None, None]
+
+
+def test_matches_by_keyword_station_type_and_fallback_scan():
+    registry = StationRegistry.from_stations(STATIONS)
+    names = ['Cork', 'Dun Laoghaire Mallin', 'Howth Junction', 'Howth', 'Cork', None]
+
+    # registry names match on their desc as well as their own name
+    assert registry.matches(names, ['Laoghaire']).tolist() == [False, True, False, False, False, False]
+    # unknown names fall back to the keyword scan
+    assert registry.matches(names, ['Howth']).tolist() == [False, False, True, True, False, False]
+    # StationType letters only apply to registry stations
+    assert registry.matches(names, [], 'D').tolist() == [False, True, True, False, False, False]